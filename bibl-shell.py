@@ -14,16 +14,20 @@ this program. If not, see <http://www.gnu.org/licenses/>.
 """
 
 import argparse
+import concurrent.futures
+import hashlib
 import os
 import select
 import sys
 import traceback
 import sqlite3
 import datetime
+import time
 import subprocess
 import tempfile
 import json
 import uuid
+import zlib
 import pathlib
 import mimetypes
 import itertools
@@ -32,6 +36,11 @@ from abc import abstractmethod
 from typing import Type, Dict, List, Any, Set, Union, Optional, Callable
 from pathlib import Path
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 SHELL_BANNER = """                            bibliothecula shell 📇 📚 🏷️  🦇
        (_    ,_,    _)
        / `'--) (--'` \\      exported objects:
@@ -80,6 +89,7 @@ LONG_SHELL_BANNER = """
 #>>> local_note = j.add_file("./local_note.md") # inserts file in database
 #>>> local_note.edit(program="vim")
 #>>> local_note.save()
+#>>> db.ingest(["~/papers"], workers=4) # a document for every file in ~/papers
 """
 
 
@@ -92,6 +102,76 @@ AnyDatabaseObject = Union[
 ]
 
 
+def decompress_blob(data: bytes) -> bytes:
+    """Decompress a BinaryMetadata blob stored with the compressed flag: a zstd
+    frame or a zlib stream."""
+    if data[:4] == b"\x28\xb5\x2f\xfd":
+        if zstandard is None:
+            raise Exception(
+                "Blob is compressed with zstd but the zstandard module is not installed."
+            )
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+# (offset, magic bytes, MIME type) of file types that are common in
+# libraries and often lack a telling extension.
+MAGIC_NUMBERS = [
+    (0, b"%PDF-", "application/pdf"),
+    (30, b"mimetypeapplication/epub+zip", "application/epub+zip"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"\x1f\x8b", "application/gzip"),
+]
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+
+def sniff_mime_type(path: str, head: bytes) -> str:
+    """Guess the MIME type of a file from its first bytes, then its extension."""
+    for offset, magic, mime_type in MAGIC_NUMBERS:
+        if head[offset : offset + len(magic)] == magic:
+            return mime_type
+    guess, _encoding = mimetypes.guess_type(path)
+    return guess if guess is not None else "application/octet-stream"
+
+
+def scan_file(path: str):
+    """Hash and sniff the MIME type of a file. Runs in `Database.ingest` worker
+    processes and returns `(path, size, sha256, mime_type, error)`."""
+    try:
+        sha256 = hashlib.sha256()
+        size = 0
+        head = b""
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(SCAN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0:
+                    head = chunk[:64]
+                size += len(chunk)
+                sha256.update(chunk)
+        return (path, size, sha256.hexdigest(), sniff_mime_type(path, head), None)
+    except OSError as exc:
+        return (path, None, None, None, str(exc))
+
+
+def walk_files(paths: List[Union[str, Path]]):
+    """Yields the path of every file in `paths`, descending into directories."""
+    for path in paths:
+        path = os.path.expanduser(str(path))
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+
 def sizeof_fmt(num, suffix="B"):
     """Return formatted file size for humans
 
@@ -117,6 +197,9 @@ class Database:
         self.conn = conn
         self.verbose = verbose
         self.cur = self.conn.cursor()
+        # Databases created before the sha256 column existed don't have it.
+        self.cur.execute("PRAGMA table_info(BinaryMetadata)")
+        self.blob_digests = any(r[1] == "sha256" for r in self.cur.fetchall())
         self.created_objects: List[AnyDatabaseObject] = []
 
     @staticmethod
@@ -162,10 +245,10 @@ class Database:
                 sql = f"INSERT OR IGNORE INTO {table_name} ({columns}) VALUES ({values_placeholder})"
                 if self.verbose:
                     print(sql)
-                items = [
-                    list(map(lambda col: obj.as_dict()[col], group.COLUMNS))
-                    for obj in groups[group]
-                ]
+                items = []
+                for obj in groups[group]:
+                    d = obj.as_dict()
+                    items.append([d[col] for col in group.COLUMNS])
                 conn.executemany(sql, items)
                 if self.verbose:
                     print("Inserted ", len(groups[group]), "items of kind", group)
@@ -173,6 +256,142 @@ class Database:
         if self.verbose:
             print("Total inserted ", count, " items")
 
+    def ingest(
+        self,
+        paths: List[Union[str, Path]],
+        workers: Optional[int] = None,
+        batch_size: int = 1000,
+        reingest: bool = False,
+    ) -> Dict[str, Any]:
+        """Create a document with a stored file for every file in `paths`,
+        descending into directories. The document title is the file name
+        without its extension.
+
+        Files are hashed and their MIME types sniffed in `workers` processes
+        (default: the number of CPUs). Rows are written `batch_size` files per
+        transaction, and files already stored (same SHA-256 digest) are
+        linked instead of stored again. Files that an earlier ingest (or
+        anything else) already stored as a document's storage are skipped,
+        so that running it again over the same paths only adds new files,
+        unless `reingest` is set. Databases without the sha256 column can't
+        tell, and always add a document. Created objects are not added to
+        `created_objects`. Returns counters and the files per second."""
+        if workers is None:
+            workers = os.cpu_count() or 1
+        stats = {
+            "files": 0,
+            "stored": 0,
+            "duplicates": 0,
+            "skipped": 0,
+            "failed": 0,
+            "bytes": 0,
+        }
+        started = time.monotonic()
+        # sha256 -> uuid hex of files stored by this ingest.
+        stored: Dict[str, str] = {}
+
+        def existing_file(cur, sha256):
+            if sha256 in stored:
+                return stored[sha256]
+            if not self.blob_digests:
+                return None
+            cur.execute(
+                "SELECT uuid FROM BinaryMetadata WHERE sha256 = ? AND name NOT IN ('full-text', 'thumbnail', 'path') ORDER BY created LIMIT 1",
+                (sha256,),
+            )
+            row = cur.fetchone()
+            return None if row is None else row[0]
+
+        def has_document(cur, sha256):
+            if reingest or not self.blob_digests or sha256 in stored:
+                # Copies of a file stored by this ingest each get a document.
+                return False
+            cur.execute(
+                "SELECT 1 FROM BinaryMetadata AS m WHERE sha256 = ? AND EXISTS (SELECT 1 FROM DocumentHasBinaryMetadata AS has WHERE has.metadata_uuid = m.uuid AND has.name = 'storage') LIMIT 1",
+                (sha256,),
+            )
+            return cur.fetchone() is not None
+
+        def write_batch(batch):
+            now = datetime.datetime.now()
+            documents = []
+            links = []
+            cur = self.conn.cursor()
+            if not self.conn.in_transaction:
+                cur.execute("BEGIN")
+            try:
+                for path, size, sha256, mime_type, _error in batch:
+                    if has_document(cur, sha256):
+                        stats["skipped"] += 1
+                        continue
+                    metadata_uuid = existing_file(cur, sha256)
+                    if metadata_uuid is None:
+                        name = json.dumps(
+                            {
+                                "content_type": mime_type,
+                                "filename": os.path.basename(path),
+                                "size": size,
+                            },
+                            separators=(",", ":"),
+                        )
+                        with open(path, "rb") as f:
+                            data = f.read()
+                        metadata_uuid = uuid.uuid4().hex
+                        if self.blob_digests:
+                            cur.execute(
+                                "INSERT INTO BinaryMetadata (uuid, name, data, sha256, created, last_modified) VALUES (?, ?, ?, ?, ?, ?)",
+                                (metadata_uuid, name, data, sha256, now, now),
+                            )
+                        else:
+                            cur.execute(
+                                "INSERT INTO BinaryMetadata (uuid, name, data, created, last_modified) VALUES (?, ?, ?, ?, ?)",
+                                (metadata_uuid, name, data, now, now),
+                            )
+                        stored[sha256] = metadata_uuid
+                        stats["stored"] += 1
+                        stats["bytes"] += size
+                    else:
+                        stats["duplicates"] += 1
+                    document_uuid = uuid.uuid4().hex
+                    documents.append(
+                        (document_uuid, Path(path).stem, None, now, now)
+                    )
+                    links.append(("storage", document_uuid, metadata_uuid, now, now))
+                cur.executemany(
+                    "INSERT INTO Documents (uuid, title, title_suffix, created, last_modified) VALUES (?, ?, ?, ?, ?)",
+                    documents,
+                )
+                cur.executemany(
+                    "INSERT INTO DocumentHasBinaryMetadata (name, document_uuid, metadata_uuid, created, last_modified) VALUES (?, ?, ?, ?, ?)",
+                    links,
+                )
+                self.conn.commit()
+            except:
+                self.conn.rollback()
+                raise
+            stats["files"] += len(batch)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            batch = []
+            for result in executor.map(scan_file, walk_files(paths), chunksize=64):
+                if result[4] is not None:
+                    print(f"Could not read {result[0]}: {result[4]}", file=sys.stderr)
+                    stats["failed"] += 1
+                    continue
+                batch.append(result)
+                if len(batch) == batch_size:
+                    write_batch(batch)
+                    batch = []
+                    if self.verbose:
+                        print(f"{stats['files']} files...")
+            if batch:
+                write_batch(batch)
+        stats["seconds"] = time.monotonic() - started
+        stats["files_per_second"] = (
+            stats["files"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        )
+        return stats
+
     def __str__(self):
         return f"<Database {repr(self.name)}>"
 
@@ -233,7 +452,7 @@ class Database:
             self,
             uuid.UUID(r["uuid"]),
             r["name"],
-            r["data"],
+            decompress_blob(r["data"]) if r["compressed"] else r["data"],
             created=r["created"],
             last_modified=r["last_modified"],
         )
@@ -762,30 +981,55 @@ class Document(DbObject):
         """
         if has_name is None:
             has_name = name
+        sha256 = hashlib.sha256(data).hexdigest() if self.db.blob_digests else None
         with self.db.conn as conn:
-            m_uuid = uuid.uuid4()
             cur = conn.cursor()
-            cur.execute(
-                f"INSERT OR ABORT INTO BinaryMetadata (uuid, name, data, created, last_modified) VALUES (?, ?, ?, ?, ?)",
-                [
-                    m_uuid.hex,
-                    name,
-                    data,
-                    datetime.datetime.now(),
-                    datetime.datetime.now(),
-                ],
-            )
-            cur.execute(f"SELECT * FROM BinaryMetadata WHERE uuid = '{m_uuid.hex}'")
-            new_rows = cur.fetchall()
-            if len(new_rows) == 1:
-                new_file = self.db.convert_binary_metadata(new_rows[0])
-                self.db.created_objects.append(new_file)
-            else:
-                raise Exception(
-                    f"Insert BinaryMetadata returned {len(new_rows)} items: {[r.keys() for r in new_rows]}"
+            existing = None
+            if sha256 is not None and has_name == "storage":
+                # Files with the same contents are stored once.
+                cur.execute(
+                    "SELECT * FROM BinaryMetadata WHERE sha256 = ? AND name NOT IN ('full-text', 'thumbnail', 'path') ORDER BY created LIMIT 1",
+                    (sha256,),
                 )
+                existing = cur.fetchone()
+            if existing is not None:
+                new_file = self.db.convert_binary_metadata(existing)
+            else:
+                m_uuid = uuid.uuid4()
+                if sha256 is not None:
+                    cur.execute(
+                        f"INSERT OR ABORT INTO BinaryMetadata (uuid, name, data, sha256, created, last_modified) VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            m_uuid.hex,
+                            name,
+                            data,
+                            sha256,
+                            datetime.datetime.now(),
+                            datetime.datetime.now(),
+                        ],
+                    )
+                else:
+                    cur.execute(
+                        f"INSERT OR ABORT INTO BinaryMetadata (uuid, name, data, created, last_modified) VALUES (?, ?, ?, ?, ?)",
+                        [
+                            m_uuid.hex,
+                            name,
+                            data,
+                            datetime.datetime.now(),
+                            datetime.datetime.now(),
+                        ],
+                    )
+                cur.execute(f"SELECT * FROM BinaryMetadata WHERE uuid = '{m_uuid.hex}'")
+                new_rows = cur.fetchall()
+                if len(new_rows) == 1:
+                    new_file = self.db.convert_binary_metadata(new_rows[0])
+                    self.db.created_objects.append(new_file)
+                else:
+                    raise Exception(
+                        f"Insert BinaryMetadata returned {len(new_rows)} items: {[r.keys() for r in new_rows]}"
+                    )
             cur.execute(
-                f"INSERT OR ABORT INTO DocumentHasBinaryMetadata (name, document_uuid, metadata_uuid, created, last_modified) VALUES (?, ?, ?, ?, ?)",
+                f"INSERT OR {'IGNORE' if existing is not None else 'ABORT'} INTO DocumentHasBinaryMetadata (name, document_uuid, metadata_uuid, created, last_modified) VALUES (?, ?, ?, ?, ?)",
                 [
                     has_name,
                     self.pk().hex,
@@ -1179,9 +1423,14 @@ class BinaryMetadata(DbObject):
             [self.uuid.hex, self.name, self.data],
         )
         self.db.cur.execute(
-            f"UPDATE BinaryMetadata SET name=?, data=?, last_modified = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE uuid = '{self.uuid.hex}'",
+            f"UPDATE BinaryMetadata SET name=?, data=?, compressed=0, last_modified = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE uuid = '{self.uuid.hex}'",
             [self.name, self.data],
         )
+        if self.db.blob_digests:
+            self.db.cur.execute(
+                f"UPDATE BinaryMetadata SET sha256=? WHERE uuid = '{self.uuid.hex}'",
+                [hashlib.sha256(self.data).hexdigest()],
+            )
 
     def delete(self):
         self.db.cur.execute(
@@ -1362,6 +1611,20 @@ class Shell:
         if self.conn is not None:
             self.conn.close()
 
+    def ingest(self):
+        """Runs `Database.ingest` on the --ingest paths and reports the rate"""
+        stats = self.database.ingest(
+            self.options.ingest,
+            workers=self.options.workers,
+            reingest=self.options.reingest,
+        )
+        print(
+            f"Ingested {stats['files']} files in {stats['seconds']:.1f}s "
+            f"({stats['files_per_second']:.1f} files/s): {stats['stored']} stored "
+            f"({sizeof_fmt(stats['bytes'])}), {stats['duplicates']} already stored, "
+            f"{stats['skipped']} skipped as already ingested, {stats['failed']} failed."
+        )
+
     def run(self):
         """Runs the shell"""
         if self.options.interpreter == "python3":
@@ -1516,11 +1779,22 @@ CREATE TABLE IF NOT EXISTS "BinaryMetadata" (
         "name" TEXT NULL,
         "data" BLOB NOT NULL,
         "compressed" BOOLEAN NOT NULL DEFAULT (0),
+        "sha256" CHARACTER(64) NULL,
         "created" DATETIME NOT NULL DEFAULT (strftime ('%Y-%m-%d %H:%M:%f', 'now')),
         "last_modified" DATETIME NOT NULL DEFAULT (strftime ('%Y-%m-%d %H:%M:%f', 'now')),
         CONSTRAINT uniqueness UNIQUE ("name", "data")
 );
 
+CREATE INDEX IF NOT EXISTS binary_metadata_sha256_idx
+    ON BinaryMetadata(sha256);
+
+CREATE TRIGGER IF NOT EXISTS binary_metadata_sha256_reset
+AFTER UPDATE OF data ON BinaryMetadata
+WHEN NEW.sha256 IS NOT NULL AND NEW.sha256 IS OLD.sha256 AND NEW.data IS NOT OLD.data
+BEGIN
+  UPDATE BinaryMetadata SET sha256 = NULL WHERE uuid = NEW.uuid;
+END;
+
 CREATE TABLE IF NOT EXISTS "DocumentHasTextMetadata" (
         "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
         "name" TEXT NOT NULL,
@@ -1545,7 +1819,7 @@ CREATE TABLE IF NOT EXISTS "DocumentHasBinaryMetadata" (
         CONSTRAINT uniqueness UNIQUE ("name", "document_uuid", "metadata_uuid")
 );
 
-CREATE VIEW document_title_authors (rowid, title, authors) AS
+CREATE VIEW IF NOT EXISTS document_title_authors (rowid, title, authors) AS
 SELECT uuid, title, authors
 FROM
     Documents AS d
@@ -1560,43 +1834,319 @@ FROM
         GROUP BY
             document_uuid) AS authors ON d.uuid = authors.document_uuid;
 
-CREATE VIRTUAL TABLE IF NOT EXISTS document_title_authors_text_view_fts
-    USING fts5(title, authors, full_text, uuid UNINDEXED);
+CREATE INDEX IF NOT EXISTS has_text_document_uuid_idx
+    ON DocumentHasTextMetadata(document_uuid);
 
-CREATE TRIGGER insert_full_text_trigger
-    AFTER INSERT ON DocumentHasBinaryMetadata
-WHEN EXISTS (
-        SELECT
-            *
+CREATE INDEX IF NOT EXISTS has_text_metadata_uuid_idx
+    ON DocumentHasTextMetadata(metadata_uuid);
+
+CREATE INDEX IF NOT EXISTS has_binary_document_uuid_idx
+    ON DocumentHasBinaryMetadata(document_uuid);
+
+CREATE INDEX IF NOT EXISTS has_binary_metadata_uuid_idx
+    ON DocumentHasBinaryMetadata(metadata_uuid);
+
+CREATE VIEW IF NOT EXISTS document_title_authors_text_view (id, uuid, title, authors, full_text) AS
+SELECT
+    has.id, has.document_uuid, d.title,
+    (SELECT
+            GROUP_CONCAT (tm.data, '\0')
         FROM
-            BinaryMetadata AS bm
+            DocumentHasTextMetadata AS dhtm
+            JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
         WHERE
-            NEW.metadata_uuid = bm.uuid
-            AND bm.name = 'full-text')
-BEGIN
-    INSERT INTO document_title_authors_text_view_fts (
-        uuid, title, authors, full_text)
-SELECT
-    d.rowid AS rowid, d.title AS title,
-    d.authors AS authors, bm.data AS full_text
+            dhtm.document_uuid = has.document_uuid
+            AND tm.name = 'author'),
+    bm.data
 FROM
-    document_title_authors AS d,
-    BinaryMetadata AS bm
+    DocumentHasBinaryMetadata AS has
+    JOIN Documents AS d ON d.uuid = has.document_uuid
+    JOIN BinaryMetadata AS bm ON bm.uuid = has.metadata_uuid
 WHERE
-    d.rowid = NEW.document_uuid
+    has.name = 'full-text'
     AND bm.name = 'full-text'
-    AND bm.uuid = NEW.metadata_uuid;
+    AND NOT bm.compressed;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS document_title_authors_text_view_fts
+    USING fts5(title, authors, full_text, uuid UNINDEXED,
+        content='document_title_authors_text_view', content_rowid='id',
+        prefix='2 3');
+
+CREATE TRIGGER IF NOT EXISTS insert_full_text_trigger
+    AFTER INSERT ON DocumentHasBinaryMetadata
+    WHEN NEW.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        id = NEW.id;
 END;
 
 CREATE TRIGGER IF NOT EXISTS delete_full_text_trigger
-       AFTER DELETE ON DocumentHasBinaryMetadata
-        WHEN OLD.name = 'full-text'
-       BEGIN
-       DELETE FROM document_title_authors_text_view_fts
-       WHERE uuid = OLD.document_uuid;
+    BEFORE DELETE ON DocumentHasBinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS delete_document_full_text_trigger
+    BEFORE DELETE ON Documents
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = OLD.uuid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS delete_metadata_full_text_trigger
+    BEFORE DELETE ON BinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = OLD.uuid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS update_full_text_before_trigger
+    BEFORE UPDATE OF name, data, compressed ON BinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = OLD.uuid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS update_full_text_after_trigger
+    AFTER UPDATE OF name, data, compressed ON BinaryMetadata
+    WHEN NEW.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = NEW.uuid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS update_title_full_text_trigger
+    AFTER UPDATE OF title ON Documents
+    WHEN NEW.title IS NOT OLD.title
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, OLD.title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.uuid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS insert_author_full_text_trigger
+    AFTER INSERT ON DocumentHasTextMetadata
+    WHEN (SELECT name FROM TextMetadata WHERE uuid = NEW.metadata_uuid) = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND dhtm.id <> NEW.id),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid = NEW.document_uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.document_uuid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS delete_author_full_text_trigger
+    BEFORE DELETE ON DocumentHasTextMetadata
+    WHEN (SELECT name FROM TextMetadata WHERE uuid = OLD.metadata_uuid) = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = OLD.document_uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND dhtm.id <> OLD.id),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid = OLD.document_uuid;
 END;
 
+CREATE TRIGGER IF NOT EXISTS update_author_full_text_before_trigger
+    BEFORE UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+    WHEN (NEW.document_uuid IS NOT OLD.document_uuid
+            OR NEW.metadata_uuid IS NOT OLD.metadata_uuid)
+        AND 'author' IN (SELECT name FROM TextMetadata
+            WHERE uuid IN (OLD.metadata_uuid, NEW.metadata_uuid))
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (OLD.document_uuid, NEW.document_uuid);
+END;
 
+CREATE TRIGGER IF NOT EXISTS update_author_full_text_after_trigger
+    AFTER UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+    WHEN (NEW.document_uuid IS NOT OLD.document_uuid
+            OR NEW.metadata_uuid IS NOT OLD.metadata_uuid)
+        AND 'author' IN (SELECT name FROM TextMetadata
+            WHERE uuid IN (OLD.metadata_uuid, NEW.metadata_uuid))
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (OLD.document_uuid, NEW.document_uuid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS update_author_metadata_full_text_trigger
+    AFTER UPDATE OF name, data ON TextMetadata
+    WHEN (NEW.name IS NOT OLD.name OR NEW.data IS NOT OLD.data)
+        AND 'author' IN (OLD.name, NEW.name)
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (
+                    CASE WHEN tm.uuid = OLD.uuid THEN OLD.data ELSE tm.data END,
+                    '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND CASE WHEN tm.uuid = OLD.uuid THEN OLD.name ELSE tm.name END = 'author'),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = NEW.uuid);
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = NEW.uuid);
+END;
+
+CREATE TRIGGER IF NOT EXISTS delete_author_metadata_full_text_trigger
+    BEFORE DELETE ON TextMetadata
+    WHEN OLD.name = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = OLD.uuid);
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND tm.uuid <> OLD.uuid),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = OLD.uuid);
+END;
 
 CREATE VIRTUAL TABLE backrefs_fts USING fts5(referrer, target);
 
@@ -1842,6 +2392,23 @@ if __name__ == "__main__":
         action="store_true",
         help="Create database with given filename. Filename must not already exist.",
     )
+    parser.add_argument(
+        "--ingest",
+        nargs="+",
+        metavar="PATH",
+        help="Add a document for every file in PATH (descending into directories) and exit instead of starting a shell.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes that hash files with --ingest. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--reingest",
+        action="store_true",
+        help="With --ingest, also add a document for files already stored as a document's file.",
+    )
     args = parser.parse_args()
     path = Path(args.db_name)
     if path.is_dir():
@@ -1855,4 +2422,7 @@ if __name__ == "__main__":
             f"{path} already exists and you have specified --create-db."
         )
     with Shell(args) as shell:
-        shell.run()
+        if args.ingest:
+            shell.ingest()
+        else:
+            shell.run()
@@ -1,7 +1,8 @@
 default_app_config = "bibliothecula.apps.BibliotheculaAppConfig"
 
 FTS_NAME = "document_title_authors_text_view_fts"
-FTS_CONTENT_NAME = FTS_NAME + "_content"
+FTS_CONTENT_NAME = "document_title_authors_text_view"
+TRIGRAM_NAME = "metadata_trigram_fts"
 
 # Some metadata names:
 FULL_TEXT_NAME = "full-text"
@@ -14,3 +15,6 @@ TYPE_NAME = "type"
 DATE_NAME = "date"
 STORAGE_NAME = "storage"
 URL_NAME = "url"
+# Thumbnail colours used to be stored as text metadata with this name, until
+# the schema is upgraded from the database page, see `models.upgrade_schema`.
+THUMBNAIL_COLOR_NAME = "thumbnail-color"
@@ -1,4 +1,5 @@
 from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.utils.translation import ngettext
 from django.forms import Textarea
 from .models import *
@@ -92,34 +93,73 @@ index_documents.short_description = "Index a document's full text"
 
 
 def add_missing_thumbnail(modeladmin, request, queryset):
-    l = list(queryset)
-    created = 0
-    for doc in l:
-        try:
-            if doc.create_thumbnail(force=False):
-                created += 1
-        except Exception as exc:
+    from .background_tasks import TaskManager
+
+    try:
+        queued = TaskManager().create_thumbnails(queryset, force=False)
+    except Exception as exc:
+        modeladmin.message_user(
+            request, f"Could not schedule background tasks: {exc}", messages.ERROR
+        )
+        return
+    if queued == 0:
+        modeladmin.message_user(
+            request, "All selected documents have thumbnails.", messages.INFO
+        )
+    else:
+        modeladmin.message_user(
+            request,
+            ngettext(
+                "Queued %d thumbnail job.",
+                "Queued %d thumbnail jobs.",
+                queued,
+            )
+            % queued,
+            messages.SUCCESS,
+        )
+
+
+add_missing_thumbnail.short_description = "Add thumbnail if missing"
+
+
+def add_missing_thumbnail_color(modeladmin, request, queryset):
+    links = DocumentHasBinaryMetadata.objects.filter(
+        document__in=queryset,
+        name=THUMBNAIL_NAME,
+        metadata__thumbnail_color__isnull=True,
+    ).select_related("document", "metadata")
+    added = 0
+    for has in links:
+        color = average_color(has.metadata.data)
+        if color is None:
             modeladmin.message_user(
                 request,
-                f"Could not create thumbnail for {doc.title}: {exc}",
+                f"Could not compute thumbnail colour for {has.document.title}.",
                 messages.ERROR,
             )
-    if created == 0:
-        modeladmin.message_user(request, "No thumbnails were created.", messages.INFO)
+            continue
+        ThumbnailColor.objects.update_or_create(
+            metadata=has.metadata, defaults={"color": color}
+        )
+        added += 1
+    if added == 0:
+        modeladmin.message_user(
+            request, "No thumbnail colours were added.", messages.INFO
+        )
     else:
         modeladmin.message_user(
             request,
             ngettext(
-                "%d thumbnail was generated.",
-                "%d thumbnails were generated.",
-                created,
+                "%d thumbnail colour was added.",
+                "%d thumbnail colours were added.",
+                added,
             )
-            % created,
+            % added,
             messages.SUCCESS,
         )
 
 
-add_missing_thumbnail.short_description = "Add thumbnail if missing"
+add_missing_thumbnail_color.short_description = "Add thumbnail colour if missing"
 
 
 def merge_documents(modeladmin, request, queryset):
@@ -214,27 +254,63 @@ class DupFilter(admin.SimpleListFilter):
         return queryset.filter(title=self.value())
 
 
+class DocumentChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        self.result_list = load_document_summaries(self.result_list)
+
+
 class DocumentAdmin(admin.ModelAdmin):
     save_on_top = True
     inlines = [TextMetadataInline, BinaryMetadataInline]
     list_display = (
         "title",
-        "authors",
+        "summary_authors",
         "doi",
-        "tags",
+        "summary_tags",
         "total_metadata",
         "uuid",
         "has_duplicates",
-        "has_thumbnail",
-        "file_format_list",
+        "summary_has_thumbnail",
+        "summary_formats",
         "created",
         "last_modified",
     )
+
+    def get_changelist(self, request, **kwargs):
+        return DocumentChangeList
+
+    def summary_authors(self, obj):
+        return obj.summary.authors_str()
+
+    summary_authors.short_description = "authors"
+
+    def summary_tags(self, obj):
+        return obj.summary.tags_str()
+
+    summary_tags.short_description = "tags"
+
+    def summary_has_thumbnail(self, obj):
+        return obj.summary.thumbnail_uuid is not None
+
+    summary_has_thumbnail.short_description = "has thumbnail"
+    summary_has_thumbnail.boolean = True
+
+    def summary_formats(self, obj):
+        return obj.summary.formats_str()
+
+    summary_formats.short_description = "file format list"
+
     # list_filter = (TagFilter,)
     list_filter = ("text_metadata__metadata__data",)
     search_fields = ("title",)
     ordering = ("title", "created", "last_modified")
-    actions = [add_missing_thumbnail, merge_documents, index_documents]
+    actions = [
+        add_missing_thumbnail,
+        add_missing_thumbnail_color,
+        merge_documents,
+        index_documents,
+    ]
     list_per_page = 500
 
     class Media:
@@ -320,6 +396,28 @@ def convertmime(modeladmin, request, queryset):
 convertmime.short_description = "Convert mime"
 
 
+def convert_thumbnails(modeladmin, request, queryset):
+    converted = convert_data_url_thumbnails(queryset)
+    if converted == 0:
+        modeladmin.message_user(
+            request, "No data URL thumbnails were found.", messages.INFO
+        )
+    else:
+        modeladmin.message_user(
+            request,
+            ngettext(
+                "%d thumbnail was converted to WebP.",
+                "%d thumbnails were converted to WebP.",
+                converted,
+            )
+            % converted,
+            messages.SUCCESS,
+        )
+
+
+convert_thumbnails.short_description = "Convert data URL thumbnails to WebP"
+
+
 class BinaryMetadataAdmin(admin.ModelAdmin):
     save_on_top = True
     inlines = [BinaryMetadataInlineB]
@@ -334,7 +432,7 @@ class BinaryMetadataAdmin(admin.ModelAdmin):
     list_filter = ("documents",)
     search_fields = ("name",)
     ordering = ("name", "created", "last_modified")
-    actions = [convertmime]
+    actions = [convertmime, convert_thumbnails]
     list_per_page = 500
 
     class Media:
@@ -343,8 +441,26 @@ class BinaryMetadataAdmin(admin.ModelAdmin):
         }
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "document",
+        "kind",
+        "state",
+        "attempts",
+        "last_error",
+        "started",
+        "finished",
+        "owner",
+        "heartbeat",
+    )
+    list_filter = ("kind", "state")
+    raw_id_fields = ("document",)
+    ordering = ("-id",)
+
+
 admin.site.register(Document, DocumentAdmin)
 admin.site.register(TextMetadata, TextMetadataAdmin)
 admin.site.register(BinaryMetadata, BinaryMetadataAdmin)
 admin.site.register(DocumentHasTextMetadata)
 admin.site.register(DocumentHasBinaryMetadata, DocumentHasBinaryAdmin)
+admin.site.register(Job, JobAdmin)
@@ -1,18 +1,41 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 import multiprocessing
 import concurrent.futures
 import atexit
+import os
 from .background_tasks import TaskManager
 
 
 class BibliotheculaAppConfig(AppConfig):
     MAX_WORKERS = 5
+    EXTRACT_WORKERS = os.cpu_count() or 1
     name = "bibliothecula"
     verbose_name = "bibliothecula"
 
     def ready(self):
+        connection_created.connect(prepare_connection)
         self.tasks = concurrent.futures.ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+        # Worker processes are started on first use. "spawn" avoids forking
+        # the server with its threads and open database connections.
+        self.extractors = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
         self.manager = multiprocessing.Manager()
         self.workers_ns = self.manager.Namespace()
         self.workers_ns.kill_workers = False
         self.workers_ns.active_tasks = 0
+        self.workers_ns.progress = None
+
+
+def prepare_connection(sender, connection, **kwargs):
+    if connection.alias != "bibliothecula":
+        return
+    from .compression import decompress
+
+    # For ad hoc SQL on compressed blobs, e.g.
+    # SELECT bibl_decompress(data) FROM BinaryMetadata WHERE compressed
+    connection.connection.create_function(
+        "bibl_decompress", 1, decompress, deterministic=True
+    )
@@ -1,73 +1,475 @@
-from django.db import connections, close_old_connections
+from django.db import connections, close_old_connections, OperationalError
 from django.db.utils import DEFAULT_DB_ALIAS, load_backend
 from django.apps import apps as django_apps
-from django.core.paginator import Paginator
 
+import concurrent.futures
 import multiprocessing
+import os
+import tempfile
+import time
 from importlib import import_module
 from django.conf import settings
 
+from . import FULL_TEXT_NAME, THUMBNAIL_NAME
+from .text_extract import (
+    extract_document_text,
+    get_pdf_pages_text,
+    pdf_page_chunks,
+    pdf_page_count,
+)
+from .thumbnail_batch import render_thumbnail
 
-class TaskManager:
-    def __init__(self):
-        pass
+# Seconds to wait for a queued job that isn't due yet before checking again
+# whether the workers should stop.
+IDLE_POLL_INTERVAL = 5
+THUMBNAIL_TIMEOUT = 120
 
-    def index_document(self, document_uuid=None, force=False):
-        def index_fn(workers_ns, documents, total, force=False):
-            ctr = 0
-            for doc in documents:
-                if workers_ns.kill_workers:
+
+def extract_text_job(job):
+    """Runs in an extraction worker process. Returns `(document_uuid, text)`."""
+    document_uuid, kind, path, blob = job
+    return (document_uuid, extract_document_text(kind, path, blob))
+
+
+def extract_pdf_pages_job(job):
+    """Runs in an extraction worker process. Returns `[(page, text)]`."""
+    path, pages = job
+    return get_pdf_pages_text(path, pages)
+
+
+class PdfTextJob:
+    """An index job of a PDF, split in one future per range of pages that
+    isn't already in the `pdf_page_text` table."""
+
+    def __init__(self, metadata_uuid, path, blob):
+        self.metadata_uuid = metadata_uuid
+        self.temp_path = None
+        if blob is not None:
+            # Workers open the file themselves instead of each receiving a
+            # copy of the blob.
+            fd, self.temp_path = tempfile.mkstemp(
+                prefix="bibliothecula-", suffix=".pdf"
+            )
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            path = self.temp_path
+        self.path = path
+        self.pending = 0
+        self.error = None
+
+    def submit(self, extractors):
+        from .models import cached_pdf_pages
+
+        chunks = pdf_page_chunks(
+            pdf_page_count(self.path), cached_pdf_pages(self.metadata_uuid)
+        )
+        self.pending = len(chunks)
+        return [
+            extractors.submit(extract_pdf_pages_job, (self.path, pages))
+            for pages in chunks
+        ]
+
+    def cleanup(self):
+        if self.temp_path is not None:
+            try:
+                os.remove(self.temp_path)
+            except FileNotFoundError:
+                pass
+            self.temp_path = None
+
+
+def submit_job(extractors, kind, doc):
+    """Submit the work of a `kind` job to the process pool. Returns
+    `(futures, pdf_job)`, where `pdf_job` is a `PdfTextJob` if the job was
+    split by pages, or `None` if the document has no file to work on."""
+    if kind == "index":
+        source = next(doc.text_sources(), None)
+        if source is None:
+            return None
+        metadata_uuid, source_kind, path, blob = source
+        if source_kind == "pdf":
+            pdf_job = PdfTextJob(metadata_uuid, path, blob)
+            try:
+                return (pdf_job.submit(extractors), pdf_job)
+            except Exception:
+                pdf_job.cleanup()
+                raise
+        future = extractors.submit(
+            extract_text_job, (doc.uuid, source_kind, path, blob)
+        )
+        return ([future], None)
+    elif kind == "thumbnail":
+        source = next(doc.thumbnail_sources(), None)
+        if source is None:
+            return None
+        future = extractors.submit(
+            render_thumbnail, (doc.uuid, *source, THUMBNAIL_TIMEOUT)
+        )
+        return ([future], None)
+    raise ValueError(f"Unknown job kind {kind}")
+
+
+def save_job_result(kind, doc, result):
+    """Store the result of a job in the database. Returns `(error, size)`
+    where `error` is a message if there was nothing to store and `size` is
+    the number of bytes stored."""
+    if kind == "index":
+        _uuid, text = result
+        if not doc.save_full_text(text):
+            return ("No text could be extracted.", 0)
+        return (None, len(text.encode("utf-8")))
+    elif kind == "thumbnail":
+        _uuid, data, error, color = result
+        if data is None:
+            return (error, 0)
+        doc.save_thumbnail(data, color)
+        return (None, len(data))
+    raise ValueError(f"Unknown job kind {kind}")
+
+
+def save_pdf_job_result(doc, pdf_job):
+    """Store the text of a PDF once all its pages are extracted. Returns
+    `(error, size)` like `save_job_result`."""
+    from .models import cached_pdf_text, clear_pdf_page_text
+
+    if pdf_job.error is not None:
+        # The pages extracted so far are kept and not extracted again when
+        # the job is retried.
+        return (pdf_job.error, 0)
+    text = cached_pdf_text(pdf_job.metadata_uuid)
+    if not doc.save_full_text(text):
+        return ("No text could be extracted.", 0)
+    # The pages were only kept to resume an interrupted extraction.
+    clear_pdf_page_text([pdf_job.metadata_uuid])
+    return (None, len(text.encode("utf-8")))
+
+
+def new_progress():
+    from .models import JOB_KINDS
+
+    return {
+        "started": time.time(),
+        "finished": None,
+        "kinds": {kind: {"done": 0, "failed": 0, "bytes": 0} for kind in JOB_KINDS},
+        "merge": {"steps": 0, "segments_before": None, "segments_after": None},
+    }
+
+
+def record_progress(workers_ns, kind, failed=False, size=0):
+    # Manager namespaces return copies, so the whole dict is reassigned.
+    progress = workers_ns.progress
+    counters = progress["kinds"][kind]
+    if failed:
+        counters["failed"] += 1
+    else:
+        counters["done"] += 1
+        counters["bytes"] += size
+    workers_ns.progress = progress
+
+
+def full_text_index_segment_count():
+    from .models import full_text_index_segments
+
+    try:
+        with connections["bibliothecula"].cursor() as cursor:
+            structure = full_text_index_segments(cursor)
+    except OperationalError:
+        # No full-text search index.
+        return None
+    return None if structure is None else structure[1]
+
+
+def merge_step(workers_ns):
+    """Run one incremental merge of the full-text search index and record it
+    in the progress. Returns whether there was anything to merge."""
+    from .models import merge_full_text_index
+
+    progress = workers_ns.progress
+    merge = progress["merge"]
+    if merge["segments_before"] is None:
+        merge["segments_before"] = full_text_index_segment_count()
+    try:
+        merged = merge_full_text_index()
+    except OperationalError as exc:
+        # The index doesn't exist or the database is locked.
+        print(f"exc: {exc} while merging the full-text search index")
+        merged = False
+    if merged:
+        merge["steps"] += 1
+    merge["segments_after"] = full_text_index_segment_count()
+    workers_ns.progress = progress
+    return merged
+
+
+def run_jobs(workers_ns, extractors, max_in_flight):
+    """Claim queued jobs from the `jobs` table and run them until the queue
+    is empty or the workers are told to stop.
+
+    The work itself happens in the `extractors` process pool; this thread
+    only claims jobs and writes their results, so there is a single writer
+    to the database. PDFs are indexed a range of pages per future (see
+    `PdfTextJob`), so one big file is spread over all the workers and the
+    pages extracted before a stop or a failure aren't extracted again.
+
+    After each batch of results that added full text, the full-text search
+    index is merged a little (see `models.merge_full_text_index`), and once
+    the queue is empty it is merged until there is nothing left to merge.
+    This keeps it compact without `optimize`, which rewrites all of it."""
+    from .models import (
+        JOB_HEARTBEAT_INTERVAL,
+        JOB_KINDS,
+        Document,
+        cache_pdf_pages,
+        claim_job,
+        configure_full_text_index,
+        fail_job,
+        finish_job,
+        heartbeat_jobs,
+        requeue_running_jobs,
+        seconds_until_next_job,
+    )
+
+    indexed = False
+
+    def complete(job_id, attempts, kind, error, size=0):
+        nonlocal indexed
+        if error is None:
+            finish_job(job_id)
+            record_progress(workers_ns, kind, size=size)
+            indexed |= kind == "index"
+        else:
+            fail_job(job_id, attempts, error)
+            record_progress(workers_ns, kind, failed=True)
+
+    in_flight = {}
+    pdf_jobs = []
+    last_heartbeat = time.monotonic()
+    try:
+        try:
+            with connections["bibliothecula"].cursor() as cursor:
+                configure_full_text_index(cursor)
+        except OperationalError:
+            # No full-text search index.
+            pass
+        while not workers_ns.kill_workers:
+            if time.monotonic() - last_heartbeat >= JOB_HEARTBEAT_INTERVAL:
+                # Other processes requeue running jobs without a recent
+                # heartbeat.
+                try:
+                    heartbeat_jobs()
+                    last_heartbeat = time.monotonic()
+                except OperationalError:
+                    # The database is locked, try again on the next round.
+                    pass
+            claimed = True
+            while claimed and len(in_flight) < max_in_flight:
+                claimed = False
+                for kind in JOB_KINDS:
+                    job = claim_job(kind)
+                    if job is None:
+                        continue
+                    claimed = True
+                    job_id, document_uuid, attempts = job
+                    doc = Document.objects.filter(uuid=document_uuid).first()
+                    if doc is None:
+                        fail_job(job_id, attempts, "Document was deleted.", retry=False)
+                        record_progress(workers_ns, kind, failed=True)
+                        continue
+                    try:
+                        submitted = submit_job(extractors, kind, doc)
+                    except Exception as exc:
+                        fail_job(job_id, attempts, str(exc))
+                        record_progress(workers_ns, kind, failed=True)
+                        continue
+                    if submitted is None:
+                        fail_job(job_id, attempts, "No suitable file.", retry=False)
+                        record_progress(workers_ns, kind, failed=True)
+                        continue
+                    futures, pdf_job = submitted
+                    if pdf_job is not None:
+                        pdf_jobs.append(pdf_job)
+                        if not futures:
+                            # Every page was extracted by an earlier attempt.
+                            pdf_job.cleanup()
+                            pdf_jobs.remove(pdf_job)
+                            complete(
+                                job_id, attempts, kind, *save_pdf_job_result(doc, pdf_job)
+                            )
+                    for future in futures:
+                        in_flight[future] = (job_id, attempts, kind, doc, pdf_job)
+            if not in_flight:
+                wait = seconds_until_next_job()
+                if wait is None:
                     break
-                retries = 0
-                while retries < 5:
+                # Failed jobs are waiting for their backoff to pass.
+                time.sleep(min(wait, IDLE_POLL_INTERVAL))
+                continue
+            done, _ = concurrent.futures.wait(
+                in_flight.keys(),
+                timeout=IDLE_POLL_INTERVAL,
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            for future in done:
+                job_id, attempts, kind, doc, pdf_job = in_flight.pop(future)
+                try:
+                    if pdf_job is None:
+                        complete(
+                            job_id, attempts, kind, *save_job_result(kind, doc, future.result())
+                        )
+                        continue
+                    pdf_job.pending -= 1
                     try:
-                        ret = doc.index_text(force=force)
-                        print("finished ", doc, " with", ret)
-                        break
-                    except OperationalError as exc:
-                        print("locked: ", exc, "?", retries)
-                        # Database might be locked from other task workers
-                        retries += 1
+                        cache_pdf_pages(pdf_job.metadata_uuid, future.result())
                     except Exception as exc:
-                        print(f"exc: {exc} for doc {doc}")
-                        break
-                ctr += 1
-                # print(f"Done {ctr}/{total}")
+                        if pdf_job.error is None:
+                            pdf_job.error = str(exc)
+                    if pdf_job.pending > 0:
+                        continue
+                    pdf_job.cleanup()
+                    pdf_jobs.remove(pdf_job)
+                    complete(job_id, attempts, kind, *save_pdf_job_result(doc, pdf_job))
+                except Exception as exc:
+                    # Includes OperationalError if the database is locked;
+                    # the job will be retried later.
+                    print(f"exc: {exc} for {kind} {doc}")
+                    record_progress(workers_ns, kind, failed=True)
+                    try:
+                        fail_job(job_id, attempts, str(exc))
+                    except OperationalError:
+                        pass
+            if indexed:
+                indexed = False
+                merge_step(workers_ns)
+        while not workers_ns.kill_workers and merge_step(workers_ns):
+            pass
+    finally:
+        for future in in_flight:
+            future.cancel()
+        for pdf_job in pdf_jobs:
+            pdf_job.cleanup()
+        try:
+            # Jobs left running by this loop are resumed on the next start,
+            # in this process or another.
+            requeue_running_jobs()
+        finally:
             close_old_connections()
+            progress = workers_ns.progress
+            progress["finished"] = time.time()
+            workers_ns.progress = progress
             workers_ns.active_tasks -= 1
-            return 0
+    return 0
 
-        config = django_apps.get_app_config("bibliothecula")
-        active_tasks = config.workers_ns.active_tasks
-        if active_tasks > 0:
-            raise RuntimeError(f"{active_tasks} tasks are already running.")
-        config.workers_ns.kill_workers = False
-        from .models import Document
 
-        all_docs = Document.objects.all()
-        if document_uuid is None:
-            docs_per_worker, rem_docs = divmod(all_docs.count(), config.MAX_WORKERS)
-            paginator = Paginator(all_docs, docs_per_worker, orphans=rem_docs)
-            print("Will schedule", paginator.num_pages, "tasks.")
-            for idx in range(0, paginator.num_pages):
-                page = paginator.get_page(idx)
-                config.tasks.submit(
-                    index_fn, config.workers_ns, page, docs_per_worker, force
-                )
-                config.workers_ns.active_tasks += 1
-            return paginator.num_pages
-        else:
-            doc = all_docs.get(uuid=document_uuid)
+def task_progress(workers_ns):
+    """Returns the progress of the current (or last) run of the worker loop:
+    per kind counters, throughput and an estimate of the remaining time."""
+    from .models import job_stats
+
+    progress = workers_ns.progress or new_progress()
+    stats = job_stats()
+    elapsed = (progress["finished"] or time.time()) - progress["started"]
+    kinds = {}
+    for kind, queue in (stats["kinds"] if stats else {}).items():
+        counters = progress["kinds"].get(kind, {"done": 0, "failed": 0, "bytes": 0})
+        remaining = queue["queued"] + queue["running"]
+        processed = counters["done"] + counters["failed"]
+        per_second = processed / elapsed if elapsed > 0 else 0.0
+        kinds[kind] = {
+            **counters,
+            "remaining": remaining,
+            "total": processed + remaining,
+            "per_second": per_second,
+            "eta_seconds": remaining / per_second if per_second > 0 else None,
+        }
+    return {
+        "active_tasks": workers_ns.active_tasks,
+        "elapsed_seconds": elapsed,
+        "kinds": kinds,
+        "merge": progress["merge"],
+    }
+
+
+class TaskManager:
+    def __init__(self):
+        pass
+
+    def index_document(self, document_uuid=None, force=False):
+        """Queue full-text indexing jobs and start the workers. Returns the
+        number of queued jobs."""
+        from .models import Document, DocumentHasBinaryMetadata, clear_pdf_page_text
+
+        documents = Document.objects.all()
+        if document_uuid is not None:
+            doc = documents.get(uuid=document_uuid)
             # Prev line raised exception if it doesn't exist
-            config.tasks.submit(
-                index_fn,
-                config.workers_ns,
-                all_docs.filter(uuid=document_uuid),
-                1,
-                force,
+            documents = documents.filter(uuid=document_uuid)
+        if not force:
+            documents = documents.exclude(
+                binary_metadata__metadata__name=FULL_TEXT_NAME
+            ).distinct()
+        else:
+            clear_pdf_page_text(
+                DocumentHasBinaryMetadata.objects.filter(
+                    document__in=documents
+                ).values_list("metadata_id", flat=True)
             )
-            config.workers_ns.active_tasks += 1
-            return 1
+        return self.enqueue("index", documents)
+
+    def create_thumbnails(self, documents=None, force=False):
+        """Queue thumbnail jobs for `documents`, or for all documents, and
+        start the workers. Returns the number of queued jobs."""
+        from .models import Document
+
+        if documents is None:
+            documents = Document.objects.all()
+        if not force:
+            documents = documents.exclude(
+                binary_metadata__metadata__name=THUMBNAIL_NAME
+            ).distinct()
+        return self.enqueue("thumbnail", documents)
+
+    def enqueue(self, kind, documents):
+        from .models import enqueue_jobs
+
+        queued = enqueue_jobs(kind, documents)
+        self.start()
+        return queued
+
+    def start(self):
+        """Start the worker loop unless it is already running. Queued jobs,
+        including those left over from a previous run, are picked up."""
+        from .models import requeue_running_jobs
+
+        config = django_apps.get_app_config("bibliothecula")
+        if config.workers_ns.active_tasks > 0:
+            # The running loop claims newly queued jobs as well.
+            return False
+        config.workers_ns.kill_workers = False
+        # Nothing is running in this process, so its running jobs were
+        # interrupted; so were the jobs of a dead process, once their
+        # heartbeat is stale.
+        requeue_running_jobs()
+        config.workers_ns.progress = new_progress()
+        config.workers_ns.active_tasks += 1
+        config.tasks.submit(
+            run_jobs,
+            config.workers_ns,
+            config.extractors,
+            # Keep every worker busy without reading the whole library into
+            # memory.
+            2 * config.EXTRACT_WORKERS,
+        )
+        return True
+
+    def merge_index(self):
+        """Start the workers to merge the full-text search index, see
+        `run_jobs`. Returns `False` if they are already running, in which
+        case they merge it once the queue is empty."""
+        from .models import ensure_jobs_table
+
+        with connections["bibliothecula"].cursor() as cursor:
+            ensure_jobs_table(cursor)
+        return self.start()
 
     def kill_all(self):
         config = django_apps.get_app_config("bibliothecula")
@@ -0,0 +1,193 @@
+"""Incremental reads and writes of `BinaryMetadata` blobs.
+
+Embedded files can be hundreds of megabytes. `BlobReader` reads the `data`
+column of one row a chunk at a time with SQLite's incremental blob I/O
+(`sqlite3.Connection.blobopen`, Python 3.11+) or, on older Pythons, with
+`substr()` queries, so serving a file doesn't load all of it in memory.
+`write_temp_blob` writes an upload the same way into a temporary table it is
+copied from, since SQLite can't write incrementally into `BinaryMetadata.data`.
+"""
+import io
+import os
+import re
+import urllib.parse
+
+# Size of the chunks read while streaming a response.
+CHUNK_SIZE = 256 * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class BlobReader(io.RawIOBase):
+    """A read-only, seekable file object over the `data` column of the
+    `BinaryMetadata` row with this `rowid`."""
+
+    def __init__(self, connection, rowid, length):
+        super().__init__()
+        self.connection = connection
+        self.rowid = rowid
+        self.length = length
+        self.position = 0
+        self.blob = None
+        connection.ensure_connection()
+        if hasattr(connection.connection, "blobopen"):
+            self.blob = connection.connection.blobopen(
+                "BinaryMetadata", "data", rowid, readonly=True
+            )
+
+    @staticmethod
+    def open(connection, metadata_uuid):
+        """Returns a reader for the blob of a `BinaryMetadata` row, or `None`
+        if there is no such row."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT rowid, length(data) FROM BinaryMetadata WHERE uuid = %s",
+                [metadata_uuid.hex],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return BlobReader(connection, row[0], row[1])
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.length + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self.position
+        size = min(size, self.length - self.position)
+        if size <= 0:
+            return b""
+        if self.blob is not None:
+            self.blob.seek(self.position)
+            data = self.blob.read(size)
+        else:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT substr(data, %s, %s) FROM BinaryMetadata WHERE rowid = %s",
+                    [self.position + 1, size, self.rowid],
+                )
+                row = cursor.fetchone()
+            data = b"" if row is None or row[0] is None else bytes(row[0])
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.blob is not None:
+            self.blob.close()
+            self.blob = None
+        super().close()
+
+
+def write_temp_blob(connection, chunks, size):
+    """Write `chunks`, `size` bytes in total, into a new row of the temporary
+    `upload_blob` table and return its rowid. Requires
+    `sqlite3.Connection.blobopen` (Python 3.11+).
+
+    `BinaryMetadata.data` is part of the table's `UNIQUE (name, data)`
+    constraint, and SQLite refuses to open indexed columns for writing, so
+    the blob is built here and copied with an `INSERT ... SELECT` (see
+    `models.TempBlob`). Remove the row with `discard_temp_blob`."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS upload_blob (data BLOB NOT NULL)"
+        )
+        cursor.execute(
+            "INSERT INTO temp.upload_blob (data) VALUES (zeroblob(%s))", [size]
+        )
+        rowid = cursor.lastrowid
+    with connection.connection.blobopen(
+        "upload_blob", "data", rowid, name="temp"
+    ) as blob:
+        for chunk in chunks:
+            blob.write(chunk)
+    return rowid
+
+
+def discard_temp_blob(connection, rowid):
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM temp.upload_blob WHERE rowid = %s", [rowid])
+
+
+def parse_range(header, length):
+    """Returns `(start, end)` (inclusive) of a single `Range: bytes=...`
+    header, `None` if the header should be ignored and the whole file
+    served, or raises `ValueError` if the range can't be satisfied."""
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple ranges or another unit: serve everything.
+        return None
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        # The last `end` bytes.
+        suffix = int(end)
+        if suffix == 0 or length == 0:
+            raise ValueError("empty suffix range")
+        return (max(length - suffix, 0), length - 1)
+    start = int(start)
+    if end != "" and int(end) < start:
+        # Invalid, ignored.
+        return None
+    if start >= length:
+        raise ValueError("range not satisfiable")
+    end = length - 1 if end == "" else min(int(end), length - 1)
+    return (start, end)
+
+
+def content_disposition(as_attachment, filename):
+    """Returns the `Content-Disposition` header `FileResponse` sends for
+    `filename`, or `None`, for responses that aren't `FileResponse`s
+    (`django.utils.http.content_disposition_header` needs Django 4.2)."""
+    filename = os.path.basename(filename or "")
+    disposition = "attachment" if as_attachment else "inline"
+    if not filename:
+        return disposition if as_attachment else None
+    try:
+        filename.encode("ascii")
+        quoted = filename.replace("\\", "\\\\").replace('"', r"\"")
+        return f'{disposition}; filename="{quoted}"'
+    except UnicodeEncodeError:
+        return f"{disposition}; filename*=utf-8''{urllib.parse.quote(filename)}"
+
+
+def iter_range(filelike, start, end, chunk_size=CHUNK_SIZE):
+    """Yields the bytes `start` to `end` (inclusive) of `filelike` in chunks
+    and closes it."""
+    try:
+        filelike.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = filelike.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        filelike.close()
@@ -0,0 +1,56 @@
+"""Compression of text-like `BinaryMetadata` blobs.
+
+Rows with the `compressed` column set hold a zstd frame, if the optional
+`zstandard` module was available when they were written, or a zlib stream.
+The two are told apart by the zstd magic number, so databases can mix both.
+"""
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZSTD_LEVEL = 19
+ZLIB_LEVEL = 9
+# Smaller blobs aren't worth the decompression on every read.
+MIN_COMPRESS_SIZE = 1024
+# Content types of stored files that compress well.
+TEXT_CONTENT_TYPES = [
+    "application/json",
+    "application/xhtml+xml",
+    "application/xml",
+]
+
+
+def is_text_content_type(content_type):
+    return content_type.startswith("text/") or content_type in TEXT_CONTENT_TYPES
+
+
+def compress(data):
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(data):
+    data = bytes(data)
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError(
+                "Blob is compressed with zstd but the zstandard module is not installed."
+            )
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def maybe_compress(data):
+    """Returns `(data, compressed)`: the compressed data if it is smaller,
+    otherwise the data unchanged."""
+    if len(data) < MIN_COMPRESS_SIZE:
+        return (data, False)
+    compressed = compress(data)
+    if len(compressed) >= len(data):
+        return (data, False)
+    return (compressed, True)
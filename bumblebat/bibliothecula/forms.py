@@ -86,8 +86,30 @@ class AddDocument(forms.Form):
     title = forms.CharField(label="document title", required=True)
 
 
+class MultipleFileInput(forms.ClearableFileInput):
+    # Django 4.2.1+ refuses the `multiple` attribute on file inputs that
+    # don't allow it.
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """A file field that accepts several files, see
+    <https://docs.djangoproject.com/en/stable/topics/http/file-uploads/#uploading-multiple-files>.
+    The files themselves are read with `request.FILES.getlist`."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("widget", MultipleFileInput(attrs={"multiple": True}))
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        # Django 4.2.1+ passes a list of the uploaded files.
+        if isinstance(data, (list, tuple)):
+            return [super(MultipleFileField, self).clean(d, initial) for d in data]
+        return super().clean(data, initial)
+
+
 class ImportDocumentsForm(forms.Form):
-    files = forms.FileField(widget=forms.ClearableFileInput(attrs={"multiple": True}))
+    files = MultipleFileField()
 
 
 def new_author_field():
@@ -0,0 +1,203 @@
+"""Uploads staged between the two steps of an import.
+
+The first step streams each upload into a directory under
+`settings.IMPORT_STAGING_DIR` while hashing it, and keeps a manifest of the
+staged files in the session. Sessions are stored in the database and the
+directory is on disk, so the second step can be served by any worker
+process, and files are read back from disk a chunk at a time.
+
+Thumbnails and text of the staged files are made concurrently in the
+`extractors` process pool, whose workers read the staged files by path, so
+that the import transaction only inserts rows.
+"""
+import base64
+import concurrent.futures
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+from .background_tasks import THUMBNAIL_TIMEOUT, extract_text_job
+from .thumbnail_batch import render_thumbnail
+
+SESSION_KEY = "import_staging"
+STAGING_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def staging_root():
+    return Path(settings.IMPORT_STAGING_DIR)
+
+
+def staging_dir(staging_id):
+    if not STAGING_ID_RE.match(staging_id):
+        raise ValueError(f"invalid staging id {staging_id!r}")
+    return staging_root() / staging_id
+
+
+class StagedFile(UploadedFile):
+    """A staged upload, usable wherever an `UploadedFile` is, for example
+    `BinaryMetadata.from_file`. `sha256` is the digest computed while
+    staging it."""
+
+    def __init__(self, path, name, content_type, size, sha256):
+        super().__init__(open(path, "rb"), name, content_type, size)
+        self.path = str(path)
+        self.sha256 = sha256
+
+
+def stage_uploads(files):
+    """Copy uploaded files into a new staging directory a chunk at a time.
+    Returns the manifest: a list of JSON serializable dicts, one per
+    file."""
+    remove_stale_stagings()
+    staging_id = uuid.uuid4().hex
+    directory = staging_dir(staging_id)
+    directory.mkdir(parents=True)
+    manifest = []
+    try:
+        for f in files:
+            sha256 = hashlib.sha256()
+            size = 0
+            tmp_path = directory / f"{len(manifest)}.part"
+            with open(tmp_path, "wb") as out:
+                for chunk in f.chunks():
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            digest = sha256.hexdigest()
+            # Identical uploads are staged once.
+            os.replace(tmp_path, directory / digest)
+            manifest.append(
+                {
+                    "staging_id": staging_id,
+                    "sha256": digest,
+                    "name": f.name,
+                    "content_type": f.content_type,
+                    "size": size,
+                }
+            )
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return manifest
+
+
+def staged_path(entry):
+    return staging_dir(entry["staging_id"]) / entry["sha256"]
+
+
+def open_staged_file(entry):
+    """Returns a `StagedFile` for a manifest entry. Raises `FileNotFoundError`
+    if the staging directory was removed."""
+    return StagedFile(
+        staged_path(entry),
+        entry["name"],
+        entry["content_type"],
+        entry["size"],
+        entry["sha256"],
+    )
+
+
+def is_staged(manifest):
+    return manifest is not None and all(
+        staged_path(entry).is_file() for entry in manifest
+    )
+
+
+def discard_staging(manifest):
+    for staging_id in {entry["staging_id"] for entry in manifest or []}:
+        shutil.rmtree(staging_dir(staging_id), ignore_errors=True)
+
+
+def remove_stale_stagings(max_age=None):
+    """Remove staging directories of imports that were never finished."""
+    if max_age is None:
+        max_age = settings.IMPORT_STAGING_MAX_AGE
+    root = staging_root()
+    if not root.is_dir():
+        return
+    cutoff = time.time() - max_age
+    for directory in root.iterdir():
+        try:
+            if directory.is_dir() and directory.stat().st_mtime < cutoff:
+                shutil.rmtree(directory, ignore_errors=True)
+        except FileNotFoundError:
+            # Removed by another worker.
+            continue
+
+
+def staged_kind(entry):
+    """Returns the kind of a staged file as in `thumbnails.generate_thumbnail`
+    or `None`."""
+    name = entry["name"].lower()
+    if name.endswith(".pdf"):
+        return "pdf"
+    elif name.endswith(".epub"):
+        return "epub"
+    elif entry["content_type"].startswith("image"):
+        return "image"
+    return None
+
+
+def _results(futures):
+    """Yields `(index, result, error)` for `futures`, a dict of futures to
+    manifest indices, in completion order."""
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            yield (futures[future], future.result(), None)
+        except Exception as exc:
+            yield (futures[future], None, str(exc))
+
+
+def staged_thumbnails(extractors, manifest):
+    """Render the thumbnails of staged files in the `extractors` pool.
+    Returns `(data_urls, colors, errors)` where `data_urls` has a WebP data
+    URL or `None` for each file, `colors` their average colours, computed in
+    the pool as well, and `errors` is a list of `(name, error)`."""
+    futures = {}
+    for index, entry in enumerate(manifest):
+        kind = staged_kind(entry)
+        if kind is None:
+            continue
+        job = (index, kind, str(staged_path(entry)), None, THUMBNAIL_TIMEOUT)
+        futures[extractors.submit(render_thumbnail, job)] = index
+    data_urls = [None for _ in manifest]
+    colors = [None for _ in manifest]
+    errors = []
+    for index, result, error in _results(futures):
+        if result is not None:
+            _index, data, error, colors[index] = result
+            if data is not None:
+                data_urls[index] = "data:image/webp;base64," + base64.b64encode(
+                    data
+                ).decode("ascii")
+        if error is not None:
+            errors.append((manifest[index]["name"], error))
+    return (data_urls, colors, errors)
+
+
+def staged_texts(extractors, manifest, indices):
+    """Extract the text of the staged files at `indices` in the `extractors`
+    pool. Returns `(texts, errors)` where `texts` is a dict of indices to
+    text, which is `None` if no text could be extracted, and `errors` is a
+    list of `(name, error)` as in `staged_thumbnails`."""
+    futures = {}
+    for index in indices:
+        entry = manifest[index]
+        job = (index, staged_kind(entry), str(staged_path(entry)), None)
+        futures[extractors.submit(extract_text_job, job)] = index
+    texts = {}
+    errors = []
+    for index, result, error in _results(futures):
+        texts[index] = None if result is None else result[1]
+        if error is None and texts[index] is None:
+            error = "no text could be extracted"
+        if error is not None:
+            errors.append((manifest[index]["name"], error))
+    return (texts, errors)
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib import messages
+from django.db import connections
+from django.shortcuts import redirect
+from django.urls import reverse
+
+
+class SchemaUpgradeMiddleware:
+    """Send requests to the database page while the database needs a schema
+    upgrade (see `models.schema_upgrades`), since the views expect the
+    current schema. The upgrade itself only runs from that page."""
+
+    schema_current = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not SchemaUpgradeMiddleware.schema_current:
+            response = self.check(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def check(self, request):
+        from .models import schema_upgrades
+
+        database_index = reverse("database_index")
+        if request.path == database_index or request.path.startswith(
+            (reverse("admin:index"), settings.STATIC_URL)
+        ):
+            return None
+        with connections["bibliothecula"].cursor() as cursor:
+            upgrades = schema_upgrades(cursor)
+        if not upgrades:
+            SchemaUpgradeMiddleware.schema_current = True
+            return None
+        messages.add_message(
+            request,
+            messages.WARNING,
+            "The database was created by an older version and its schema has to be upgraded first.",
+        )
+        return redirect(database_index)
@@ -11,27 +11,52 @@ from django.utils.html import format_html, mark_safe
 from django.utils import timezone
 import uuid
 import urllib.parse
+import hashlib
 import os
 import io
+import socket
 import json
 import datetime
+import time
 from functools import reduce, lru_cache
 from pathlib import PurePosixPath, Path
 
 from . import *
+from . import compression
+
+# After the star import, which brings in the `bibliothecula.settings` module
+# under the same name.
+from django.conf import settings
 from .thumbnails import (
-    generate_pdf_thumbnail,
-    generate_epub_thumbnail,
-    generate_image_thumbnail,
+    generate_thumbnail,
     average_color,
+    thumbnail_blob,
+)
+from .thumbnail_batch import generate_thumbnails, ThumbnailBatchStats
+from .blob_io import discard_temp_blob, write_temp_blob
+from .text_extract import (
+    extract_document_text,
+    get_pdf_pages_text,
+    pdf_page_chunks,
+    pdf_page_count,
 )
-from .text_extract import get_pdf_text, get_epub_text
 
 PDF_MIME = "application/pdf"
 EPUB_MIME = "application/epub+zip"
 
 THUMBNAIL_MIMES = [PDF_MIME, EPUB_MIME]
 
+class TempBlob(models.expressions.RawSQL):
+    """The blob written by `blob_io.write_temp_blob` in row `rowid` of the
+    temporary `upload_blob` table."""
+
+    def __init__(self, rowid):
+        super().__init__(
+            "SELECT data FROM temp.upload_blob WHERE rowid = %s",
+            [rowid],
+            output_field=models.BinaryField(),
+        )
+
 
 class DateTimeField(models.DateTimeField):
     def __init__(self, *args, **kwargs):
@@ -85,15 +110,15 @@ class Document(models.Model):
         )
 
     def get_thumbnail_html(self):
-        data_url = self.get_thumbnail()
-        if data_url is None:
+        thumbnail = self.get_thumbnail()
+        if thumbnail is None:
             return None
         return (
             format_html(
                 '<img src="{}" class="thumbnail metadata" alt="thumbnail" />',
-                mark_safe(data_url[0]),
+                thumbnail[0],
             ),
-            data_url[1],
+            thumbnail[1],
         )
 
     def get_thumbnail(self):
@@ -104,11 +129,13 @@ class Document(models.Model):
         ):
             return None
         thumb = self.binary_metadata.all().get(metadata__name=THUMBNAIL_NAME)
-        data_url = thumb.metadata.contents_as_str()
-        color = average_color(data_url)
-        if color is None:
-            print("self is ", self)
-        return (data_url, thumb.metadata.uuid, color)
+        return (
+            thumbnail_url(thumb.metadata_id),
+            thumb.metadata_id,
+            ThumbnailColor.objects.filter(metadata=thumb.metadata_id)
+            .values_list("color", flat=True)
+            .first(),
+        )
 
     def total_metadata(self):
         return self.text_metadata.all().count()
@@ -187,106 +214,130 @@ class Document(models.Model):
             name=STORAGE_NAME, document=self
         )
 
-    def index_text(self, force=False):
-        if (
-            not force
-            and self.binary_metadata.all()
-            .filter(metadata__name=FULL_TEXT_NAME)
-            .exists()
-        ):
-            return False
-        files = self.files()
-        for m in files:
+    def text_sources(self):
+        """Yields `(metadata_uuid, kind, path, blob)` for each file full text
+        can be extracted from (see `text_extract.extract_document_text`)."""
+        for m in self.files():
             path = m.metadata.try_as_path()
-            text = None
-            if path and path.exists():
-                if path.endswith(".pdf"):
-                    text = get_pdf_text(path)
-                elif path.endswith(".epub"):
-                    text = get_epub_text(path)
+            if path:
+                if path.suffix == ".pdf":
+                    yield (m.metadata.uuid, "pdf", str(path), None)
+                elif path.suffix == ".epub":
+                    yield (m.metadata.uuid, "epub", str(path), None)
             else:
                 _t = m.metadata.try_get_content_type()
                 if _t is None:
                     continue
                 if _t["content_type"] == PDF_MIME:
-                    text = get_pdf_text(io.BytesIO(m.metadata.data))
+                    yield (m.metadata.uuid, "pdf", None, m.metadata.contents())
                 elif _t["content_type"] == EPUB_MIME:
-                    text = get_epub_text(io.BytesIO(m.metadata.data))
-                    print("get_epub_text returned ", type(text))
-            try:
-                if text is not None and len(text) > 0:
-                    m = BinaryMetadata.objects.create(
-                        name=FULL_TEXT_NAME, data=str.encode(text)
-                    )
-                    has = DocumentHasBinaryMetadata.objects.create(
-                        name=FULL_TEXT_NAME, document=self, metadata=m
-                    )
-                    m.save()
-                    has.save()
-                    return True
-                elif text is not None and len(text) == 0:
-                    print("Empty text!")
-            except Exception as exc:
-                print("EXCEPTION!", exc)
-            break
-        return False
+                    yield (m.metadata.uuid, "epub", None, m.metadata.contents())
 
-    def create_thumbnail(self, force=False, binary_metadata_uuid=None):
-        created = False
-        previous_thumbnails = list(
-            self.binary_metadata.all()
-            .filter(metadata__name=THUMBNAIL_NAME)
-            .values("metadata__uuid")
+    def save_full_text(self, text):
+        """Store extracted `text`. Returns `False` if there is nothing to
+        store."""
+        if text is None:
+            return False
+        if len(text) == 0:
+            print("Empty text!")
+            return False
+        m = BinaryMetadata.objects.create(name=FULL_TEXT_NAME, data=str.encode(text))
+        has = DocumentHasBinaryMetadata.objects.create(
+            name=FULL_TEXT_NAME, document=self, metadata=m
         )
-        has_already = len(previous_thumbnails) > 0
-        if not force and has_already:
+        m.save()
+        has.save()
+        return True
+
+    def index_text(self, force=False):
+        if (
+            not force
+            and self.binary_metadata.all()
+            .filter(metadata__name=FULL_TEXT_NAME)
+            .exists()
+        ):
+            return False
+        source = next(self.text_sources(), None)
+        if source is None:
             return False
-        files = self.files()
-        for m in files:
+        metadata_uuid, kind, path, blob = source
+        if force:
+            clear_pdf_page_text([metadata_uuid])
+        if kind == "pdf":
+            if not self.save_full_text(extract_pdf_text(metadata_uuid, path, blob)):
+                return False
+            # The pages were only kept to resume an interrupted extraction.
+            clear_pdf_page_text([metadata_uuid])
+            return True
+        return self.save_full_text(extract_document_text(kind, path, blob))
+
+    def thumbnail_sources(self, binary_metadata_uuid=None):
+        """Yields `(kind, path, blob)` for each file a thumbnail can be
+        generated from (see `thumbnails.generate_thumbnail`)."""
+        for m in self.files():
             if (
                 binary_metadata_uuid is not None
                 and binary_metadata_uuid != m.metadata.uuid
             ):
                 continue
             path = m.metadata.try_as_path()
-            data_url = None
-            if path and path.exists(path):
-                if path.endswith(".pdf"):
-                    data_url = generate_pdf_thumbnail(path)
-                elif path.endswith(".epub"):
-                    data_url = generate_epub_thumbnail(path)
+            if path:
+                if path.suffix == ".pdf":
+                    yield ("pdf", str(path), None)
+                elif path.suffix == ".epub":
+                    yield ("epub", str(path), None)
             else:
                 _t = m.metadata.try_get_content_type()
                 if _t is None:
                     continue
                 if _t["content_type"] == PDF_MIME:
-                    path = _t["filename"]
-                    data_url = generate_pdf_thumbnail(path, blob=m.metadata.data)
+                    yield ("pdf", _t["filename"], m.metadata.data)
                 elif _t["content_type"].startswith("image/"):
-                    path = _t["filename"]
-                    data_url = generate_image_thumbnail(path, blob=m.metadata.data)
+                    yield ("image", _t["filename"], m.metadata.data)
                 elif _t["content_type"] == EPUB_MIME:
-                    path = _t["filename"]
-                    data_url = generate_epub_thumbnail(path, blob=m.metadata.data)
-            if data_url is not None:
-                m = BinaryMetadata.objects.create(
-                    name=THUMBNAIL_NAME, data=str.encode(data_url)
-                )
-                has = DocumentHasBinaryMetadata.objects.create(
-                    name=THUMBNAIL_NAME, document=self, metadata=m
-                )
-                m.save()
-                has.save()
-                created = True
-        if created:
-            self.set_last_modified()
-            if has_already:
-                for v in previous_thumbnails:
-                    has = self.binary_metadata.all().get(
-                        metadata__uuid=v["metadata__uuid"]
-                    )
-                    has.delete()
-        return created
+                    yield ("epub", _t["filename"], m.metadata.data)
+
+    def save_thumbnail(self, data, color=None):
+        """Store `data` as the document's thumbnail, replacing any previous
+        ones. `color` is its average colour if it is known already, e.g.
+        computed by `thumbnail_batch.render_thumbnail`."""
+        previous_thumbnails = list(
+            self.binary_metadata.all()
+            .filter(metadata__name=THUMBNAIL_NAME)
+            .values_list("metadata__uuid", flat=True)
+        )
+        m = BinaryMetadata.objects.create(
+            name=THUMBNAIL_NAME, data=thumbnail_blob(data)
+        )
+        if color is None:
+            color = average_color(data)
+        if color is not None:
+            ThumbnailColor.objects.create(metadata=m, color=color)
+        has = DocumentHasBinaryMetadata.objects.create(
+            name=THUMBNAIL_NAME, document=self, metadata=m
+        )
+        m.save()
+        has.save()
+        self.set_last_modified()
+        if previous_thumbnails:
+            self.binary_metadata.all().filter(
+                metadata__uuid__in=previous_thumbnails
+            ).delete()
+
+    def create_thumbnail(self, force=False, binary_metadata_uuid=None):
+        if (
+            not force
+            and self.binary_metadata.all()
+            .filter(metadata__name=THUMBNAIL_NAME)
+            .exists()
+        ):
+            return False
+        for kind, path, blob in self.thumbnail_sources(binary_metadata_uuid):
+            data = generate_thumbnail(kind, path, blob)
+            if data is not None:
+                self.save_thumbnail(data)
+                return True
+        return False
 
     class Meta:
         ordering = (
@@ -333,8 +384,12 @@ class BinaryMetadata(models.Model):
     name = models.TextField(null=True)
     data = models.BinaryField(null=False)
     compressed = models.BooleanField(null=False, default=False)
+    sha256 = models.CharField(max_length=64, null=True, editable=False)
     created = DateTimeField(null=False, auto_now_add=True)
     last_modified = DateTimeField(null=False, auto_now=True)
+    # Set by `new_file` and `from_file` when they return an existing file
+    # with the same contents, which keeps its own name and content type.
+    reused = False
 
     def set_last_modified(self, datetime_=None):
         if datetime_ is None:
@@ -343,28 +398,162 @@ class BinaryMetadata(models.Model):
         self.save()
         return self.last_modified
 
-    def new_file(blob, size, uuid=None, content_type="", filename=""):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_data = instance.__dict__.get("data")
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Anything assigned to `data` since the last save or load is the
+        # uncompressed contents; it is hashed and compressed here.
+        if (
+            "data" not in self.get_deferred_fields()
+            and getattr(self, "_stored_data", None) is not self.data
+            and not hasattr(self.data, "resolve_expression")
+        ):
+            self.set_contents(self.data)
+        super().save(*args, **kwargs)
+
+    def should_compress(self):
+        # Full text is never compressed: the full-text search index reads it
+        # with SQL (see `sql_statements.CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT`),
+        # as do other clients that can't decompress it.
+        if self.name == FULL_TEXT_NAME or not settings.COMPRESS_STORED_FILES:
+            return False
+        content_type = self.try_get_content_type()
+        return content_type is not None and compression.is_text_content_type(
+            content_type["content_type"]
+        )
+
+    def set_contents(self, blob, sha256=None):
+        """Set the uncompressed contents, compressed if `should_compress`."""
+        blob = bytes(blob)
+        self.sha256 = blob_sha256(blob) if sha256 is None else sha256
+        if self.should_compress():
+            blob, self.compressed = compression.maybe_compress(blob)
+        else:
+            self.compressed = False
+        self.data = blob
+        self._stored_data = blob
+
+    def contents(self):
+        """Returns the uncompressed contents."""
+        if self.compressed:
+            return compression.decompress(self.data)
+        return bytes(self.data)
+
+    def file_name(size, content_type="", filename=""):
         d = {
             "content_type": content_type.strip(),
             "filename": filename.strip(),
             "size": size,
         }
-        name = json.dumps(d, separators=(",", ":"))
-        m = BinaryMetadata.objects.create(uuid=uuid, name=name, data=blob)
+        return json.dumps(d, separators=(",", ":"))
+
+    def stored_files():
+        """Returns the binary metadata holding file contents, whether or not
+        they are linked to a document yet, e.g. the files of an import whose
+        links are created after all its files are stored."""
+        return BinaryMetadata.objects.exclude(
+            name__in=[FULL_TEXT_NAME, THUMBNAIL_NAME, PATH_NAME]
+        )
+
+    def find_file(sha256):
+        """Returns a stored file with this content digest, or `None`."""
+        return (
+            BinaryMetadata.stored_files()
+            .filter(sha256=sha256)
+            .order_by("created")
+            .first()
+        )
+
+    def new_file(blob, size, uuid=None, content_type="", filename=""):
+        """Returns the stored file with the same contents as `blob` if there
+        is one, with `reused` set, otherwise a new file."""
+        sha256 = blob_sha256(blob)
+        existing = BinaryMetadata.find_file(sha256)
+        if existing is not None:
+            existing.reused = True
+            return existing
+        name = BinaryMetadata.file_name(size, content_type, filename)
+        m = BinaryMetadata(uuid=uuid, name=name)
+        m.set_contents(blob, sha256=sha256)
+        m.save(force_insert=True)
         return m
 
-    def from_file(_file):
-        _file.seek(0)
-        buf = io.BytesIO()
-        for chunk in _file.chunks():
-            buf.write(chunk)
-        buf.seek(0)
-        return BinaryMetadata.new_file(
-            buf.getvalue(),
-            _file.size,
-            content_type=_file.content_type,
-            filename=_file.name,
+    def prepare_file(_file):
+        """The reads of `from_file`, which can be done before a transaction:
+        returns the stored file with the same contents as the upload `_file`
+        with `reused` set, or a new unsaved file to store with `save_file`.
+
+        Files that `should_compress` are read and compressed here. Others
+        are hashed a chunk at a time, unless they are staged uploads that
+        were hashed already, and read by `save_file`."""
+        m = BinaryMetadata(
+            name=BinaryMetadata.file_name(
+                _file.size, _file.content_type, _file.name
+            )
         )
+        # Staged uploads were hashed while staging them.
+        digest = getattr(_file, "sha256", None)
+        if m.should_compress():
+            _file.seek(0)
+            m.set_contents(b"".join(_file.chunks()), sha256=digest)
+        else:
+            if digest is None:
+                _file.seek(0)
+                sha256 = hashlib.sha256()
+                for chunk in _file.chunks():
+                    sha256.update(chunk)
+                digest = sha256.hexdigest()
+            m.sha256 = digest
+            m.compressed = False
+        existing = BinaryMetadata.find_file(m.sha256)
+        if existing is not None:
+            existing.reused = True
+            return existing
+        return m
+
+    def save_file(m, _file):
+        """Store a new file `m` returned by `prepare_file` for `_file`.
+
+        Unless `prepare_file` read the contents already, the upload is
+        written into a temporary table with incremental blob I/O (see
+        `blob_io.write_temp_blob`), from which SQLite copies it into the new
+        row, so it is never held in memory as a whole. Without blob I/O
+        (Python < 3.11) it is read in memory."""
+        from django.db import connections, transaction
+
+        connection = connections["bibliothecula"]
+        connection.ensure_connection()
+        # `set_contents` was called by `prepare_file`.
+        if hasattr(m, "_stored_data"):
+            m.save(force_insert=True)
+            return m
+        _file.seek(0)
+        if not hasattr(connection.connection, "blobopen"):
+            m.set_contents(b"".join(_file.chunks()), sha256=m.sha256)
+            m.save(force_insert=True)
+            return m
+        with transaction.atomic(using="bibliothecula"):
+            rowid = write_temp_blob(connection, _file.chunks(), _file.size)
+            try:
+                m.data = TempBlob(rowid)
+                m.save(force_insert=True)
+            finally:
+                discard_temp_blob(connection, rowid)
+        # `data` holds the expression; it is loaded again if accessed.
+        del m.__dict__["data"]
+        return m
+
+    def from_file(_file):
+        """Store an uploaded file, or return the stored file with the same
+        contents with `reused` set. See `prepare_file` and `save_file`."""
+        m = BinaryMetadata.prepare_file(_file)
+        if not m.reused:
+            BinaryMetadata.save_file(m, _file)
+        return m
 
     def try_get_content_type(self):
         if self.name in [PATH_NAME, THUMBNAIL_NAME]:
@@ -405,7 +594,7 @@ class BinaryMetadata(models.Model):
                 return path.stat().st_size
         else:
             return content_type["size"]
-        return len(self.data)
+        return len(self.contents())
 
     def size_str(self):
         len_ = self.size()
@@ -415,14 +604,14 @@ class BinaryMetadata(models.Model):
 
     def is_str(self):
         try:
-            self.data.decode(encoding="utf-8", errors="strict")
+            self.contents().decode(encoding="utf-8", errors="strict")
             return True
         except:
             return False
 
     def contents_as_str(self):
         try:
-            return self.data.decode(encoding="utf-8", errors="strict")
+            return self.contents().decode(encoding="utf-8", errors="strict")
         except:
             pass
         return f"binary contents"
@@ -546,9 +735,276 @@ def last_modified_document(request, uuid):
         return datetime.datetime.now()
 
 
+def thumbnail_url(metadata_uuid):
+    return reverse("view_thumbnail", kwargs={"metadata_uuid": metadata_uuid})
+
+
+def thumbnail_etag(request, metadata_uuid):
+    """Thumbnails are never modified in place (a new one is created instead),
+    so the uuid and modification time identify the contents."""
+    try:
+        m = BinaryMetadata.objects.only("uuid", "last_modified").get(
+            pk=metadata_uuid, name=THUMBNAIL_NAME
+        )
+    except BinaryMetadata.DoesNotExist:
+        return None
+    return f"{m.uuid.hex}-{int(m.last_modified.timestamp())}"
+
+
+def create_thumbnails(
+    documents,
+    force=False,
+    max_workers=None,
+    persistent_ghostscript=True,
+    timeout=120,
+    progress=None,
+):
+    """Create thumbnails for `documents` in a process pool.
+
+    Rendering happens in worker processes (see `thumbnail_batch`) and only
+    saving the results touches the database. `progress` is called with the
+    `ThumbnailBatchStats` after each document. Returns the final stats."""
+    if not force:
+        documents = documents.exclude(
+            binary_metadata__metadata__name=THUMBNAIL_NAME
+        ).distinct()
+    pending = {}
+
+    def jobs():
+        for doc in documents.iterator():
+            source = next(doc.thumbnail_sources(), None)
+            if source is None:
+                continue
+            pending[doc.uuid] = doc
+            yield (doc.uuid, *source)
+
+    stats = ThumbnailBatchStats()
+    for document_uuid, data, error, color in generate_thumbnails(
+        jobs(),
+        max_workers=max_workers,
+        persistent_ghostscript=persistent_ghostscript,
+        timeout=timeout,
+        stats=stats,
+    ):
+        doc = pending.pop(document_uuid)
+        if data is not None:
+            try:
+                doc.save_thumbnail(data, color)
+            except Exception as exc:
+                stats.add_failure(doc.title, str(exc))
+        else:
+            stats.add_failure(doc.title, error)
+        if progress is not None:
+            progress(stats)
+    return stats
+
+
+def convert_data_url_thumbnails(queryset=None):
+    """Convert thumbnails stored as base64 `data:` URLs to raw WebP bytes in
+    place. Returns the number of converted thumbnails."""
+    if queryset is None:
+        queryset = BinaryMetadata.objects.all()
+    converted = 0
+    for metadata_uuid, data in (
+        queryset.filter(name=THUMBNAIL_NAME).values_list("uuid", "data").iterator()
+    ):
+        if not bytes(data).startswith(b"data:"):
+            continue
+        try:
+            blob = thumbnail_blob(data)
+        except ValueError as exc:
+            print(f"Could not convert thumbnail {metadata_uuid}: {exc}")
+            continue
+        BinaryMetadata.objects.filter(uuid=metadata_uuid).update(data=blob)
+        converted += 1
+    return converted
+
+
+# Rows per INSERT or lookup, below SQLite's default limit of 999 bound
+# parameters per statement.
+BULK_BATCH_SIZE = 100
+
+
+class ImportEntry:
+    """A document to create with `bulk_import_documents`.
+
+    `text_metadata` is a list of `(name, value)` where `value` is the text to
+    intern or the uuid of an existing `TextMetadata`. `binary_metadata` is a
+    list of `(name, BinaryMetadata)`; unsaved ones are inserted, with stored
+    files deduplicated by digest. `full_text` is the extracted text, if
+    any."""
+
+    def __init__(self, title, text_metadata=(), binary_metadata=(), full_text=None):
+        self.title = title
+        self.text_metadata = list(text_metadata)
+        self.binary_metadata = list(binary_metadata)
+        self.full_text = full_text
+
+
+class ImportStats:
+    def __init__(self):
+        self.timings = {}
+        self.documents = 0
+        self.text_metadata_created = 0
+        self.binary_metadata_created = 0
+        self.links = 0
+
+    def time(self, step, started):
+        self.timings[step] = self.timings.get(step, 0.0) + time.monotonic() - started
+
+    def __str__(self):
+        timings = ", ".join(
+            f"{step} {seconds:.2f}s" for step, seconds in self.timings.items()
+        )
+        return (
+            f"{self.documents} documents, {self.text_metadata_created} new text "
+            f"metadata, {self.binary_metadata_created} new binary metadata, "
+            f"{self.links} links ({timings})"
+        )
+
+
+def _batches(items, size=BULK_BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def intern_text_metadata(pairs, stats=None):
+    """Returns a dict of `(name, data)` to `TextMetadata` uuids for `pairs`,
+    inserting the missing ones with `bulk_create`. Existing values are
+    looked up by name with the `(name, data)` unique index."""
+    by_name = {}
+    for name, data in set(pairs):
+        by_name.setdefault(name, set()).add(data)
+    interned = {}
+    for name, datas in by_name.items():
+        for batch in _batches(datas):
+            interned.update(
+                ((name, data), metadata_uuid)
+                for metadata_uuid, data in TextMetadata.objects.filter(
+                    name=name, data__in=batch
+                ).values_list("uuid", "data")
+            )
+    missing = [
+        TextMetadata(name=name, data=data)
+        for name, datas in by_name.items()
+        for data in datas
+        if (name, data) not in interned
+    ]
+    TextMetadata.objects.bulk_create(missing, batch_size=BULK_BATCH_SIZE)
+    interned.update(((m.name, m.data), m.uuid) for m in missing)
+    if stats is not None:
+        stats.text_metadata_created += len(missing)
+    return interned
+
+
+def _dedup_stored_files(metadata):
+    """Returns a dict of the `id()` of unsaved stored files in `metadata` to
+    the stored file with the same contents, already in the database or
+    earlier in `metadata`."""
+    digests = {m.sha256 for m in metadata}
+    existing = {}
+    for batch in _batches(digests):
+        for m in (
+            BinaryMetadata.stored_files()
+            .defer("data")
+            .filter(sha256__in=batch)
+            .order_by("-created")
+        ):
+            # Oldest last, so it wins like in `find_file`.
+            existing[m.sha256] = m
+    replacements = {}
+    for m in metadata:
+        if m.sha256 in existing:
+            replacements[id(m)] = existing[m.sha256]
+        else:
+            existing[m.sha256] = m
+    return replacements
+
+
+def bulk_import_documents(entries, stats=None):
+    """Create a document for each `ImportEntry` with a few batched
+    statements: all text metadata values are interned at once and documents,
+    new binary metadata and their links are inserted with `bulk_create`.
+
+    Returns `(documents, stats)`, where `stats` is an `ImportStats` with the
+    time spent in each step."""
+    from django.db import transaction
+
+    if stats is None:
+        stats = ImportStats()
+    entries = list(entries)
+    with transaction.atomic(using="bibliothecula"):
+        started = time.monotonic()
+        interned = intern_text_metadata(
+            (
+                (name, value)
+                for entry in entries
+                for name, value in entry.text_metadata
+                if not isinstance(value, uuid.UUID)
+            ),
+            stats,
+        )
+        stats.time("intern", started)
+
+        started = time.monotonic()
+        documents = [Document(title=entry.title) for entry in entries]
+        Document.objects.bulk_create(documents, batch_size=BULK_BATCH_SIZE)
+        stats.documents += len(documents)
+        stats.time("documents", started)
+
+        started = time.monotonic()
+        binary_metadata = [list(entry.binary_metadata) for entry in entries]
+        new_metadata = []
+        for index, entry in enumerate(entries):
+            if entry.full_text:
+                m = BinaryMetadata(name=FULL_TEXT_NAME)
+                m.set_contents(entry.full_text.encode("utf-8"))
+                binary_metadata[index].append((FULL_TEXT_NAME, m))
+            for name, m in binary_metadata[index]:
+                if m._state.adding:
+                    if m.sha256 is None:
+                        m.set_contents(m.data)
+                    new_metadata.append((name, m))
+        replacements = _dedup_stored_files(
+            [m for name, m in new_metadata if name == STORAGE_NAME]
+        )
+        BinaryMetadata.objects.bulk_create(
+            [m for _name, m in new_metadata if id(m) not in replacements],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        stats.binary_metadata_created += len(new_metadata) - len(replacements)
+        stats.time("binary metadata", started)
+
+        started = time.monotonic()
+        text_links = {}
+        binary_links = {}
+        for doc, entry, metadata in zip(documents, entries, binary_metadata):
+            for name, value in entry.text_metadata:
+                if not isinstance(value, uuid.UUID):
+                    value = interned[(name, value)]
+                text_links[(doc.uuid, value)] = DocumentHasTextMetadata(
+                    name=name, document=doc, metadata_id=value
+                )
+            for name, m in metadata:
+                m = replacements.get(id(m), m)
+                binary_links[(doc.uuid, m.uuid)] = DocumentHasBinaryMetadata(
+                    name=name, document=doc, metadata=m
+                )
+        DocumentHasTextMetadata.objects.bulk_create(
+            text_links.values(), batch_size=BULK_BATCH_SIZE
+        )
+        DocumentHasBinaryMetadata.objects.bulk_create(
+            binary_links.values(), batch_size=BULK_BATCH_SIZE
+        )
+        stats.links += len(text_links) + len(binary_links)
+        stats.time("links", started)
+    return (documents, stats)
+
+
 def last_modified_binary_metadata(request, uuid, metadata_uuid):
     try:
-        m = BinaryMetadata.objects.get(pk=metadata_uuid)
+        m = BinaryMetadata.objects.only("last_modified").get(pk=metadata_uuid)
         return m.last_modified
     except BinaryMetadata.DoesNotExist:
         return datetime.datetime.now()
@@ -571,3 +1027,900 @@ def last_modified_collection():
     if len(lasts) == 0:
         return datetime.datetime.now()
     return max(lasts)
+
+
+SUMMARY_SEPARATOR = chr(31)
+
+
+class ThumbnailColor(models.Model):
+    """The average colour of a thumbnail, computed once when the thumbnail
+    is stored so that rendering a listing doesn't decode any images.
+
+    Backed by the `thumbnail_color` table (see
+    `sql_statements.THUMBNAIL_COLOR_SCHEMA`), which `upgrade_schema`
+    creates when upgrading the schema from the database page."""
+
+    metadata = models.OneToOneField(
+        BinaryMetadata,
+        primary_key=True,
+        related_name="thumbnail_color",
+        db_column="metadata_uuid",
+        on_delete=models.DO_NOTHING,
+    )
+    color = models.TextField(null=False)
+
+    def __str__(self):
+        return f"{self.color} [{self.metadata_id}]"
+
+    class Meta:
+        managed = False
+        db_table = "thumbnail_color"
+
+
+class DocumentSummary(models.Model):
+    """What a collection card/row shows about a document.
+
+    Backed by the optional `document_summary` table that is maintained by
+    triggers (see `sql_statements.SUMMARY_SCHEMA`). When the table doesn't
+    exist `load_document_summaries` computes unsaved instances instead."""
+
+    document = models.OneToOneField(
+        Document,
+        primary_key=True,
+        related_name="+",
+        db_column="uuid",
+        on_delete=models.DO_NOTHING,
+    )
+    title = models.TextField(null=False)
+    authors = models.TextField(null=True)
+    tags = models.TextField(null=True)
+    doc_type = models.TextField(null=True, db_column="type")
+    thumbnail_uuid = models.UUIDField(null=True)
+    thumbnail_color = models.TextField(null=True)
+    formats = models.TextField(null=True)
+    files_no = models.IntegerField(null=False, default=0)
+    linked_files_no = models.IntegerField(null=False, default=0)
+    embedded_size = models.IntegerField(null=False, default=0)
+
+    def authors_list(self):
+        return self.authors.split(SUMMARY_SEPARATOR) if self.authors else []
+
+    def tags_list(self):
+        return self.tags.split(SUMMARY_SEPARATOR) if self.tags else []
+
+    def formats_list(self):
+        return self.formats.split(SUMMARY_SEPARATOR) if self.formats else []
+
+    def authors_str(self):
+        return ", ".join(self.authors_list())
+
+    def tags_str(self):
+        return ", ".join(self.tags_list())
+
+    def formats_str(self):
+        return ", ".join(self.formats_list())
+
+    def url(self):
+        return reverse(
+            "view_notes" if self.doc_type == "notes" else "view_document",
+            kwargs={"uuid": self.document_id},
+        )
+
+    def __str__(self):
+        return f"{self.title} [{self.document_id}]"
+
+    class Meta:
+        managed = False
+        db_table = "document_summary"
+
+
+def document_summary_exists():
+    from django.db import connections
+
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'document_summary'"
+        )
+        return cursor.fetchone() is not None
+
+
+def compute_document_summaries(documents):
+    """Compute unsaved `DocumentSummary` objects for `documents` with a fixed
+    number of queries, regardless of how many documents there are."""
+    summaries = {
+        doc.uuid: DocumentSummary(document=doc, title=doc.title) for doc in documents
+    }
+    if not summaries:
+        return summaries
+    authors, tags, formats = {}, {}, {}
+    text_rows = (
+        DocumentHasTextMetadata.objects.filter(
+            document__in=summaries.keys(),
+            metadata__name__in=[AUTHOR_NAME, TAG_NAME, TYPE_NAME],
+        )
+        .order_by("id")
+        .values_list("document_id", "metadata__name", "metadata__data")
+    )
+    for document_uuid, name, data in text_rows:
+        summary = summaries[document_uuid]
+        if name == AUTHOR_NAME:
+            authors.setdefault(document_uuid, []).append(data)
+        elif name == TAG_NAME:
+            tags.setdefault(document_uuid, []).append(data)
+        elif summary.doc_type is None:
+            summary.doc_type = data
+    # Don't load blobs here: only thumbnails and linked paths are small enough
+    # to be worth fetching, and those are fetched in the next query.
+    binary_rows = (
+        DocumentHasBinaryMetadata.objects.filter(
+            document__in=summaries.keys(), name__in=[THUMBNAIL_NAME, STORAGE_NAME]
+        )
+        .order_by("id")
+        .values_list(
+            "document_id",
+            "name",
+            "metadata__uuid",
+            "metadata__name",
+            "metadata__thumbnail_color__color",
+        )
+    )
+    paths = {}
+    for document_uuid, name, metadata_uuid, metadata_name, color in binary_rows:
+        summary = summaries[document_uuid]
+        if name == THUMBNAIL_NAME:
+            summary.thumbnail_uuid = metadata_uuid
+            summary.thumbnail_color = color
+            continue
+        summary.files_no += 1
+        if metadata_name == PATH_NAME:
+            summary.linked_files_no += 1
+            paths[metadata_uuid] = document_uuid
+        else:
+            try:
+                content_type = json.loads(metadata_name)
+                summary.embedded_size += int(content_type.get("size", 0))
+                suffix = PurePosixPath(content_type["filename"]).suffix
+                if len(suffix) > 1:
+                    formats.setdefault(document_uuid, []).append(suffix[1:])
+            except Exception:
+                pass
+    if paths:
+        for metadata_uuid, data in BinaryMetadata.objects.filter(
+            uuid__in=paths.keys()
+        ).values_list("uuid", "data"):
+            try:
+                suffix = PurePosixPath(bytes(data).decode("utf-8")).suffix
+            except UnicodeDecodeError:
+                continue
+            if len(suffix) > 1:
+                formats.setdefault(paths[metadata_uuid], []).append(suffix[1:])
+    for document_uuid, summary in summaries.items():
+        summary.authors = SUMMARY_SEPARATOR.join(authors.get(document_uuid, []))
+        summary.tags = SUMMARY_SEPARATOR.join(tags.get(document_uuid, []))
+        summary.formats = SUMMARY_SEPARATOR.join(formats.get(document_uuid, []))
+    return summaries
+
+
+def load_document_summaries(documents):
+    """Set `summary` on each document in `documents`.
+
+    Reads the `document_summary` table if it exists, otherwise computes the
+    summaries. The thumbnail of each summary is available as
+    `summary.thumbnail`, in the same format `Document.get_thumbnail` returns.
+    """
+    documents = list(documents)
+    if not documents:
+        return documents
+    if document_summary_exists():
+        summaries = {
+            s.document_id: s
+            for s in DocumentSummary.objects.filter(document__in=documents)
+        }
+        missing = [doc for doc in documents if doc.uuid not in summaries]
+        if missing:
+            # Rows can be missing if the table was created but not rebuilt.
+            summaries.update(compute_document_summaries(missing))
+    else:
+        summaries = compute_document_summaries(documents)
+    for summary in summaries.values():
+        if summary.thumbnail_uuid is None:
+            summary.thumbnail = None
+        else:
+            summary.thumbnail = (
+                thumbnail_url(summary.thumbnail_uuid),
+                summary.thumbnail_uuid,
+                summary.thumbnail_color,
+            )
+    for doc in documents:
+        doc.summary = summaries[doc.uuid]
+    return documents
+
+
+JOB_KINDS = ["index", "thumbnail"]
+JOB_MAX_ATTEMPTS = 5
+# Seconds to wait before retrying a failed job, doubled after each attempt.
+JOB_BACKOFF = 30
+# Seconds between heartbeats of a worker loop's running jobs, and without a
+# heartbeat after which a running job is assumed abandoned by a dead process.
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_STALE_AFTER = 300
+
+
+class Job(models.Model):
+    """A unit of background work on a document.
+
+    Backed by the `jobs` table (see `sql_statements.JOBS_SCHEMA`), which
+    outlives the server process; the worker loop is in `background_tasks`."""
+
+    STATES = ["queued", "running", "done", "failed"]
+
+    id = models.AutoField(primary_key=True)
+    kind = models.TextField(null=False)
+    document = models.ForeignKey(
+        Document,
+        related_name="jobs",
+        db_column="document_uuid",
+        on_delete=models.DO_NOTHING,
+    )
+    state = models.TextField(null=False, default="queued")
+    attempts = models.IntegerField(null=False, default=0)
+    last_error = models.TextField(null=True)
+    not_before = models.DateTimeField(null=False)
+    created = models.DateTimeField(null=False)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    owner = models.TextField(null=True)
+    heartbeat = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.kind} job for {self.document_id} [{self.state}]"
+
+    class Meta:
+        managed = False
+        db_table = "jobs"
+        ordering = ("id",)
+
+
+def jobs_table_exists():
+    from django.db import connections
+
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'jobs'"
+        )
+        return cursor.fetchone() is not None
+
+
+def job_owner():
+    """Returns the `jobs.owner` of the jobs claimed by this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def ensure_jobs_table(cursor):
+    from . import sql_statements
+
+    for statement in sql_statements.JOBS_SCHEMA:
+        cursor.execute(str(statement))
+
+
+def enqueue_jobs(kind, documents):
+    """Queue a `kind` job for each of `documents`. Returns how many
+    documents were given."""
+    from django.db import connections
+    from . import sql_statements
+
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind {kind}")
+    rows = [(kind, uuid_.hex) for uuid_ in documents.values_list("uuid", flat=True)]
+    with connections["bibliothecula"].cursor() as cursor:
+        ensure_jobs_table(cursor)
+        cursor.executemany(str(sql_statements.JOBS_ENQUEUE), rows)
+    return len(rows)
+
+
+def claim_job(kind):
+    """Returns `(job_id, document_uuid, attempts)` of the next queued `kind`
+    job, now marked as running, or `None`."""
+    from django.db import connections
+    from . import sql_statements
+
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(str(sql_statements.JOBS_CLAIM), [job_owner(), kind])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return (row[0], uuid.UUID(hex=row[1]), row[2])
+
+
+def finish_job(job_id):
+    from django.db import connections
+    from . import sql_statements
+
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(str(sql_statements.JOBS_DONE), [job_id])
+
+
+def fail_job(job_id, attempts, error, retry=True):
+    """Record `error`; the job is retried with exponential backoff unless
+    `retry` is unset or it has used up its attempts."""
+    from django.db import connections
+    from . import sql_statements
+
+    max_attempts = JOB_MAX_ATTEMPTS if retry else 0
+    backoff = JOB_BACKOFF * 2 ** max(attempts - 1, 0)
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            str(sql_statements.JOBS_FAIL), [max_attempts, error, backoff, job_id]
+        )
+
+
+def heartbeat_jobs():
+    """Mark the running jobs of this process as still being worked on."""
+    from django.db import connections
+    from . import sql_statements
+
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(str(sql_statements.JOBS_HEARTBEAT), [job_owner()])
+
+
+def requeue_running_jobs():
+    """Put jobs of this process interrupted by a stop, and jobs abandoned by
+    a process that exited or crashed, back in the queue. Jobs running in
+    other live processes (e.g. another server sharing the database) are left
+    alone; see `JOB_STALE_AFTER`."""
+    from django.db import connections
+    from . import sql_statements
+
+    if not jobs_table_exists():
+        return
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            str(sql_statements.JOBS_REQUEUE_RUNNING), [job_owner(), JOB_STALE_AFTER]
+        )
+
+
+def seconds_until_next_job():
+    """Returns how long until a queued job is due, or `None` if there are no
+    queued jobs."""
+    next_job = (
+        Job.objects.filter(state="queued")
+        .order_by("not_before")
+        .only("not_before")
+        .first()
+    )
+    if next_job is None:
+        return None
+    return max((next_job.not_before - timezone.now()).total_seconds(), 0)
+
+
+def job_stats(window=datetime.timedelta(minutes=10)):
+    """Returns the queue depth per kind and state, and the throughput of
+    the last `window` in documents per second."""
+    from django.db.models import Count
+
+    if not jobs_table_exists():
+        return None
+    stats = {kind: {state: 0 for state in Job.STATES} for kind in JOB_KINDS}
+    for kind, state, count in (
+        Job.objects.order_by()
+        .values_list("kind", "state")
+        .annotate(count=Count("id"))
+    ):
+        stats.setdefault(kind, {state: 0 for state in Job.STATES})[state] = count
+    since = timezone.now() - window
+    for kind, kind_stats in stats.items():
+        finished = Job.objects.filter(
+            kind=kind, state__in=["done", "failed"], finished__gte=since
+        ).count()
+        kind_stats["per_second"] = finished / window.total_seconds()
+    failures = Job.objects.filter(state="failed").select_related("document")
+    return {"kinds": stats, "failures": failures.order_by("-finished")[:20]}
+
+
+def ensure_pdf_page_text_table(cursor):
+    from . import sql_statements
+
+    for statement in sql_statements.PDF_PAGE_TEXT_SCHEMA:
+        cursor.execute(str(statement))
+
+
+def cached_pdf_pages(metadata_uuid):
+    """Returns the set of pages of a PDF whose text is already stored in the
+    `pdf_page_text` table."""
+    from django.db import connections
+
+    with connections["bibliothecula"].cursor() as cursor:
+        ensure_pdf_page_text_table(cursor)
+        cursor.execute(
+            "SELECT page FROM pdf_page_text WHERE metadata_uuid = %s",
+            [metadata_uuid.hex],
+        )
+        return set(row[0] for row in cursor.fetchall())
+
+
+def cache_pdf_pages(metadata_uuid, pages):
+    """Store `[(page, text)]` extracted from a PDF."""
+    from django.db import connections
+    from . import sql_statements
+
+    with connections["bibliothecula"].cursor() as cursor:
+        ensure_pdf_page_text_table(cursor)
+        cursor.executemany(
+            str(sql_statements.PDF_PAGE_TEXT_INSERT),
+            [(metadata_uuid.hex, page, text) for page, text in pages],
+        )
+
+
+def cached_pdf_text(metadata_uuid):
+    """Returns the text of a PDF assembled from its stored pages."""
+    from django.db import connections
+
+    with connections["bibliothecula"].cursor() as cursor:
+        ensure_pdf_page_text_table(cursor)
+        cursor.execute(
+            "SELECT text FROM pdf_page_text WHERE metadata_uuid = %s ORDER BY page",
+            [metadata_uuid.hex],
+        )
+        return "".join(row[0] for row in cursor.fetchall())
+
+
+def clear_pdf_page_text(metadata_uuids):
+    """Forget the stored pages of PDFs, once their full text is saved or so
+    that they are extracted again."""
+    from django.db import connections
+
+    with connections["bibliothecula"].cursor() as cursor:
+        ensure_pdf_page_text_table(cursor)
+        cursor.executemany(
+            "DELETE FROM pdf_page_text WHERE metadata_uuid = %s",
+            [(uuid_.hex,) for uuid_ in metadata_uuids],
+        )
+
+
+def extract_pdf_text(metadata_uuid, path, blob=None):
+    """Extract the text of a PDF a range of pages at a time, storing each
+    range as it is done. Pages stored by an earlier, interrupted extraction
+    are not extracted again. Returns `None` on error."""
+    input_ = path if blob is None else io.BytesIO(blob)
+    try:
+        page_count = pdf_page_count(input_)
+        for pages in pdf_page_chunks(page_count, cached_pdf_pages(metadata_uuid)):
+            cache_pdf_pages(metadata_uuid, get_pdf_pages_text(input_, pages))
+    except Exception as exc:
+        print(f"exc: {exc} for {metadata_uuid}")
+        return None
+    return cached_pdf_text(metadata_uuid)
+
+
+def full_text_index_is_external(cursor):
+    """Returns whether the full-text search index exists and reads its
+    content from `FTS_CONTENT_NAME` instead of storing a copy."""
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [FTS_NAME],
+    )
+    row = cursor.fetchone()
+    return row is not None and "content_rowid" in row[0]
+
+
+def full_text_index_is_current(cursor):
+    """Returns whether the full-text search index exists and was created by
+    the current `sql_statements.FTS_CREATE_TABLE`: external content and
+    prefix indexes, with the triggers that update it when titles and authors
+    change."""
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [FTS_NAME],
+    )
+    row = cursor.fetchone()
+    if row is None or "content_rowid" not in row[0] or "prefix" not in row[0]:
+        return False
+    cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s)",
+        ["update_title_full_text_trigger", "insert_author_full_text_trigger"],
+    )
+    return cursor.fetchone()[0] == 2
+
+
+def full_text_index_size(cursor):
+    """Returns the bytes used by the full-text search index's shadow tables.
+
+    Without the `dbstat` virtual table (SQLite built without
+    `SQLITE_ENABLE_DBSTAT_VTAB`) this is the size of the records stored in
+    them, which leaves out the pages' overhead."""
+    from django.db import OperationalError
+
+    try:
+        cursor.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name IN (%s, %s, %s, %s, %s)",
+            [
+                f"{FTS_NAME}_data",
+                f"{FTS_NAME}_idx",
+                f"{FTS_NAME}_content",
+                f"{FTS_NAME}_docsize",
+                f"{FTS_NAME}_config",
+            ],
+        )
+        return cursor.fetchone()[0] or 0
+    except OperationalError:
+        pass
+    size = 0
+    # The index reads its content from a view, so it has no `_content`
+    # table (see `sql_statements.FTS_CREATE_TABLE`).
+    for table, record in [
+        ("data", "8 + length(block)"),
+        ("idx", "16 + length(term)"),
+        ("docsize", "8 + length(sz)"),
+        ("config", "length(k) + length(v)"),
+    ]:
+        cursor.execute(f"SELECT SUM({record}) FROM {FTS_NAME}_{table}")
+        size += cursor.fetchone()[0] or 0
+    return size
+
+
+# Marks the structure record format with extra per-segment fields, written
+# by SQLite 3.43 and later.
+FTS5_STRUCTURE_V2 = b"\xff\x00\x00\x01"
+
+
+def _fts5_varint(data, offset):
+    """Decodes the SQLite varint at `offset` of `data`. Returns `(value,
+    offset after it)`."""
+    value = 0
+    for i in range(9):
+        byte = data[offset]
+        offset += 1
+        if i == 8:
+            return ((value << 8) | byte, offset)
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return (value, offset)
+
+
+def full_text_index_segments(cursor):
+    """Returns `(levels, segments)` of the full-text search index's b-tree,
+    read from its structure record, or `None` if it has none. Every query
+    reads every segment, so fewer is faster."""
+    cursor.execute(f"SELECT block FROM {FTS_NAME}_data WHERE id = 10")
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    data = bytes(row[0])
+    # Skip the 4 byte cookie.
+    offset = 4
+    if data[offset : offset + 4] == FTS5_STRUCTURE_V2:
+        offset += 4
+    levels, offset = _fts5_varint(data, offset)
+    segments, offset = _fts5_varint(data, offset)
+    return (levels, segments)
+
+
+# The values FTS5 uses for merge options missing from the configuration
+# table.
+FTS5_MERGE_DEFAULTS = {"automerge": 4, "crisismerge": 16, "usermerge": 4}
+
+
+def full_text_index_merge_settings():
+    """Returns the merge options of the `FULL_TEXT_*MERGE` settings."""
+    return {
+        "automerge": int(settings.FULL_TEXT_AUTOMERGE),
+        "crisismerge": int(settings.FULL_TEXT_CRISISMERGE),
+        "usermerge": int(settings.FULL_TEXT_USERMERGE),
+    }
+
+
+def full_text_index_config(cursor):
+    """Returns the merge options stored in the full-text search index's
+    configuration table, with FTS5's defaults for the ones that aren't, or
+    `None` if there is no index."""
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s",
+        [f"{FTS_NAME}_config"],
+    )
+    if cursor.fetchone() is None:
+        return None
+    cursor.execute(
+        f"SELECT k, v FROM {FTS_NAME}_config WHERE k IN (%s, %s, %s)",
+        list(FTS5_MERGE_DEFAULTS),
+    )
+    config = dict(FTS5_MERGE_DEFAULTS)
+    config.update((k, int(v)) for k, v in cursor.fetchall())
+    return config
+
+
+def configure_full_text_index(cursor, config=None):
+    """Store merge options in the full-text search index's configuration
+    table, where every connection writing to it reads them. `config` maps
+    option names to values, by default `full_text_index_merge_settings()`."""
+    if config is None:
+        config = full_text_index_merge_settings()
+    for option, value in config.items():
+        cursor.execute(
+            f"INSERT INTO {FTS_NAME}({FTS_NAME}, rank) VALUES(%s, %s)",
+            [option, int(value)],
+        )
+
+
+def merge_full_text_index(pages=None):
+    """Do at most `pages` (`settings.FULL_TEXT_MERGE_PAGES` by default) pages
+    of incremental merging of the full-text search index's segments, instead
+    of rewriting all of it like `optimize` does. Returns whether there was
+    anything to merge."""
+    from django.db import connections
+
+    if pages is None:
+        pages = settings.FULL_TEXT_MERGE_PAGES
+    connection = connections["bibliothecula"]
+    with connection.cursor() as cursor:
+        before = connection.connection.total_changes
+        cursor.execute(
+            f"INSERT INTO {FTS_NAME}({FTS_NAME}, rank) VALUES('merge', %s)",
+            [int(pages)],
+        )
+        # A merge that did nothing changes fewer than two rows.
+        return connection.connection.total_changes - before >= 2
+
+
+def build_full_text_index():
+    """Create the full-text search index, or replace one created before it
+    read its content from `FTS_CONTENT_NAME`, had prefix indexes or was kept
+    up to date on title and author changes, and rebuild it from the stored
+    full text. Compressed full text is decompressed first, since the index
+    can only read plain text. Returns the size of the index."""
+    from django.db import connections, transaction
+    from . import sql_statements
+
+    recompress_binary_metadata(BinaryMetadata.objects.filter(name=FULL_TEXT_NAME))
+    with transaction.atomic(using="bibliothecula"):
+        with connections["bibliothecula"].cursor() as cursor:
+            if not full_text_index_is_current(cursor):
+                for trigger in sql_statements.FTS_LEGACY_TRIGGERS:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                cursor.execute(f"DROP TABLE IF EXISTS {FTS_NAME}")
+            for statement in sql_statements.FTS_SCHEMA:
+                cursor.execute(str(statement))
+            configure_full_text_index(cursor)
+            cursor.execute(str(sql_statements.FTS_REBUILD))
+            return full_text_index_size(cursor)
+
+
+def trigram_index_exists():
+    from django.db import connections
+
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [TRIGRAM_NAME],
+        )
+        return cursor.fetchone() is not None
+
+
+def build_trigram_index():
+    """Create the trigram index of titles, text metadata values and binary
+    metadata names, and rebuild it. Returns the number of indexed values."""
+    from django.db import connections, transaction
+    from . import sql_statements
+
+    with transaction.atomic(using="bibliothecula"):
+        with connections["bibliothecula"].cursor() as cursor:
+            for statement in sql_statements.TRIGRAM_SCHEMA:
+                cursor.execute(str(statement))
+            cursor.execute(str(sql_statements.TRIGRAM_REBUILD_ROWS))
+            cursor.execute(str(sql_statements.TRIGRAM_REBUILD))
+            cursor.execute(f"SELECT COUNT(*) FROM {TRIGRAM_NAME}")
+            return cursor.fetchone()[0]
+
+
+def blob_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+THUMBNAIL_COLOR_UPGRADE = (
+    "move thumbnail colours stored as text metadata to `thumbnail_color`"
+)
+
+
+def schema_upgrades(cursor):
+    """Return descriptions of the changes `upgrade_schema` would make to the
+    database, without changing anything. Empty if the schema is current."""
+    cursor.execute("PRAGMA table_info(BinaryMetadata)")
+    columns = set(row[1] for row in cursor.fetchall())
+    if not columns:
+        return []
+    upgrades = []
+    if "sha256" not in columns:
+        upgrades.append("add the `sha256` column of `BinaryMetadata`")
+    cursor.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('binary_metadata_sha256_idx', 'binary_metadata_sha256_reset')"
+    )
+    if cursor.fetchone()[0] != 2:
+        upgrades.append("create the index and trigger of file digests")
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'thumbnail_color'"
+    )
+    if cursor.fetchone() is None:
+        upgrades.append("create the `thumbnail_color` table")
+    cursor.execute("PRAGMA table_info(jobs)")
+    job_columns = set(row[1] for row in cursor.fetchall())
+    if job_columns and not {"owner", "heartbeat"} <= job_columns:
+        upgrades.append("add the `owner` and `heartbeat` columns of `jobs`")
+    cursor.execute(
+        "SELECT uuid FROM TextMetadata WHERE name = %s LIMIT 1",
+        [THUMBNAIL_COLOR_NAME],
+    )
+    if cursor.fetchone() is not None:
+        upgrades.append(THUMBNAIL_COLOR_UPGRADE)
+    if _summary_view_outdated(cursor):
+        upgrades.append("recreate `document_summary_view`")
+    return upgrades
+
+
+def _summary_view_outdated(cursor):
+    cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'document_summary_view'"
+    )
+    row = cursor.fetchone()
+    # The summary view read the colours from text metadata, or summed the
+    # stored (possibly compressed) size of embedded files.
+    return row is not None and (
+        THUMBNAIL_COLOR_NAME in row[0] or "length(bm.data)" in row[0]
+    )
+
+
+def upgrade_schema(cursor):
+    """Bring a database created by an older version up to date: add the
+    `sha256` column with its index and trigger, the `thumbnail_color` table
+    and the `owner` and `heartbeat` columns of the `jobs` table, and move
+    thumbnail colours stored as text metadata into `thumbnail_color`. Does
+    nothing on a database without the schema. The full-text search index is
+    migrated by `build_full_text_index`, since that rebuilds it.
+
+    This writes to the database, so it only runs when asked to from the
+    database page (or from the tests). Returns the descriptions of the
+    changes made, as `schema_upgrades` does, with the number of thumbnail
+    colours moved and of text metadata removed."""
+    from django.template.defaultfilters import pluralize
+    from . import sql_statements
+
+    upgrades = schema_upgrades(cursor)
+    if not upgrades:
+        return upgrades
+    cursor.execute("PRAGMA table_info(BinaryMetadata)")
+    columns = set(row[1] for row in cursor.fetchall())
+    if "sha256" not in columns:
+        cursor.execute(str(sql_statements.BINARYMETADATA_ADD_SHA256))
+    for statement in sql_statements.SHA256_SCHEMA:
+        cursor.execute(str(statement))
+    for statement in sql_statements.THUMBNAIL_COLOR_SCHEMA:
+        cursor.execute(str(statement))
+    cursor.execute("PRAGMA table_info(jobs)")
+    job_columns = set(row[1] for row in cursor.fetchall())
+    if job_columns and "owner" not in job_columns:
+        cursor.execute(str(sql_statements.JOBS_ADD_OWNER))
+    if job_columns and "heartbeat" not in job_columns:
+        cursor.execute(str(sql_statements.JOBS_ADD_HEARTBEAT))
+    cursor.execute(
+        "SELECT uuid FROM TextMetadata WHERE name = %s LIMIT 1",
+        [THUMBNAIL_COLOR_NAME],
+    )
+    if cursor.fetchone() is not None:
+        cursor.execute(str(sql_statements.THUMBNAIL_COLOR_FROM_TEXT_METADATA))
+        moved = cursor.rowcount
+        cursor.execute(
+            "DELETE FROM DocumentHasTextMetadata WHERE metadata_uuid IN (SELECT uuid FROM TextMetadata WHERE name = %s)",
+            [THUMBNAIL_COLOR_NAME],
+        )
+        cursor.execute(
+            "DELETE FROM TextMetadata WHERE name = %s", [THUMBNAIL_COLOR_NAME]
+        )
+        removed = cursor.rowcount
+        # Colours of documents without a thumbnail, or whose thumbnail
+        # already has one, are removed without being moved.
+        upgrades[upgrades.index(THUMBNAIL_COLOR_UPGRADE)] = (
+            f"moved {moved} thumbnail colour{pluralize(moved)} stored as text metadata to `thumbnail_color` and removed {removed} `{THUMBNAIL_COLOR_NAME}` text metadata"
+        )
+    if _summary_view_outdated(cursor):
+        cursor.execute("DROP VIEW document_summary_view")
+        for statement in sql_statements.SUMMARY_SCHEMA:
+            cursor.execute(str(statement))
+        cursor.execute(str(sql_statements.DOCUMENT_SUMMARY_REBUILD))
+    return upgrades
+
+
+def recompress_binary_metadata(queryset=None):
+    """Compress (or decompress) existing blobs according to
+    `BinaryMetadata.should_compress`, e.g. after installing `zstandard` or
+    on a database written before compression. Returns `(rows, before,
+    after)`: the number of rewritten rows and their stored sizes in bytes
+    before and after."""
+    from django.db.models import Q
+
+    if queryset is None:
+        queryset = BinaryMetadata.objects.all()
+    candidates = Q(compressed=True)
+    if settings.COMPRESS_STORED_FILES:
+        candidates |= Q(documents__name=STORAGE_NAME)
+    uuids = list(
+        queryset.filter(candidates)
+        .order_by()
+        .values_list("uuid", flat=True)
+        .distinct()
+    )
+    rows = before = after = 0
+    for uuid_ in uuids:
+        m = BinaryMetadata.objects.get(uuid=uuid_)
+        stored = m.data
+        compressed = m.compressed
+        m.set_contents(m.contents(), sha256=m.sha256)
+        if m.compressed == compressed and (
+            not compressed or len(m.data) >= len(stored)
+        ):
+            continue
+        m.save(update_fields=["data", "compressed", "sha256"])
+        rows += 1
+        before += len(stored)
+        after += len(m.data)
+    return (rows, before, after)
+
+
+def fill_binary_metadata_sha256(batch_size=100):
+    """Compute the digest of rows stored without one, e.g. by other clients.
+    Returns the number of updated rows."""
+    updated = 0
+    while True:
+        rows = list(
+            BinaryMetadata.objects.filter(sha256__isnull=True).values_list(
+                "uuid", "data", "compressed"
+            )[:batch_size]
+        )
+        if not rows:
+            return updated
+        for uuid_, data, compressed in rows:
+            if compressed:
+                data = compression.decompress(data)
+            BinaryMetadata.objects.filter(uuid=uuid_).update(sha256=blob_sha256(data))
+        updated += len(rows)
+
+
+def deduplicate_files():
+    """Merge stored files with identical contents: documents are linked to
+    the oldest copy and the other copies are deleted. Returns the number of
+    deleted copies."""
+    from django.db import transaction
+    from django.db.models import Count
+
+    fill_binary_metadata_sha256()
+    digests = (
+        BinaryMetadata.objects.filter(documents__name=STORAGE_NAME)
+        .order_by()
+        .values("sha256")
+        .annotate(copies=Count("uuid", distinct=True))
+        .filter(copies__gt=1)
+        .values_list("sha256", flat=True)
+    )
+    deleted = 0
+    for digest in list(digests):
+        with transaction.atomic(using="bibliothecula"):
+            copies = list(
+                BinaryMetadata.objects.filter(
+                    sha256=digest, documents__name=STORAGE_NAME
+                )
+                .distinct()
+                .order_by("created")
+                .only("uuid")
+            )
+            keep, duplicates = copies[0], copies[1:]
+            for duplicate in duplicates:
+                for has in DocumentHasBinaryMetadata.objects.filter(
+                    metadata=duplicate
+                ):
+                    if DocumentHasBinaryMetadata.objects.filter(
+                        document=has.document_id, metadata=keep
+                    ).exists():
+                        has.delete()
+                    else:
+                        has.metadata = keep
+                        has.save()
+                duplicate.delete()
+                deleted += 1
+    return deleted
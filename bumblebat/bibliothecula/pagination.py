@@ -0,0 +1,68 @@
+"""Keyset (cursor) pagination for document collections.
+
+Instead of `OFFSET`, each page remembers the sort key of its last row and the
+next page starts strictly after it, so fetching page 500 costs the same as
+fetching page 1. The document uuid is used as a tiebreaker, since titles and
+timestamps are not unique.
+"""
+from django.db.models import Q
+import base64
+import datetime
+import json
+import uuid
+
+PAGE_SIZE = 120
+
+KEYSET_FIELDS = ["title", "created", "last_modified"]
+
+
+def encode_cursor(value, uuid_):
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, uuid_.hex], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, field):
+    """Returns `(value, uuid)` or `None` if the cursor is malformed."""
+    try:
+        value, uuid_ = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if field != "title":
+            value = datetime.datetime.fromisoformat(value)
+        return (value, uuid.UUID(hex=uuid_))
+    except Exception:
+        return None
+
+
+def keyset_order(sort_field, sort_ascending):
+    if sort_ascending:
+        return (sort_field, "uuid")
+    return ("-" + sort_field, "-uuid")
+
+
+def keyset_page(queryset, sort_field, sort_ascending, after=None, size=PAGE_SIZE):
+    """Returns `(page, next_cursor)`.
+
+    `page` is a list of at most `size` objects from `queryset` ordered by
+    `(sort_field, uuid)` and `next_cursor` is `None` on the last page.
+    """
+    if sort_field not in KEYSET_FIELDS:
+        raise ValueError(f"Cannot paginate on {sort_field}")
+    queryset = queryset.order_by(*keyset_order(sort_field, sort_ascending))
+    if after is not None:
+        cursor = decode_cursor(after, sort_field)
+        if cursor is not None:
+            value, uuid_ = cursor
+            op = "gt" if sort_ascending else "lt"
+            queryset = queryset.filter(
+                Q(**{f"{sort_field}__{op}": value})
+                | Q(**{sort_field: value, f"uuid__{op}": uuid_})
+            )
+    # Fetch one extra row to know whether there is a next page.
+    page = list(queryset[: size + 1])
+    next_cursor = None
+    if len(page) > size:
+        page = page[:size]
+        last = page[-1]
+        next_cursor = encode_cursor(getattr(last, sort_field), last.uuid)
+    return (page, next_cursor)
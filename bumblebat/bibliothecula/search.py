@@ -0,0 +1,227 @@
+"""Ranked full-text search of documents.
+
+Matches in the fts5 index are ranked with `bm25()`, weighted per column by
+`settings.FULL_TEXT_RANK_WEIGHTS`. A document has one index entry for each of
+its full-text files, so entries are grouped by document and its best ranked
+entry is kept. The document of an entry is read from the link row whose rowid
+it shares: reading the `uuid` column would read the entry's content from the
+view for every match. Only the entries of the requested page are matched a
+second time to make their snippets, since `snippet()` is much more expensive
+than `bm25()`.
+
+Pages are fetched with `LIMIT/OFFSET`: every match has to be ranked anyway,
+so skipping rows costs nothing more than sorting them.
+
+Substring searches of titles and metadata use the optional trigram
+index (`TRIGRAM_NAME`) when it exists and the query is long enough, and
+fall back to `LIKE '%query%'` scans otherwise.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+import uuid
+
+from . import FTS_NAME, TRIGRAM_NAME
+from .models import (
+    Document,
+    DocumentHasBinaryMetadata,
+    DocumentHasTextMetadata,
+    TextMetadata,
+    trigram_index_exists,
+)
+from .pagination import PAGE_SIZE
+
+LINKS = f"JOIN DocumentHasBinaryMetadata AS has ON has.id = {FTS_NAME}.rowid"
+TRIGRAM_ROWS = f"JOIN metadata_trigram_rows AS r ON r.id = {TRIGRAM_NAME}.rowid"
+# The trigram tokenizer can't match anything shorter.
+TRIGRAM_MIN_LENGTH = 3
+TYPEAHEAD_LIMIT = 10
+SNIPPET = f"snippet({FTS_NAME}, -1, '<mark>', '</mark>', '\u200a[…]\u200a', 36)"
+
+
+def match_expression(query_string, prefix=False):
+    """The query string as a single fts5 phrase. With `prefix`, its last word
+    may be incomplete."""
+    phrase = '"' + query_string.replace('"', '""') + '"'
+    return phrase + " *" if prefix else phrase
+
+
+def rank_function():
+    """The `rank MATCH` argument that weighs the title, authors and
+    full_text columns."""
+    weights = ", ".join(str(float(w)) for w in settings.FULL_TEXT_RANK_WEIGHTS)
+    return f"bm25({weights})"
+
+
+def _restrict(documents):
+    """Returns `(sql, params)` of a condition on the index entries' link rows
+    that keeps the documents of the `documents` queryset."""
+    if documents is None:
+        return ("", [])
+    sql, params = (
+        documents.values("uuid")
+        .order_by()
+        .query.get_compiler(using="bibliothecula")
+        .as_sql()
+    )
+    return (f" AND has.document_uuid IN ({sql})", list(params))
+
+
+def matching_documents(query_string):
+    """A subquery of the uuids of the documents matching `query_string`, for
+    `uuid__in` lookups."""
+    return RawSQL(
+        f"SELECT has.document_uuid FROM {FTS_NAME} {LINKS} WHERE {FTS_NAME} MATCH %s",
+        [match_expression(query_string)],
+    )
+
+
+def count_matches(query_string, documents=None):
+    """Number of documents matching `query_string`, restricted to the
+    `documents` queryset if it is given."""
+    restrict, params = _restrict(documents)
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(DISTINCT has.document_uuid) FROM {FTS_NAME} {LINKS} WHERE {FTS_NAME} MATCH %s{restrict}",
+            [match_expression(query_string), *params],
+        )
+        return cursor.fetchone()[0]
+
+
+def search(query_string, documents=None, offset=0, size=PAGE_SIZE):
+    """Returns a list of `(uuid, rank, snippet)` of at most `size` documents
+    matching `query_string`, best match first, skipping the first `offset`
+    ones. `uuid` is a hex string and a lower `rank` is a better match.
+    Results are restricted to the `documents` queryset if it is given."""
+    restrict, params = _restrict(documents)
+    match = match_expression(query_string)
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            f"""WITH hits (entry, uuid, rank) AS (
+    SELECT {FTS_NAME}.rowid, has.document_uuid, MIN(rank) FROM {FTS_NAME} {LINKS}
+    WHERE {FTS_NAME} MATCH %s AND rank MATCH %s{restrict}
+    GROUP BY has.document_uuid ORDER BY 3, 2 LIMIT %s OFFSET %s
+)
+SELECT hits.uuid, hits.rank, {SNIPPET}
+FROM hits CROSS JOIN {FTS_NAME}
+WHERE {FTS_NAME} MATCH %s AND {FTS_NAME}.rowid = hits.entry
+ORDER BY hits.rank, hits.uuid""",
+            [match, rank_function(), *params, size, offset, match],
+        )
+        return cursor.fetchall()
+
+
+def search_page(query_string, documents=None, after=None, size=PAGE_SIZE):
+    """Returns `(page, next_cursor, snippets)` like `pagination.keyset_page`.
+
+    `page` is a list of at most `size` documents matching `query_string`,
+    best match first, `next_cursor` is the offset of the next page or `None`
+    on the last page and `snippets` is a dict of the page's uuids to the
+    snippet of their best match."""
+    offset = int(after) if after is not None and after.isdigit() else 0
+    # Fetch one extra row to know whether there is a next page.
+    hits = search(query_string, documents, offset, size + 1)
+    next_cursor = None
+    if len(hits) > size:
+        hits = hits[:size]
+        next_cursor = str(offset + size)
+    uuids = [uuid.UUID(hex=h[0]) for h in hits]
+    in_bulk = Document.objects.in_bulk(uuids)
+    page = [in_bulk[u] for u in uuids if u in in_bulk]
+    snippets = {u: h[2] for u, h in zip(uuids, hits)}
+    return (page, next_cursor, snippets)
+
+
+def use_trigram_index(query_string):
+    return len(query_string) >= TRIGRAM_MIN_LENGTH and trigram_index_exists()
+
+
+def trigram_matches(query_string):
+    """A subquery of the uuids of the documents whose title contains
+    `query_string`, of the text metadata whose value does and of the binary
+    metadata whose name does."""
+    return RawSQL(
+        f"SELECT r.uuid FROM {TRIGRAM_NAME} {TRIGRAM_ROWS} WHERE {TRIGRAM_NAME} MATCH %s",
+        [match_expression(query_string)],
+    )
+
+
+def metadata_search(query_string):
+    """A `Q` filter of the documents whose title, text metadata values or
+    binary metadata names contain `query_string`, case insensitively.
+    Each condition is a subquery on document uuids instead of a join, so
+    the result needs no `distinct()`."""
+    if use_trigram_index(query_string):
+        titles = Q(uuid__in=trigram_matches(query_string))
+        values = DocumentHasTextMetadata.objects.filter(
+            metadata__in=trigram_matches(query_string)
+        )
+        names = DocumentHasBinaryMetadata.objects.filter(
+            metadata__in=trigram_matches(query_string)
+        )
+    else:
+        titles = Q(title__icontains=query_string)
+        values = DocumentHasTextMetadata.objects.filter(
+            metadata__data__icontains=query_string
+        )
+        names = DocumentHasBinaryMetadata.objects.filter(
+            metadata__name__icontains=query_string
+        )
+    return (
+        titles
+        | Q(uuid__in=values.values("document"))
+        | Q(uuid__in=names.values("document"))
+    )
+
+
+def search_prefix(query_string, limit):
+    """Returns the uuids of the `limit` best ranked documents matching
+    `query_string` with its last word as a prefix."""
+    with connections["bibliothecula"].cursor() as cursor:
+        cursor.execute(
+            f"""SELECT has.document_uuid FROM {FTS_NAME} {LINKS}
+WHERE {FTS_NAME} MATCH %s AND rank MATCH %s
+GROUP BY has.document_uuid ORDER BY MIN(rank) LIMIT %s""",
+            [match_expression(query_string, prefix=True), rank_function(), limit],
+        )
+        return [uuid.UUID(hex=row[0]) for row in cursor.fetchall()]
+
+
+def typeahead(query_string, full_text=False, limit=TYPEAHEAD_LIMIT):
+    """Suggestions for a query that is being typed. Returns a dict with
+    `documents`, a list of `{"uuid", "title"}`, and `metadata`, a list of
+    `{"name", "data"}` of text metadata.
+
+    With `full_text`, `documents` are the best ranked matches in the
+    full-text search index of the query with its last word as a prefix,
+    which the index's prefix indexes answer. Otherwise they are the
+    documents whose title contains the query and `metadata` the values that
+    contain it, from the trigram index if it exists."""
+    query_string = query_string.strip()
+    if not query_string:
+        return {"documents": [], "metadata": []}
+    if full_text:
+        uuids = search_prefix(query_string, limit)
+        titles = dict(
+            Document.objects.filter(uuid__in=uuids).values_list("uuid", "title")
+        )
+        return {
+            "documents": [
+                {"uuid": u.hex, "title": titles[u]} for u in uuids if u in titles
+            ],
+            "metadata": [],
+        }
+    if use_trigram_index(query_string):
+        matches = trigram_matches(query_string)
+        documents = Document.objects.filter(uuid__in=matches)
+        metadata = TextMetadata.objects.filter(uuid__in=matches)
+    else:
+        documents = Document.objects.filter(title__icontains=query_string)
+        metadata = TextMetadata.objects.filter(data__icontains=query_string)
+    documents = documents.order_by("title").values_list("uuid", "title")[:limit]
+    metadata = metadata.order_by("name", "data").values_list("name", "data")[:limit]
+    return {
+        "documents": [{"uuid": u.hex, "title": title} for u, title in documents],
+        "metadata": [{"name": name, "data": data} for name, data in metadata],
+    }
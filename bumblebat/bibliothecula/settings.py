@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 from pathlib import Path, PurePath
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "bibliothecula.middleware.SchemaUpgradeMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -149,4 +151,28 @@ CACHES = {
         "LOCATION": "unique-snowflake",
     }
 }
-FILE_UPLOAD_MAX_MEMORY_SIZE = 9999242880
+# Compress stored text files (see bibliothecula/compression.py). Off by
+# default since other clients, e.g. biblfs, serve blobs as they are stored.
+# Existing files are compressed with the "recompress blobs" button of the
+# database page.
+COMPRESS_STORED_FILES = False
+# Bigger uploads are spooled to a temporary file and copied into the
+# database a chunk at a time, see BinaryMetadata.from_file.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+# Uploads waiting for the second step of an import are staged here. It
+# must be shared by all worker processes.
+IMPORT_STAGING_DIR = Path(tempfile.gettempdir()) / "bibliothecula-import"
+# Staged imports that were never finished are removed after this many seconds.
+IMPORT_STAGING_MAX_AGE = 24 * 60 * 60
+# bm25() weights of the title, authors and full_text columns of the full-text
+# search index: a match in a title counts for more than one in the text.
+FULL_TEXT_RANK_WEIGHTS = (10.0, 5.0, 1.0)
+# Merge tuning of the full-text search index, stored in its configuration
+# table. Merging less while documents are indexed keeps each insert cheap:
+# the background workers merge the segments incrementally between batches,
+# FULL_TEXT_MERGE_PAGES pages of work at a time. See
+# https://sqlite.org/fts5.html#the_automerge_configuration_option
+FULL_TEXT_AUTOMERGE = 8
+FULL_TEXT_CRISISMERGE = 16
+FULL_TEXT_USERMERGE = 4
+FULL_TEXT_MERGE_PAGES = 500
@@ -201,6 +201,7 @@ CREATE_BINARYMETADATA = SqlStatement(
         "name" TEXT NULL,
         "data" BLOB NOT NULL,
         "compressed" BOOLEAN NOT NULL DEFAULT (0),
+        "sha256" CHARACTER(64) NULL,
         "created" DATETIME NOT NULL DEFAULT (strftime ('%Y-%m-%d %H:%M:%f', 'now')),
         "last_modified" DATETIME NOT NULL DEFAULT (strftime ('%Y-%m-%d %H:%M:%f', 'now')),
         CONSTRAINT uniqueness UNIQUE ("name", "data")
@@ -249,9 +250,49 @@ CREATE_DOCUMENTHASTEXTMETADATA = SqlStatement(
 )
 
 
+CREATE_INDEX_HAS_TEXT_DOCUMENT = SqlStatement(
+    "CREATE_INDEX_HAS_TEXT_DOCUMENT",
+    """CREATE INDEX IF NOT EXISTS has_text_document_uuid_idx
+    ON DocumentHasTextMetadata(document_uuid)""",
+    doc=f"""Index the metadata of each document. The uniqueness constraint of <var>DocumentHasTextMetadata</var> starts with <var>name</var>, so it can't be used to look up a document's metadata. {sqlite3_reference_href("https://sqlite.org/lang_createindex.html", text="for creating indexes")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTHASTEXTMETADATA],
+)
+
+CREATE_INDEX_HAS_TEXT_METADATA = SqlStatement(
+    "CREATE_INDEX_HAS_TEXT_METADATA",
+    """CREATE INDEX IF NOT EXISTS has_text_metadata_uuid_idx
+    ON DocumentHasTextMetadata(metadata_uuid)""",
+    doc=f"""Index the documents of each text metadata. {sqlite3_reference_href("https://sqlite.org/lang_createindex.html", text="for creating indexes")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTHASTEXTMETADATA],
+)
+
+CREATE_INDEX_HAS_BINARY_DOCUMENT = SqlStatement(
+    "CREATE_INDEX_HAS_BINARY_DOCUMENT",
+    """CREATE INDEX IF NOT EXISTS has_binary_document_uuid_idx
+    ON DocumentHasBinaryMetadata(document_uuid)""",
+    doc=f"""Index the binary metadata of each document. {sqlite3_reference_href("https://sqlite.org/lang_createindex.html", text="for creating indexes")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTHASBINARYMETADATA],
+)
+
+CREATE_INDEX_HAS_BINARY_METADATA = SqlStatement(
+    "CREATE_INDEX_HAS_BINARY_METADATA",
+    """CREATE INDEX IF NOT EXISTS has_binary_metadata_uuid_idx
+    ON DocumentHasBinaryMetadata(metadata_uuid)""",
+    doc=f"""Index the documents of each binary metadata. {sqlite3_reference_href("https://sqlite.org/lang_createindex.html", text="for creating indexes")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTHASBINARYMETADATA],
+)
+
 CREATE_VIEW_DOCUMENTS_TITLE_AUTHORS = SqlStatement(
     "CREATE_VIEW_DOCUMENTS_TITLE_AUTHORS",
-    """CREATE VIEW document_title_authors (rowid, title, authors) AS
+    """CREATE VIEW IF NOT EXISTS document_title_authors (rowid, title, authors) AS
 SELECT uuid, title, authors
 FROM
     Documents AS d
@@ -271,64 +312,483 @@ FROM
     dependencies=[],
 )
 
+CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT = SqlStatement(
+    "CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT",
+    """CREATE VIEW IF NOT EXISTS document_title_authors_text_view (id, uuid, title, authors, full_text) AS
+SELECT
+    has.id, has.document_uuid, d.title,
+    (SELECT
+            GROUP_CONCAT (tm.data, '\\0')
+        FROM
+            DocumentHasTextMetadata AS dhtm
+            JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+        WHERE
+            dhtm.document_uuid = has.document_uuid
+            AND tm.name = 'author'),
+    bm.data
+FROM
+    DocumentHasBinaryMetadata AS has
+    JOIN Documents AS d ON d.uuid = has.document_uuid
+    JOIN BinaryMetadata AS bm ON bm.uuid = has.metadata_uuid
+WHERE
+    has.name = 'full-text'
+    AND bm.name = 'full-text'
+    AND NOT bm.compressed;""",
+    doc=f"""Content of the <var>document_title_authors_text_view_fts</var> index: one row per full-text <var>DocumentHasBinaryMetadata</var> row, keyed by its <var>id</var>, with the document's title, a NULL byte separated string with all its authors and the full text. The index reads the text through this view instead of storing a copy. Full text is never stored compressed; rows compressed by older versions can't be read by SQL and are left out until the index is built again, which decompresses them. {sqlite3_reference_href("https://sqlite.org/lang_createview.html",text="for creating views")}""",
+    kind=StatementKind.VIEW,
+    callable_=True,
+    dependencies=[
+        CREATE_DOCUMENTS,
+        CREATE_TEXTMETADATA,
+        CREATE_BINARYMETADATA,
+        CREATE_DOCUMENTHASTEXTMETADATA,
+        CREATE_DOCUMENTHASBINARYMETADATA,
+        CREATE_INDEX_HAS_TEXT_DOCUMENT,
+    ],
+)
+
 FTS_CREATE_TABLE = SqlStatement(
     "FTS_CREATE_TABLE",
     """CREATE VIRTUAL TABLE IF NOT EXISTS document_title_authors_text_view_fts
-    USING fts5(title, authors, full_text, uuid UNINDEXED)""",
-    doc=f"""Create a full-text search index using the <em>fts5</em> module. {sqlite3_reference_href("https://sqlite.org/fts5.html")}""",
+    USING fts5(title, authors, full_text, uuid UNINDEXED,
+        content='document_title_authors_text_view', content_rowid='id',
+        prefix='2 3')""",
+    doc=f"""Create a full-text search index using the <em>fts5</em> module. It is an external content table: the indexed values are read from <var>document_title_authors_text_view</var> when needed and are not stored twice, so the triggers on the underlying tables must keep it up to date. The prefix indexes make queries on the first two or three characters of a word, such as <code>"bibl" *</code> while a query is typed, index lookups. {sqlite3_reference_href("https://sqlite.org/fts5.html#external_content_tables")}""",
     kind=(StatementKind.INDEX | StatementKind.TABLE),
     callable_=True,
+    dependencies=[CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT],
 )
 
 FTS_CREATE_INSERT_TRIGGER = SqlStatement(
     "FTS_CREATE_INSERT_TRIGGER",
-    """CREATE TRIGGER insert_full_text_trigger
+    """CREATE TRIGGER IF NOT EXISTS insert_full_text_trigger
     AFTER INSERT ON DocumentHasBinaryMetadata
-WHEN EXISTS (
-        SELECT
-            *
-        FROM
-            BinaryMetadata AS bm
-        WHERE
-            NEW.metadata_uuid = bm.uuid
-            AND bm.name = 'full-text')
+    WHEN NEW.name = 'full-text'
 BEGIN
     INSERT INTO document_title_authors_text_view_fts (
-        uuid, title, authors, full_text)
-SELECT
-    d.rowid AS rowid, d.title AS title,
-    d.authors AS authors, bm.data AS full_text
-FROM
-    document_title_authors AS d,
-    BinaryMetadata AS bm
-WHERE
-    d.rowid = NEW.document_uuid
-    AND bm.name = 'full-text'
-    AND bm.uuid = NEW.metadata_uuid;
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        id = NEW.id;
 END;""",
-    doc=f"""Trigger to insert full text data when a <var>DocumentHasBinaryMetadata</var> row for a full-text <var>BinaryMetadata</var> is created. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    doc=f"""Trigger to index full text data when a <var>DocumentHasBinaryMetadata</var> row for a full-text <var>BinaryMetadata</var> is created. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
     kind=(StatementKind.TRIGGER | StatementKind.INDEX),
     callable_=True,
     dependencies=[
         FTS_CREATE_TABLE,
         CREATE_DOCUMENTHASBINARYMETADATA,
-        CREATE_VIEW_DOCUMENTS_TITLE_AUTHORS,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
     ],
 )
 
 FTS_CREATE_DELETE_TRIGGER = SqlStatement(
     "FTS_CREATE_DELETE_TRIGGER",
     """CREATE TRIGGER IF NOT EXISTS delete_full_text_trigger
-       AFTER DELETE ON DocumentHasBinaryMetadata
-        WHEN OLD.name = 'full-text'
-       BEGIN
-       DELETE FROM document_title_authors_text_view_fts
-       WHERE uuid = OLD.document_uuid;
-END""",
-    doc=f"""Trigger to remove a document's full text from the full text search table when the full-text binary metadata is deleted. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    BEFORE DELETE ON DocumentHasBinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        id = OLD.id;
+END;""",
+    doc=f"""Trigger to remove a document's full text from the full text search index before the full-text binary metadata link is deleted, while the indexed values can still be read. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
     kind=(StatementKind.TRIGGER | StatementKind.INDEX),
     callable_=True,
-    dependencies=[FTS_CREATE_TABLE, CREATE_DOCUMENTHASBINARYMETADATA],
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTHASBINARYMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+    ],
+)
+
+FTS_CREATE_DOCUMENT_DELETE_TRIGGER = SqlStatement(
+    "FTS_CREATE_DOCUMENT_DELETE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS delete_document_full_text_trigger
+    BEFORE DELETE ON Documents
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = OLD.uuid;
+END;""",
+    doc=f"""Trigger to remove a document's full text from the full text search index before the document is deleted. Its links are deleted by a foreign key action after the document is gone, when the indexed values can no longer be read. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTS,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_METADATA_DELETE_TRIGGER = SqlStatement(
+    "FTS_CREATE_METADATA_DELETE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS delete_metadata_full_text_trigger
+    BEFORE DELETE ON BinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = OLD.uuid;
+END;""",
+    doc=f"""Trigger to remove full text from the full text search index before its binary metadata is deleted, for the same reason as <var>delete_document_full_text_trigger</var>. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_BINARYMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_METADATA,
+    ],
+)
+
+FTS_CREATE_UPDATE_BEFORE_TRIGGER = SqlStatement(
+    "FTS_CREATE_UPDATE_BEFORE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS update_full_text_before_trigger
+    BEFORE UPDATE OF name, data, compressed ON BinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = OLD.uuid;
+END;""",
+    doc=f"""Trigger to remove the old full text from the full text search index before it is changed. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_BINARYMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_METADATA,
+    ],
+)
+
+FTS_CREATE_UPDATE_AFTER_TRIGGER = SqlStatement(
+    "FTS_CREATE_UPDATE_AFTER_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS update_full_text_after_trigger
+    AFTER UPDATE OF name, data, compressed ON BinaryMetadata
+    WHEN NEW.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = NEW.uuid;
+END;""",
+    doc=f"""Trigger to index the new full text after it is changed. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_BINARYMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_METADATA,
+    ],
+)
+
+FTS_CREATE_TITLE_UPDATE_TRIGGER = SqlStatement(
+    "FTS_CREATE_TITLE_UPDATE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS update_title_full_text_trigger
+    AFTER UPDATE OF title ON Documents
+    WHEN NEW.title IS NOT OLD.title
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, OLD.title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.uuid;
+END;""",
+    doc=f"""Trigger to reindex a document's full text after its title is changed. The entries are removed with the old title, so only this document's entries are touched. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTS,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_AUTHOR_INSERT_TRIGGER = SqlStatement(
+    "FTS_CREATE_AUTHOR_INSERT_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS insert_author_full_text_trigger
+    AFTER INSERT ON DocumentHasTextMetadata
+    WHEN (SELECT name FROM TextMetadata WHERE uuid = NEW.metadata_uuid) = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND dhtm.id <> NEW.id),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid = NEW.document_uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.document_uuid;
+END;""",
+    doc=f"""Trigger to reindex a document's full text after an author is added to it. The entries are removed with the authors they had without the new link. It is an <code>AFTER</code> trigger so that an <code>INSERT OR IGNORE</code> of an existing link changes nothing. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTHASTEXTMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_AUTHOR_DELETE_TRIGGER = SqlStatement(
+    "FTS_CREATE_AUTHOR_DELETE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS delete_author_full_text_trigger
+    BEFORE DELETE ON DocumentHasTextMetadata
+    WHEN (SELECT name FROM TextMetadata WHERE uuid = OLD.metadata_uuid) = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = OLD.document_uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND dhtm.id <> OLD.id),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid = OLD.document_uuid;
+END;""",
+    doc=f"""Trigger to reindex a document's full text before an author is removed from it, with the authors it will have without the link. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTHASTEXTMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_AUTHOR_UPDATE_BEFORE_TRIGGER = SqlStatement(
+    "FTS_CREATE_AUTHOR_UPDATE_BEFORE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS update_author_full_text_before_trigger
+    BEFORE UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+    WHEN (NEW.document_uuid IS NOT OLD.document_uuid
+            OR NEW.metadata_uuid IS NOT OLD.metadata_uuid)
+        AND 'author' IN (SELECT name FROM TextMetadata
+            WHERE uuid IN (OLD.metadata_uuid, NEW.metadata_uuid))
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (OLD.document_uuid, NEW.document_uuid);
+END;""",
+    doc=f"""Trigger to remove the full text of the documents of an author link from the full text search index before the link is moved to another document or metadata. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTHASTEXTMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_AUTHOR_UPDATE_AFTER_TRIGGER = SqlStatement(
+    "FTS_CREATE_AUTHOR_UPDATE_AFTER_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS update_author_full_text_after_trigger
+    AFTER UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+    WHEN (NEW.document_uuid IS NOT OLD.document_uuid
+            OR NEW.metadata_uuid IS NOT OLD.metadata_uuid)
+        AND 'author' IN (SELECT name FROM TextMetadata
+            WHERE uuid IN (OLD.metadata_uuid, NEW.metadata_uuid))
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (OLD.document_uuid, NEW.document_uuid);
+END;""",
+    doc=f"""Trigger to index the full text of the documents of an author link again after the link is moved. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_DOCUMENTHASTEXTMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_AUTHOR_METADATA_UPDATE_TRIGGER = SqlStatement(
+    "FTS_CREATE_AUTHOR_METADATA_UPDATE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS update_author_metadata_full_text_trigger
+    AFTER UPDATE OF name, data ON TextMetadata
+    WHEN (NEW.name IS NOT OLD.name OR NEW.data IS NOT OLD.data)
+        AND 'author' IN (OLD.name, NEW.name)
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (
+                    CASE WHEN tm.uuid = OLD.uuid THEN OLD.data ELSE tm.data END,
+                    '\\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND CASE WHEN tm.uuid = OLD.uuid THEN OLD.name ELSE tm.name END = 'author'),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = NEW.uuid);
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = NEW.uuid);
+END;""",
+    doc=f"""Trigger to reindex the full text of the documents of an author after the author's name is edited, or after text metadata becomes or stops being an author. The entries are removed with the old value in place of the new one. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_TEXTMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_TEXT_METADATA,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
+)
+
+FTS_CREATE_AUTHOR_METADATA_DELETE_TRIGGER = SqlStatement(
+    "FTS_CREATE_AUTHOR_METADATA_DELETE_TRIGGER",
+    """CREATE TRIGGER IF NOT EXISTS delete_author_metadata_full_text_trigger
+    BEFORE DELETE ON TextMetadata
+    WHEN OLD.name = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = OLD.uuid);
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND tm.uuid <> OLD.uuid),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = OLD.uuid);
+END;""",
+    doc=f"""Trigger to reindex the full text of the documents of an author before the author is deleted, with the authors they will have without it. Its links are deleted by a foreign key action after the author is gone, when <var>delete_author_full_text_trigger</var> can no longer tell they are author links. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_delete_command")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[
+        FTS_CREATE_TABLE,
+        CREATE_TEXTMETADATA,
+        CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
+        CREATE_INDEX_HAS_TEXT_METADATA,
+        CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    ],
 )
 
 FTS_REBUILD = SqlStatement(
@@ -382,6 +842,733 @@ FTS_SEARCH = SqlStatement(
     dependencies=[FTS_CREATE_TABLE],
 )
 
+CREATE_TRIGRAM_ROWS = SqlStatement(
+    "CREATE_TRIGRAM_ROWS",
+    """CREATE TABLE IF NOT EXISTS "metadata_trigram_rows" (
+        "id" INTEGER NOT NULL PRIMARY KEY,
+        "uuid" CHARACTER(32) NOT NULL UNIQUE
+);""",
+    doc=f"""Integer keys of the rows of the optional <var>metadata_trigram_fts</var> index, one per document, text metadata and binary metadata. These tables have no integer primary key, and their <var>rowid</var> can change on <code>VACUUM</code>, so the index can't use it.""",
+    kind=(StatementKind.TABLE | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTS, CREATE_TEXTMETADATA, CREATE_BINARYMETADATA],
+)
+
+CREATE_VIEW_METADATA_TRIGRAM = SqlStatement(
+    "CREATE_VIEW_METADATA_TRIGRAM",
+    """CREATE VIEW IF NOT EXISTS metadata_trigram_view (id, uuid, data) AS
+SELECT
+    r.id, r.uuid, d.title
+FROM
+    metadata_trigram_rows AS r
+    JOIN Documents AS d ON d.uuid = r.uuid
+UNION ALL
+SELECT
+    r.id, r.uuid, tm.data
+FROM
+    metadata_trigram_rows AS r
+    JOIN TextMetadata AS tm ON tm.uuid = r.uuid
+UNION ALL
+SELECT
+    r.id, r.uuid, bm.name
+FROM
+    metadata_trigram_rows AS r
+    JOIN BinaryMetadata AS bm ON bm.uuid = r.uuid;""",
+    doc=f"""Content of the <var>metadata_trigram_fts</var> index: the title of each document, the value of each text metadata and the name of each binary metadata. {sqlite3_reference_href("https://sqlite.org/lang_createview.html",text="for creating views")}""",
+    kind=StatementKind.VIEW,
+    callable_=True,
+    dependencies=[
+        CREATE_TRIGRAM_ROWS,
+        CREATE_DOCUMENTS,
+        CREATE_TEXTMETADATA,
+        CREATE_BINARYMETADATA,
+    ],
+)
+
+TRIGRAM_CREATE_TABLE = SqlStatement(
+    "TRIGRAM_CREATE_TABLE",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS metadata_trigram_fts
+    USING fts5(data, content='metadata_trigram_view', content_rowid='id',
+        tokenize='trigram')""",
+    doc=f"""Create an optional index of titles, text metadata values and binary metadata names with the <em>trigram</em> tokenizer (SQLite 3.34 and later). Querying it with a phrase finds values that contain the phrase anywhere, like <code>LIKE '%phrase%'</code> does with a full scan, as long as the phrase is at least three characters long. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_trigram_tokenizer")}""",
+    kind=(StatementKind.INDEX | StatementKind.TABLE),
+    callable_=True,
+    dependencies=[CREATE_VIEW_METADATA_TRIGRAM],
+)
+
+TRIGRAM_REBUILD_ROWS = SqlStatement(
+    "TRIGRAM_REBUILD_ROWS",
+    """INSERT OR IGNORE INTO metadata_trigram_rows (uuid)
+    SELECT uuid FROM Documents UNION ALL SELECT uuid FROM TextMetadata
+    UNION ALL SELECT uuid FROM BinaryMetadata""",
+    doc="Add the missing <var>metadata_trigram_rows</var>. Use this, and then <code>TRIGRAM_REBUILD</code>, after creating the index in an existing database.",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_TRIGRAM_ROWS],
+)
+
+TRIGRAM_REBUILD = SqlStatement(
+    "TRIGRAM_REBUILD",
+    """INSERT INTO metadata_trigram_fts(metadata_trigram_fts) VALUES('rebuild')""",
+    doc=f"""Rebuild the <var>metadata_trigram_fts</var> index from its content. {sqlite3_reference_href("https://sqlite.org/fts5.html#the_rebuild_command")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE],
+)
+
+TRIGRAM_DOCUMENTS_INSERT = SqlStatement(
+    "TRIGRAM_DOCUMENTS_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_doc_it
+    AFTER INSERT ON Documents
+BEGIN
+    INSERT OR IGNORE INTO metadata_trigram_rows (uuid) VALUES (NEW.uuid);
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.title FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Index new document titles in <var>metadata_trigram_fts</var>. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_DOCUMENTS],
+)
+
+TRIGRAM_DOCUMENTS_UPDATE = SqlStatement(
+    "TRIGRAM_DOCUMENTS_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_doc_ut
+    AFTER UPDATE OF title ON Documents
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.title FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.title FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Reindex changed document titles in <var>metadata_trigram_fts</var>. The old value is removed from the index with the <code>OLD</code> row, since the view already returns the new one. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_DOCUMENTS],
+)
+
+TRIGRAM_DOCUMENTS_DELETE = SqlStatement(
+    "TRIGRAM_DOCUMENTS_DELETE",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_doc_dt
+    AFTER DELETE ON Documents
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.title FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    DELETE FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+END;""",
+    doc=f"""Remove deleted document titles from <var>metadata_trigram_fts</var>. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_DOCUMENTS],
+)
+
+TRIGRAM_TEXTMETADATA_INSERT = SqlStatement(
+    "TRIGRAM_TEXTMETADATA_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_tm_it
+    AFTER INSERT ON TextMetadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_trigram_rows (uuid) VALUES (NEW.uuid);
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.data FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Index new text metadata values in <var>metadata_trigram_fts</var>. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_TEXTMETADATA],
+)
+
+TRIGRAM_TEXTMETADATA_UPDATE = SqlStatement(
+    "TRIGRAM_TEXTMETADATA_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_tm_ut
+    AFTER UPDATE OF data ON TextMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.data FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.data FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Reindex changed text metadata values in <var>metadata_trigram_fts</var>. The old value is removed from the index with the <code>OLD</code> row, since the view already returns the new one. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_TEXTMETADATA],
+)
+
+TRIGRAM_TEXTMETADATA_DELETE = SqlStatement(
+    "TRIGRAM_TEXTMETADATA_DELETE",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_tm_dt
+    AFTER DELETE ON TextMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.data FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    DELETE FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+END;""",
+    doc=f"""Remove deleted text metadata values from <var>metadata_trigram_fts</var>. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_TEXTMETADATA],
+)
+
+TRIGRAM_BINARYMETADATA_INSERT = SqlStatement(
+    "TRIGRAM_BINARYMETADATA_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_bm_it
+    AFTER INSERT ON BinaryMetadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_trigram_rows (uuid) VALUES (NEW.uuid);
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.name FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Index new binary metadata names in <var>metadata_trigram_fts</var>. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_BINARYMETADATA],
+)
+
+TRIGRAM_BINARYMETADATA_UPDATE = SqlStatement(
+    "TRIGRAM_BINARYMETADATA_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_bm_ut
+    AFTER UPDATE OF name ON BinaryMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.name FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.name FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Reindex changed binary metadata names in <var>metadata_trigram_fts</var>. The old value is removed from the index with the <code>OLD</code> row, since the view already returns the new one. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_BINARYMETADATA],
+)
+
+TRIGRAM_BINARYMETADATA_DELETE = SqlStatement(
+    "TRIGRAM_BINARYMETADATA_DELETE",
+    """CREATE TRIGGER IF NOT EXISTS metadata_trigram_bm_dt
+    AFTER DELETE ON BinaryMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.name FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    DELETE FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+END;""",
+    doc=f"""Remove deleted binary metadata names from <var>metadata_trigram_fts</var>. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[TRIGRAM_CREATE_TABLE, CREATE_TRIGRAM_ROWS, CREATE_BINARYMETADATA],
+)
+
+CREATE_THUMBNAIL_COLOR = SqlStatement(
+    "CREATE_THUMBNAIL_COLOR",
+    """CREATE TABLE IF NOT EXISTS "thumbnail_color" (
+        "metadata_uuid" CHARACTER(32) NOT NULL PRIMARY KEY REFERENCES "BinaryMetadata" ("uuid") ON DELETE CASCADE,
+        "color" TEXT NOT NULL -- #rrggbb
+) WITHOUT ROWID;""",
+    doc=f"""Average colour of each thumbnail, keyed by the thumbnail's binary metadata, so that listings can tint a card without decoding the image. {sqlite3_reference_href("https://sqlite.org/withoutrowid.html", text="for WITHOUT ROWID tables")}""",
+    kind=StatementKind.TABLE,
+    callable_=True,
+    dependencies=[CREATE_BINARYMETADATA],
+)
+
+THUMBNAIL_COLOR_FROM_TEXT_METADATA = SqlStatement(
+    "THUMBNAIL_COLOR_FROM_TEXT_METADATA",
+    """INSERT OR IGNORE INTO thumbnail_color (metadata_uuid, color)
+SELECT
+    bhas.metadata_uuid, tm.data
+FROM
+    DocumentHasTextMetadata AS thas
+    JOIN TextMetadata AS tm ON thas.metadata_uuid = tm.uuid
+    JOIN DocumentHasBinaryMetadata AS bhas ON bhas.document_uuid = thas.document_uuid
+WHERE
+    tm.name = 'thumbnail-color'
+    AND bhas.name = 'thumbnail';""",
+    doc=f"""Copy thumbnail colours stored as <code>thumbnail-color</code> text metadata of documents into <var>thumbnail_color</var>.""",
+    kind=StatementKind.QUERY,
+    callable_=True,
+    dependencies=[CREATE_THUMBNAIL_COLOR, CREATE_TEXTMETADATA],
+)
+
+CREATE_DOCUMENT_SUMMARY = SqlStatement(
+    "CREATE_DOCUMENT_SUMMARY",
+    """CREATE TABLE IF NOT EXISTS "document_summary" (
+        "uuid" CHARACTER(32) NOT NULL PRIMARY KEY,
+        "title" TEXT NOT NULL,
+        "authors" TEXT NULL, -- separated by char(31)
+        "tags" TEXT NULL, -- separated by char(31)
+        "type" TEXT NULL,
+        "thumbnail_uuid" CHARACTER(32) NULL,
+        "thumbnail_color" TEXT NULL,
+        "formats" TEXT NULL, -- separated by char(31)
+        "files_no" INTEGER NOT NULL DEFAULT (0),
+        "linked_files_no" INTEGER NOT NULL DEFAULT (0),
+        "embedded_size" INTEGER NOT NULL DEFAULT (0)
+);""",
+    doc=f"""Optional materialized summary of each document: everything a collection listing shows, in one narrow row. Lists are separated by the <code>char(31)</code> unit separator. It is kept up to date by the <code>DOCUMENT_SUMMARY_*</code> triggers; run <code>DOCUMENT_SUMMARY_REBUILD</code> to fill it for an existing database. Linked files live outside the database so only their number is stored, not their size.""",
+    kind=(StatementKind.TABLE | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTS],
+)
+
+CREATE_DOCUMENT_SUMMARY_VIEW = SqlStatement(
+    "CREATE_DOCUMENT_SUMMARY_VIEW",
+    """CREATE VIEW IF NOT EXISTS document_summary_view AS
+SELECT
+    d.uuid AS uuid,
+    d.title AS title,
+    (SELECT GROUP_CONCAT(data, char(31)) FROM (SELECT tm.data AS data
+            FROM DocumentHasTextMetadata AS has
+            JOIN TextMetadata AS tm ON has.metadata_uuid = tm.uuid
+            WHERE has.document_uuid = d.uuid AND tm.name = 'author'
+            ORDER BY has.id)) AS authors,
+    (SELECT GROUP_CONCAT(data, char(31)) FROM (SELECT tm.data AS data
+            FROM DocumentHasTextMetadata AS has
+            JOIN TextMetadata AS tm ON has.metadata_uuid = tm.uuid
+            WHERE has.document_uuid = d.uuid AND tm.name = 'tag'
+            ORDER BY has.id)) AS tags,
+    (SELECT tm.data
+        FROM DocumentHasTextMetadata AS has
+        JOIN TextMetadata AS tm ON has.metadata_uuid = tm.uuid
+        WHERE has.document_uuid = d.uuid AND tm.name = 'type'
+        ORDER BY has.id LIMIT 1) AS type,
+    (SELECT has.metadata_uuid
+        FROM DocumentHasBinaryMetadata AS has
+        WHERE has.document_uuid = d.uuid AND has.name = 'thumbnail'
+        ORDER BY has.id DESC LIMIT 1) AS thumbnail_uuid,
+    (SELECT tc.color
+        FROM DocumentHasBinaryMetadata AS has
+        JOIN thumbnail_color AS tc ON has.metadata_uuid = tc.metadata_uuid
+        WHERE has.document_uuid = d.uuid AND has.name = 'thumbnail'
+        ORDER BY has.id DESC LIMIT 1) AS thumbnail_color,
+    (SELECT GROUP_CONCAT(suffix, char(31)) FROM (SELECT
+            replace(filename, rtrim(filename, replace(filename, '.', '')), '') AS suffix
+            FROM (SELECT CASE WHEN bm.name = 'path'
+                    THEN CAST(bm.data AS TEXT)
+                    ELSE json_extract(bm.name, '$.filename') END AS filename
+                FROM DocumentHasBinaryMetadata AS has
+                JOIN BinaryMetadata AS bm ON has.metadata_uuid = bm.uuid
+                WHERE has.document_uuid = d.uuid AND has.name = 'storage'
+                AND (bm.name = 'path' OR json_valid(bm.name))
+                ORDER BY has.id)
+            WHERE instr(filename, '.') > 0 AND instr(suffix, '/') = 0
+            AND length(suffix) > 0)) AS formats,
+    (SELECT COUNT(*)
+        FROM DocumentHasBinaryMetadata AS has
+        WHERE has.document_uuid = d.uuid AND has.name = 'storage') AS files_no,
+    (SELECT COUNT(*)
+        FROM DocumentHasBinaryMetadata AS has
+        JOIN BinaryMetadata AS bm ON has.metadata_uuid = bm.uuid
+        WHERE has.document_uuid = d.uuid AND has.name = 'storage'
+        AND bm.name = 'path') AS linked_files_no,
+    (SELECT IFNULL(SUM(CAST(json_extract(bm.name, '$.size') AS INTEGER)), 0)
+        FROM DocumentHasBinaryMetadata AS has
+        JOIN BinaryMetadata AS bm ON has.metadata_uuid = bm.uuid
+        WHERE has.document_uuid = d.uuid AND has.name = 'storage'
+        AND bm.name != 'path' AND json_valid(bm.name)) AS embedded_size
+FROM
+    Documents AS d;""",
+    doc=f"""Computes the rows of <var>document_summary</var>. Selecting a single <var>uuid</var> from it only looks at that document's metadata. The size of embedded files is the uncompressed size recorded in their name, not the length of the stored blob. {sqlite3_reference_href("https://sqlite.org/lang_createview.html",text="for creating views")}""",
+    kind=StatementKind.VIEW,
+    callable_=True,
+    dependencies=[
+        CREATE_DOCUMENTS,
+        CREATE_DOCUMENTHASTEXTMETADATA,
+        CREATE_DOCUMENTHASBINARYMETADATA,
+        CREATE_THUMBNAIL_COLOR,
+    ],
+)
+
+BINARYMETADATA_ADD_SHA256 = SqlStatement(
+    "BINARYMETADATA_ADD_SHA256",
+    """ALTER TABLE "BinaryMetadata" ADD COLUMN "sha256" CHARACTER(64) NULL;""",
+    doc=f"""Add the <var>sha256</var> column to databases created before it existed. It holds the hex SHA-256 digest of <var>data</var>, or <code>NULL</code> if it hasn't been computed yet. {sqlite3_reference_href("https://sqlite.org/lang_altertable.html", text="for altering tables")}""",
+    kind=StatementKind.QUERY,
+    callable_=True,
+    dependencies=[CREATE_BINARYMETADATA],
+)
+
+CREATE_INDEX_BINARYMETADATA_SHA256 = SqlStatement(
+    "CREATE_INDEX_BINARYMETADATA_SHA256",
+    """CREATE INDEX IF NOT EXISTS binary_metadata_sha256_idx
+    ON BinaryMetadata(sha256)""",
+    doc=f"""Index binary metadata by content digest, to find an existing copy of a file without comparing blobs. {sqlite3_reference_href("https://sqlite.org/lang_createindex.html", text="for creating indexes")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_BINARYMETADATA],
+)
+
+BINARYMETADATA_SHA256_RESET = SqlStatement(
+    "BINARYMETADATA_SHA256_RESET",
+    """CREATE TRIGGER IF NOT EXISTS binary_metadata_sha256_reset
+AFTER UPDATE OF data ON BinaryMetadata
+WHEN NEW.sha256 IS NOT NULL AND NEW.sha256 IS OLD.sha256 AND NEW.data IS NOT OLD.data
+BEGIN
+  UPDATE BinaryMetadata SET sha256 = NULL WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Forget the digest of a blob changed by a client that doesn't compute digests. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=StatementKind.TRIGGER,
+    callable_=True,
+    dependencies=[CREATE_BINARYMETADATA],
+)
+
+DOCUMENT_SUMMARY_REBUILD = SqlStatement(
+    "DOCUMENT_SUMMARY_REBUILD",
+    """REPLACE INTO document_summary SELECT * FROM document_summary_view""",
+    doc="Recompute every row of <var>document_summary</var>. Use this after creating the table in an existing database.",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+
+DOCUMENT_SUMMARY_DOCUMENTS_INSERT = SqlStatement(
+    "DOCUMENT_SUMMARY_DOCUMENTS_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_doc_it
+    AFTER INSERT ON Documents
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Add a <var>document_summary</var> row for new documents. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_DOCUMENTS_UPDATE = SqlStatement(
+    "DOCUMENT_SUMMARY_DOCUMENTS_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_doc_ut
+    AFTER UPDATE OF title ON Documents
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when a document's title changes. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_DOCUMENTS_DELETE = SqlStatement(
+    "DOCUMENT_SUMMARY_DOCUMENTS_DELETE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_doc_dt
+    AFTER DELETE ON Documents
+BEGIN
+    DELETE FROM document_summary WHERE uuid = OLD.uuid;
+END;""",
+    doc=f"""Remove the <var>document_summary</var> row of deleted documents. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_HAS_TEXT_INSERT = SqlStatement(
+    "DOCUMENT_SUMMARY_HAS_TEXT_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_has_text_it
+    AFTER INSERT ON DocumentHasTextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when text metadata is added to a document. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_HAS_TEXT_UPDATE = SqlStatement(
+    "DOCUMENT_SUMMARY_HAS_TEXT_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_has_text_ut
+    AFTER UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when text metadata of a document is replaced. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_HAS_TEXT_DELETE = SqlStatement(
+    "DOCUMENT_SUMMARY_HAS_TEXT_DELETE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_has_text_dt
+    AFTER DELETE ON DocumentHasTextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when text metadata is removed from a document. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_HAS_BINARY_INSERT = SqlStatement(
+    "DOCUMENT_SUMMARY_HAS_BINARY_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_has_binary_it
+    AFTER INSERT ON DocumentHasBinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when binary metadata is added to a document. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_HAS_BINARY_UPDATE = SqlStatement(
+    "DOCUMENT_SUMMARY_HAS_BINARY_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_has_binary_ut
+    AFTER UPDATE OF name, document_uuid, metadata_uuid ON DocumentHasBinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when binary metadata of a document is replaced. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_HAS_BINARY_DELETE = SqlStatement(
+    "DOCUMENT_SUMMARY_HAS_BINARY_DELETE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_has_binary_dt
+    AFTER DELETE ON DocumentHasBinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+END;""",
+    doc=f"""Update <var>document_summary</var> when binary metadata is removed from a document. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_TEXTMETADATA_UPDATE = SqlStatement(
+    "DOCUMENT_SUMMARY_TEXTMETADATA_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_text_ut
+    AFTER UPDATE OF name, data ON TextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasTextMetadata WHERE metadata_uuid = NEW.uuid);
+END;""",
+    doc=f"""Update the <var>document_summary</var> rows of all documents that have a modified text metadata, e.g. a renamed tag. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+DOCUMENT_SUMMARY_THUMBNAIL_COLOR_INSERT = SqlStatement(
+    "DOCUMENT_SUMMARY_THUMBNAIL_COLOR_INSERT",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_thumbnail_color_it
+    AFTER INSERT ON thumbnail_color
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasBinaryMetadata WHERE metadata_uuid = NEW.metadata_uuid);
+END;""",
+    doc=f"""Update the <var>document_summary</var> rows of the documents of a thumbnail when its colour is stored. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW, CREATE_THUMBNAIL_COLOR],
+)
+
+DOCUMENT_SUMMARY_THUMBNAIL_COLOR_UPDATE = SqlStatement(
+    "DOCUMENT_SUMMARY_THUMBNAIL_COLOR_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_thumbnail_color_ut
+    AFTER UPDATE OF color ON thumbnail_color
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasBinaryMetadata WHERE metadata_uuid = NEW.metadata_uuid);
+END;""",
+    doc=f"""Update the <var>document_summary</var> rows of the documents of a thumbnail when its colour changes. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW, CREATE_THUMBNAIL_COLOR],
+)
+
+DOCUMENT_SUMMARY_BINARYMETADATA_UPDATE = SqlStatement(
+    "DOCUMENT_SUMMARY_BINARYMETADATA_UPDATE",
+    """CREATE TRIGGER IF NOT EXISTS document_summary_binary_ut
+    AFTER UPDATE OF name, data ON BinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasBinaryMetadata WHERE metadata_uuid = NEW.uuid);
+END;""",
+    doc=f"""Update the <var>document_summary</var> rows of all documents that have a modified binary metadata, e.g. a replaced file. {sqlite3_reference_href("https://sqlite.org/lang_createtrigger.html", text="for creating triggers")}""",
+    kind=(StatementKind.TRIGGER | StatementKind.INDEX),
+    callable_=True,
+    dependencies=[CREATE_DOCUMENT_SUMMARY, CREATE_DOCUMENT_SUMMARY_VIEW],
+)
+
+CREATE_JOBS = SqlStatement(
+    "CREATE_JOBS",
+    """CREATE TABLE IF NOT EXISTS "jobs" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        "kind" TEXT NOT NULL, -- 'index' or 'thumbnail'
+        "document_uuid" CHARACTER(32) NOT NULL REFERENCES "Documents" ("uuid") ON DELETE CASCADE,
+        "state" TEXT NOT NULL DEFAULT ('queued') CHECK ("state" IN ('queued', 'running', 'done', 'failed')),
+        "attempts" INTEGER NOT NULL DEFAULT (0),
+        "last_error" TEXT NULL,
+        "not_before" DATETIME NOT NULL DEFAULT (datetime ('now')),
+        "created" DATETIME NOT NULL DEFAULT (datetime ('now')),
+        "started" DATETIME NULL,
+        "finished" DATETIME NULL,
+        "owner" TEXT NULL, -- 'hostname:pid' of the process running the job
+        "heartbeat" DATETIME NULL,
+        UNIQUE ("kind", "document_uuid")
+);""",
+    doc=f"""Persistent queue of background work (full-text extraction and thumbnail generation), one row per kind of work and document. Jobs that fail are retried after <var>not_before</var> until they run out of attempts. A running job records the process that claimed it in <var>owner</var>, which refreshes <var>heartbeat</var> while it works.""",
+    kind=StatementKind.TABLE,
+    callable_=True,
+    dependencies=[CREATE_DOCUMENTS],
+)
+
+JOBS_ADD_OWNER = SqlStatement(
+    "JOBS_ADD_OWNER",
+    """ALTER TABLE "jobs" ADD COLUMN "owner" TEXT NULL;""",
+    doc=f"""Add the <var>owner</var> column to job tables created before it existed. {sqlite3_reference_href("https://sqlite.org/lang_altertable.html", text="for altering tables")}""",
+    kind=StatementKind.QUERY,
+    callable_=True,
+    dependencies=[CREATE_JOBS],
+)
+
+JOBS_ADD_HEARTBEAT = SqlStatement(
+    "JOBS_ADD_HEARTBEAT",
+    """ALTER TABLE "jobs" ADD COLUMN "heartbeat" DATETIME NULL;""",
+    doc=f"""Add the <var>heartbeat</var> column to job tables created before it existed. {sqlite3_reference_href("https://sqlite.org/lang_altertable.html", text="for altering tables")}""",
+    kind=StatementKind.QUERY,
+    callable_=True,
+    dependencies=[CREATE_JOBS],
+)
+
+CREATE_INDEX_JOBS_QUEUE = SqlStatement(
+    "CREATE_INDEX_JOBS_QUEUE",
+    """CREATE INDEX IF NOT EXISTS "jobs_queue_idx" ON "jobs" ("state", "kind", "not_before");""",
+    doc=f"""Index for claiming the next queued job of a kind. {sqlite3_reference_href("https://sqlite.org/lang_createindex.html", text="for creating indexes")}""",
+    kind=StatementKind.INDEX,
+    callable_=True,
+    dependencies=[CREATE_JOBS],
+)
+
+JOBS_ENQUEUE = SqlStatement(
+    "JOBS_ENQUEUE",
+    """INSERT INTO jobs (kind, document_uuid) VALUES (%s, %s)
+    ON CONFLICT (kind, document_uuid) DO UPDATE SET
+        state = 'queued',
+        attempts = 0,
+        last_error = NULL,
+        not_before = datetime ('now'),
+        started = NULL,
+        finished = NULL
+    WHERE state IN ('done', 'failed');""",
+    doc=f"""Queue a job, or queue it again if it has finished. Jobs that are already queued or running are left alone. {sqlite3_reference_href("https://sqlite.org/lang_upsert.html", text="for upserts")}""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_JOBS],
+)
+
+JOBS_CLAIM = SqlStatement(
+    "JOBS_CLAIM",
+    """UPDATE jobs SET
+        state = 'running',
+        attempts = attempts + 1,
+        started = datetime ('now'),
+        owner = %s,
+        heartbeat = datetime ('now')
+    WHERE id = (SELECT id FROM jobs
+        WHERE state = 'queued' AND kind = %s
+        AND not_before <= datetime ('now')
+        ORDER BY not_before, id LIMIT 1)
+    RETURNING id, document_uuid, attempts;""",
+    doc=f"""Atomically claim the next queued job of a kind for an owner. Since it is a single statement, two workers can never claim the same job. {sqlite3_reference_href("https://sqlite.org/lang_returning.html", text="for the RETURNING clause")}""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_JOBS, CREATE_INDEX_JOBS_QUEUE],
+)
+
+JOBS_DONE = SqlStatement(
+    "JOBS_DONE",
+    """UPDATE jobs SET
+        state = 'done',
+        last_error = NULL,
+        finished = datetime ('now')
+    WHERE id = %s;""",
+    doc=f"""Mark a claimed job as done.""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_JOBS],
+)
+
+JOBS_FAIL = SqlStatement(
+    "JOBS_FAIL",
+    """UPDATE jobs SET
+        state = CASE WHEN attempts < %s THEN 'queued' ELSE 'failed' END,
+        last_error = %s,
+        not_before = datetime ('now', '+' || %s || ' seconds'),
+        finished = datetime ('now')
+    WHERE id = %s;""",
+    doc=f"""Record the error of a claimed job and queue it again after a backoff in seconds, unless it has used up its attempts.""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_JOBS],
+)
+
+JOBS_HEARTBEAT = SqlStatement(
+    "JOBS_HEARTBEAT",
+    """UPDATE jobs SET heartbeat = datetime ('now')
+    WHERE state = 'running' AND owner = %s;""",
+    doc=f"""Record that an owner is still working on its running jobs.""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_JOBS],
+)
+
+JOBS_REQUEUE_RUNNING = SqlStatement(
+    "JOBS_REQUEUE_RUNNING",
+    """UPDATE jobs SET
+        state = 'queued',
+        attempts = max(attempts - 1, 0),
+        started = NULL,
+        owner = NULL,
+        heartbeat = NULL
+    WHERE state = 'running' AND (
+        owner = %s
+        OR heartbeat IS NULL
+        OR heartbeat < datetime ('now', '-' || %s || ' seconds'));""",
+    doc=f"""Put the running jobs of an owner that were interrupted (e.g. by a stop), and running jobs whose owner hasn't sent a heartbeat for a number of seconds (e.g. after a restart or a crash), back in the queue, without counting the interrupted attempt. Jobs of other processes that are still alive are left alone.""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_JOBS],
+)
+
+CREATE_PDF_PAGE_TEXT = SqlStatement(
+    "CREATE_PDF_PAGE_TEXT",
+    """CREATE TABLE IF NOT EXISTS "pdf_page_text" (
+        "metadata_uuid" CHARACTER(32) NOT NULL REFERENCES "BinaryMetadata" ("uuid") ON DELETE CASCADE,
+        "page" INTEGER NOT NULL, -- numbered from 1
+        "text" TEXT NOT NULL,
+        PRIMARY KEY ("metadata_uuid", "page")
+) WITHOUT ROWID;""",
+    doc=f"""Text extracted from each page of a PDF file, keyed by the binary metadata of the file. Extraction of a big PDF is split in ranges of pages; pages already in this table are not extracted again when an interrupted extraction is retried. The pages of a file are deleted once its full text is stored. {sqlite3_reference_href("https://sqlite.org/withoutrowid.html", text="for WITHOUT ROWID tables")}""",
+    kind=StatementKind.TABLE,
+    callable_=True,
+    dependencies=[CREATE_BINARYMETADATA],
+)
+
+PDF_PAGE_TEXT_INSERT = SqlStatement(
+    "PDF_PAGE_TEXT_INSERT",
+    """INSERT OR REPLACE INTO pdf_page_text (metadata_uuid, page, text) VALUES (%s, %s, %s);""",
+    doc=f"""Store the text of a page.""",
+    kind=StatementKind.QUERY,
+    callable_=False,
+    dependencies=[CREATE_PDF_PAGE_TEXT],
+)
+
 """ Example query:
     SELECT DISTINCT token FROM uuidtok WHERE input=(SELECT data FROM
     BinaryMetadata WHERE uuid = '17ee75452e574e03b0b8e4ef2bc9be25') AND
@@ -894,9 +2081,88 @@ CORE_SCHEMA = [
 ]
 FTS_SCHEMA = [
     CREATE_VIEW_DOCUMENTS_TITLE_AUTHORS,
+    CREATE_INDEX_HAS_TEXT_DOCUMENT,
+    CREATE_INDEX_HAS_TEXT_METADATA,
+    CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    CREATE_INDEX_HAS_BINARY_METADATA,
+    CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT,
     FTS_CREATE_TABLE,
     FTS_CREATE_INSERT_TRIGGER,
     FTS_CREATE_DELETE_TRIGGER,
+    FTS_CREATE_DOCUMENT_DELETE_TRIGGER,
+    FTS_CREATE_METADATA_DELETE_TRIGGER,
+    FTS_CREATE_UPDATE_BEFORE_TRIGGER,
+    FTS_CREATE_UPDATE_AFTER_TRIGGER,
+    FTS_CREATE_TITLE_UPDATE_TRIGGER,
+    FTS_CREATE_AUTHOR_INSERT_TRIGGER,
+    FTS_CREATE_AUTHOR_DELETE_TRIGGER,
+    FTS_CREATE_AUTHOR_UPDATE_BEFORE_TRIGGER,
+    FTS_CREATE_AUTHOR_UPDATE_AFTER_TRIGGER,
+    FTS_CREATE_AUTHOR_METADATA_UPDATE_TRIGGER,
+    FTS_CREATE_AUTHOR_METADATA_DELETE_TRIGGER,
+]
+
+# Triggers of the full-text index before it read its content from
+# `document_title_authors_text_view`, dropped when migrating.
+FTS_LEGACY_TRIGGERS = [
+    "insert_full_text_trigger",
+    "delete_full_text_trigger",
+]
+
+SUMMARY_SCHEMA = [
+    CREATE_INDEX_HAS_TEXT_DOCUMENT,
+    CREATE_INDEX_HAS_TEXT_METADATA,
+    CREATE_INDEX_HAS_BINARY_DOCUMENT,
+    CREATE_INDEX_HAS_BINARY_METADATA,
+    CREATE_THUMBNAIL_COLOR,
+    CREATE_DOCUMENT_SUMMARY,
+    CREATE_DOCUMENT_SUMMARY_VIEW,
+    DOCUMENT_SUMMARY_DOCUMENTS_INSERT,
+    DOCUMENT_SUMMARY_DOCUMENTS_UPDATE,
+    DOCUMENT_SUMMARY_DOCUMENTS_DELETE,
+    DOCUMENT_SUMMARY_HAS_TEXT_INSERT,
+    DOCUMENT_SUMMARY_HAS_TEXT_UPDATE,
+    DOCUMENT_SUMMARY_HAS_TEXT_DELETE,
+    DOCUMENT_SUMMARY_HAS_BINARY_INSERT,
+    DOCUMENT_SUMMARY_HAS_BINARY_UPDATE,
+    DOCUMENT_SUMMARY_HAS_BINARY_DELETE,
+    DOCUMENT_SUMMARY_TEXTMETADATA_UPDATE,
+    DOCUMENT_SUMMARY_BINARYMETADATA_UPDATE,
+    DOCUMENT_SUMMARY_THUMBNAIL_COLOR_INSERT,
+    DOCUMENT_SUMMARY_THUMBNAIL_COLOR_UPDATE,
+]
+
+TRIGRAM_SCHEMA = [
+    CREATE_TRIGRAM_ROWS,
+    CREATE_VIEW_METADATA_TRIGRAM,
+    TRIGRAM_CREATE_TABLE,
+    TRIGRAM_DOCUMENTS_INSERT,
+    TRIGRAM_DOCUMENTS_UPDATE,
+    TRIGRAM_DOCUMENTS_DELETE,
+    TRIGRAM_TEXTMETADATA_INSERT,
+    TRIGRAM_TEXTMETADATA_UPDATE,
+    TRIGRAM_TEXTMETADATA_DELETE,
+    TRIGRAM_BINARYMETADATA_INSERT,
+    TRIGRAM_BINARYMETADATA_UPDATE,
+    TRIGRAM_BINARYMETADATA_DELETE,
+]
+
+JOBS_SCHEMA = [
+    CREATE_JOBS,
+    CREATE_INDEX_JOBS_QUEUE,
+]
+
+SHA256_SCHEMA = [
+    CREATE_INDEX_BINARYMETADATA_SHA256,
+    BINARYMETADATA_SHA256_RESET,
+]
+
+THUMBNAIL_COLOR_SCHEMA = [
+    CREATE_THUMBNAIL_COLOR,
+]
+
+PDF_PAGE_TEXT_SCHEMA = [
+    CREATE_PDF_PAGE_TEXT,
 ]
 
 UNDO_SCHEMA = [
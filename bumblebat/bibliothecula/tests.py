@@ -0,0 +1,494 @@
+import concurrent.futures
+import hashlib
+import tempfile
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.datastructures import MultiValueDict
+
+from . import *
+from . import sql_statements
+from .background_tasks import save_pdf_job_result
+from .forms import ImportDocumentsForm
+from .import_staging import stage_uploads, staged_texts
+from .middleware import SchemaUpgradeMiddleware
+from .models import (
+    BinaryMetadata,
+    Document,
+    DocumentHasBinaryMetadata,
+    DocumentHasTextMetadata,
+    ImportEntry,
+    Job,
+    TextMetadata,
+    ThumbnailColor,
+    build_full_text_index,
+    bulk_import_documents,
+    cache_pdf_pages,
+    cached_pdf_pages,
+    claim_job,
+    enqueue_jobs,
+    full_text_index_config,
+    full_text_index_merge_settings,
+    full_text_index_size,
+    job_owner,
+    load_document_summaries,
+    requeue_running_jobs,
+    upgrade_schema,
+)
+
+# After the star import, which brings in the `bibliothecula.settings` module
+# under the same name.
+from django.conf import settings
+
+
+def create_schema():
+    """Create the tables that aren't Django models, in the test database."""
+    with connections["bibliothecula"].cursor() as cursor:
+        upgrade_schema(cursor)
+
+
+def create_document(i):
+    doc = Document.objects.create(title=f"document {i}")
+    for name, data in [
+        (AUTHOR_NAME, f"author {i}"),
+        (AUTHOR_NAME, "common author"),
+        (TAG_NAME, f"tag {i % 3}"),
+        (TYPE_NAME, "book"),
+    ]:
+        m, _ = TextMetadata.objects.get_or_create(name=name, data=data)
+        DocumentHasTextMetadata.objects.create(name=name, document=doc, metadata=m)
+    embedded = BinaryMetadata(
+        name=BinaryMetadata.file_name(4, "application/pdf", f"document-{i}.pdf"),
+        data=f"{i:04}".encode(),
+    )
+    embedded.save(force_insert=True)
+    link = BinaryMetadata(name=PATH_NAME, data=f"/tmp/document-{i}.epub".encode())
+    link.save(force_insert=True)
+    thumbnail = BinaryMetadata(name=THUMBNAIL_NAME, data=f"thumbnail {i}".encode())
+    thumbnail.save(force_insert=True)
+    ThumbnailColor.objects.create(metadata=thumbnail, color=f"#0000{i:02}")
+    for name, m in [
+        (STORAGE_NAME, embedded),
+        (STORAGE_NAME, link),
+        (THUMBNAIL_NAME, thumbnail),
+    ]:
+        DocumentHasBinaryMetadata.objects.create(name=name, document=doc, metadata=m)
+    return doc
+
+
+class DocumentSummaryTests(TestCase):
+    databases = {"default", "bibliothecula"}
+
+    @classmethod
+    def setUpTestData(cls):
+        create_schema()
+        for i in range(20):
+            create_document(i)
+
+    def page(self, size):
+        return list(Document.objects.order_by("title")[:size])
+
+    def test_summary_queries(self):
+        # One query to look for the summary table, then one for text
+        # metadata, one for binary metadata links and one for linked paths,
+        # for any number of documents.
+        for size in [1, 5, 20]:
+            documents = self.page(size)
+            with self.assertNumQueries(4, using="bibliothecula"):
+                load_document_summaries(documents)
+        summary = documents[0].summary
+        self.assertEqual(summary.authors_list(), ["author 0", "common author"])
+        self.assertEqual(summary.tags_list(), ["tag 0"])
+        self.assertEqual(summary.formats_list(), ["pdf", "epub"])
+        self.assertEqual(summary.files_no, 2)
+        self.assertEqual(summary.linked_files_no, 1)
+        self.assertEqual(summary.embedded_size, 4)
+        self.assertEqual(summary.thumbnail[2], "#000000")
+
+    def test_summary_table_queries(self):
+        with connections["bibliothecula"].cursor() as cursor:
+            for statement in sql_statements.SUMMARY_SCHEMA:
+                cursor.execute(str(statement))
+            cursor.execute(str(sql_statements.DOCUMENT_SUMMARY_REBUILD))
+        # One query to look for the table and one to read it.
+        for size in [1, 5, 20]:
+            documents = self.page(size)
+            with self.assertNumQueries(2, using="bibliothecula"):
+                load_document_summaries(documents)
+        summary = documents[0].summary
+        self.assertEqual(summary.authors_list(), ["author 0", "common author"])
+        self.assertEqual(summary.formats_list(), ["pdf", "epub"])
+        self.assertEqual(summary.thumbnail[2], "#000000")
+        ThumbnailColor.objects.filter(metadata=summary.thumbnail_uuid).update(
+            color="#ffffff"
+        )
+        self.assertEqual(
+            load_document_summaries(self.page(1))[0].summary.thumbnail_color,
+            "#ffffff",
+        )
+
+    def test_embedded_size(self):
+        # The size recorded in the name counts, not the stored length, so
+        # that compressed files add up the same in both summaries.
+        doc = self.page(1)[0]
+        BinaryMetadata.objects.filter(
+            documents__document=doc, data=b"0000"
+        ).update(data=b"00")
+        self.assertEqual(load_document_summaries([doc])[0].summary.embedded_size, 4)
+        with connections["bibliothecula"].cursor() as cursor:
+            for statement in sql_statements.SUMMARY_SCHEMA:
+                cursor.execute(str(statement))
+            cursor.execute(str(sql_statements.DOCUMENT_SUMMARY_REBUILD))
+        self.assertEqual(load_document_summaries([doc])[0].summary.embedded_size, 4)
+
+    def test_thumbnail_color_migration(self):
+        doc = self.page(1)[0]
+        thumbnail = doc.binary_metadata.get(name=THUMBNAIL_NAME).metadata_id
+        ThumbnailColor.objects.filter(metadata=thumbnail).delete()
+        m = TextMetadata.objects.create(name=THUMBNAIL_COLOR_NAME, data="#123456")
+        DocumentHasTextMetadata.objects.create(
+            name=THUMBNAIL_COLOR_NAME, document=doc, metadata=m
+        )
+        with connections["bibliothecula"].cursor() as cursor:
+            upgrades = upgrade_schema(cursor)
+        self.assertEqual(
+            upgrades,
+            [
+                "moved 1 thumbnail colour stored as text metadata to `thumbnail_color` and removed 1 `thumbnail-color` text metadata"
+            ],
+        )
+        self.assertEqual(doc.get_thumbnail()[2], "#123456")
+        self.assertFalse(
+            TextMetadata.objects.filter(name=THUMBNAIL_COLOR_NAME).exists()
+        )
+
+
+class CollectionViewTests(TestCase):
+    databases = {"default", "bibliothecula"}
+
+    @classmethod
+    def setUpTestData(cls):
+        create_schema()
+        for i in range(20):
+            create_document(i)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "admin")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_counts_after_results(self):
+        response = self.client.get(reverse("view_collection"))
+        html = b"".join(response.streaming_content).decode()
+        count = html.index("20 of 20 documents match.")
+        self.assertLess(html.index("document 19"), count)
+
+    def test_tags_of_shown_documents(self):
+        response = self.client.get(reverse("view_collection") + "?tags=tag+0")
+        html = b"".join(response.streaming_content).decode()
+        self.assertIn("7 of 20 documents match.", html)
+        self.assertIn("tag 0", html)
+        self.assertNotIn("tag 1", html)
+
+    def test_schema_upgrade(self):
+        doc = Document.objects.get(title="document 0")
+        thumbnail = doc.binary_metadata.get(name=THUMBNAIL_NAME).metadata_id
+        ThumbnailColor.objects.filter(metadata=thumbnail).delete()
+        m = TextMetadata.objects.create(name=THUMBNAIL_COLOR_NAME, data="#123456")
+        DocumentHasTextMetadata.objects.create(
+            name=THUMBNAIL_COLOR_NAME, document=doc, metadata=m
+        )
+        self.addCleanup(setattr, SchemaUpgradeMiddleware, "schema_current", True)
+        SchemaUpgradeMiddleware.schema_current = False
+        response = self.client.get(reverse("view_collection"))
+        self.assertRedirects(response, reverse("database_index"))
+        self.assertTrue(TextMetadata.objects.filter(pk=m.pk).exists())
+        response = self.client.post(
+            reverse("database_index"), {"upgrade-schema": ""}, follow=True
+        )
+        self.assertContains(
+            response,
+            "Upgraded the schema: moved 1 thumbnail colour stored as text metadata",
+        )
+        self.assertFalse(TextMetadata.objects.filter(pk=m.pk).exists())
+        response = self.client.get(reverse("view_collection"))
+        self.assertEqual(response.status_code, 200)
+
+
+class StoredFileTests(TestCase):
+    databases = {"default", "bibliothecula"}
+
+    @classmethod
+    def setUpTestData(cls):
+        create_schema()
+
+    def test_new_file_before_links(self):
+        # An import stores all its files before linking them to documents.
+        blob = b"same contents"
+        first = BinaryMetadata.new_file(blob, len(blob), filename="a.txt")
+        second = BinaryMetadata.new_file(blob, len(blob), filename="b.txt")
+        self.assertEqual(first.uuid, second.uuid)
+        self.assertFalse(first.reused)
+        self.assertTrue(second.reused)
+        # Other binary metadata with the same contents is not a stored file.
+        BinaryMetadata.objects.filter(uuid=first.uuid).update(name=FULL_TEXT_NAME)
+        third = BinaryMetadata.new_file(blob, len(blob), filename="c.txt")
+        self.assertNotEqual(first.uuid, third.uuid)
+
+    def test_compress_stored_files(self):
+        blob = b"line of text\n" * 1000
+        self.assertFalse(
+            BinaryMetadata.new_file(blob, len(blob), None, "text/plain").compressed
+        )
+        with override_settings(COMPRESS_STORED_FILES=True):
+            m = BinaryMetadata.new_file(blob + b".", len(blob) + 1, None, "text/plain")
+            full_text = BinaryMetadata(name=FULL_TEXT_NAME, data=blob)
+            full_text.save(force_insert=True)
+        self.assertTrue(m.compressed)
+        self.assertLess(len(m.data), len(blob))
+        self.assertEqual(BinaryMetadata.objects.get(uuid=m.uuid).contents(), blob + b".")
+        self.assertFalse(full_text.compressed)
+
+    def test_large_upload(self):
+        # Bigger than FILE_UPLOAD_MAX_MEMORY_SIZE, so Django spools it to a
+        # temporary file and it is stored with incremental blob I/O.
+        blob = bytes(range(256)) * (settings.FILE_UPLOAD_MAX_MEMORY_SIZE // 256 + 1)
+        doc = Document.objects.create(title="large upload")
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        response = self.client.post(
+            reverse("add_document_storage", args=[doc.uuid.hex]),
+            {
+                "embedded": "",
+                "_file": SimpleUploadedFile("large.pdf", blob, "application/pdf"),
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        has = doc.binary_metadata.get(name=STORAGE_NAME)
+        m = BinaryMetadata.objects.get(uuid=has.metadata_id)
+        self.assertEqual(m.sha256, hashlib.sha256(blob).hexdigest())
+        self.assertEqual(m.contents(), blob)
+        self.assertEqual(m.try_get_content_type()["filename"], "large.pdf")
+
+    def test_range_request(self):
+        blob = bytes(range(256))
+        m = BinaryMetadata.new_file(
+            blob, len(blob), content_type="application/zip", filename='a "b".zip'
+        )
+        doc = Document.objects.create(title="range")
+        DocumentHasBinaryMetadata.objects.create(
+            name=STORAGE_NAME, document=doc, metadata=m
+        )
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        response = self.client.get(
+            reverse("view_document_storage", args=[doc.uuid.hex, m.uuid.hex]),
+            HTTP_RANGE="bytes=10-19",
+        )
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), blob[10:20])
+        self.assertEqual(response["Content-Range"], "bytes 10-19/256")
+        self.assertEqual(
+            response["Content-Disposition"], r'attachment; filename="a \"b\".zip"'
+        )
+
+    def test_import_multiple_files(self):
+        form = ImportDocumentsForm(
+            {},
+            MultiValueDict(
+                {
+                    "files": [
+                        SimpleUploadedFile("a.txt", b"a"),
+                        SimpleUploadedFile("b.txt", b"b"),
+                    ]
+                }
+            ),
+        )
+        self.assertTrue(form.is_valid())
+
+    def test_import_duplicates(self):
+        # One upload has the contents of a stored file, two others have the
+        # same contents as each other.
+        BinaryMetadata.new_file(b"stored", 6, filename="stored.txt")
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        files = [
+            SimpleUploadedFile("a.txt", b"stored", "text/plain"),
+            SimpleUploadedFile("b.txt", b"new", "text/plain"),
+            SimpleUploadedFile("c.txt", b"new", "text/plain"),
+        ]
+        staging_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(staging_dir.cleanup)
+        with self.settings(IMPORT_STAGING_DIR=staging_dir.name):
+            response = self.client.post(reverse("import_documents"), {"files": files})
+            self.assertRedirects(response, reverse("import_documents_2"))
+            data = {"form-TOTAL_FORMS": "3", "form-INITIAL_FORMS": "3", "submit": ""}
+            for index, f in enumerate(files):
+                data[f"form-{index}-filename"] = f.name
+                data[f"form-{index}-title"] = f.name
+            response = self.client.post(
+                reverse("import_documents_2"), data, follow=True
+            )
+        html = b"".join(response.streaming_content).decode()
+        self.assertIn(
+            "&quot;a.txt&quot; has the same contents as the stored file &quot;stored.txt&quot;",
+            html,
+        )
+        self.assertIn(
+            "&quot;c.txt&quot; has the same contents as the stored file &quot;b.txt&quot;",
+            html,
+        )
+        self.assertIn("Imported 3 documents, 0 new text metadata", html)
+        self.assertEqual(BinaryMetadata.stored_files().count(), 2)
+
+    def test_staged_text_errors(self):
+        staging_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(staging_dir.cleanup)
+        with self.settings(IMPORT_STAGING_DIR=staging_dir.name):
+            manifest = stage_uploads(
+                [SimpleUploadedFile("broken.pdf", b"not a pdf", "application/pdf")]
+            )
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+                texts, errors = staged_texts(pool, manifest, [0])
+        self.assertEqual(texts, {0: None})
+        self.assertEqual([name for name, _error in errors], ["broken.pdf"])
+
+    def test_reused_file_message(self):
+        blob = b"notes"
+        BinaryMetadata.new_file(
+            blob, len(blob), content_type="text/plain", filename="a.txt"
+        )
+        doc = Document.objects.create(title="notes")
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        response = self.client.post(
+            reverse("edit_plain_text_document", args=[doc.uuid.hex]),
+            {"filename": "b.txt", "content": "notes", "content_type": "text/plain"},
+            follow=True,
+        )
+        self.assertContains(
+            response,
+            "&quot;b.txt&quot; has the same contents as the stored file &quot;a.txt&quot;",
+        )
+
+    def test_bulk_import_duplicates(self):
+        blob = b"imported contents"
+        first = BinaryMetadata.new_file(blob, len(blob), filename="a.txt")
+        entries = []
+        for title in ["a", "b"]:
+            m = BinaryMetadata(name=BinaryMetadata.file_name(len(blob), "", title))
+            m.set_contents(blob)
+            entries.append(ImportEntry(title, [], [(STORAGE_NAME, m)]))
+        documents, _stats = bulk_import_documents(entries)
+        self.assertEqual(
+            set(
+                DocumentHasBinaryMetadata.objects.filter(
+                    document__in=documents
+                ).values_list("metadata_id", flat=True)
+            ),
+            {first.uuid},
+        )
+
+
+class JobTests(TestCase):
+    databases = {"default", "bibliothecula"}
+
+    @classmethod
+    def setUpTestData(cls):
+        create_schema()
+        for i in range(3):
+            create_document(i)
+
+    def test_requeue_running_jobs(self):
+        enqueue_jobs("index", Document.objects.all())
+        own, alive, dead = [claim_job("index")[0] for _ in range(3)]
+        self.assertEqual(
+            set(Job.objects.values_list("owner", flat=True)), {job_owner()}
+        )
+        with connections["bibliothecula"].cursor() as cursor:
+            cursor.execute(
+                "UPDATE jobs SET owner = 'elsewhere:1' WHERE id = %s", [alive]
+            )
+            cursor.execute(
+                "UPDATE jobs SET owner = 'elsewhere:2', heartbeat = datetime('now', '-1 hour') WHERE id = %s",
+                [dead],
+            )
+        requeue_running_jobs()
+        states = dict(Job.objects.values_list("id", "state"))
+        self.assertEqual(states[own], "queued")
+        self.assertEqual(states[alive], "running")
+        self.assertEqual(states[dead], "queued")
+        self.assertEqual(Job.objects.get(id=dead).attempts, 0)
+
+    def test_pdf_pages_cleared_after_indexing(self):
+        doc = Document.objects.order_by("title").first()
+        pdf = doc.binary_metadata.get(name=STORAGE_NAME, metadata__data=b"0000")
+        cache_pdf_pages(pdf.metadata_id, [(1, "first "), (2, "second")])
+        pdf_job = SimpleNamespace(metadata_uuid=pdf.metadata_id, error=None)
+        self.assertEqual(save_pdf_job_result(doc, pdf_job), (None, 12))
+        self.assertEqual(
+            doc.binary_metadata.get(name=FULL_TEXT_NAME).metadata.data,
+            b"first second",
+        )
+        self.assertEqual(cached_pdf_pages(pdf.metadata_id), set())
+
+
+class FullTextIndexTests(TestCase):
+    databases = {"default", "bibliothecula"}
+
+    @classmethod
+    def setUpTestData(cls):
+        create_schema()
+        for i in range(3):
+            doc = create_document(i)
+            doc.save_full_text(f"full text of document {i}")
+        build_full_text_index()
+
+    def test_merge_options(self):
+        with connections["bibliothecula"].cursor() as cursor:
+            self.assertEqual(
+                full_text_index_config(cursor), full_text_index_merge_settings()
+            )
+        self.client.force_login(
+            User.objects.create_superuser("admin", "admin@example.com", "admin")
+        )
+        response = self.client.post(
+            reverse("database_index"),
+            {
+                "automerge": "2",
+                "crisismerge": "8",
+                "usermerge": "2",
+                "set-merge-config": "",
+            },
+        )
+        self.assertContains(response, "automerge 2, crisismerge 8, usermerge 2.")
+        self.assertContains(response, 'value="8" min="0"')
+        with connections["bibliothecula"].cursor() as cursor:
+            self.assertEqual(
+                full_text_index_config(cursor),
+                {"automerge": 2, "crisismerge": 8, "usermerge": 2},
+            )
+
+    def test_size_without_dbstat(self):
+        class NoDbstatCursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def execute(self, sql, params=None):
+                if "dbstat" in sql:
+                    raise OperationalError("no such table: dbstat")
+                return self.cursor.execute(sql, params)
+
+            def fetchone(self):
+                return self.cursor.fetchone()
+
+        with connections["bibliothecula"].cursor() as cursor:
+            size = full_text_index_size(NoDbstatCursor(cursor))
+        self.assertGreater(size, 0)
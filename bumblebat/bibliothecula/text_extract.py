@@ -1,13 +1,21 @@
-import itertools
-import os
-import pathlib
-import tempfile
+import io
+import posixpath
+import urllib.parse
 import zipfile
-from collections import deque
 from xml.dom import minidom
 
 from .utils import Textractor
 from pdfminer.high_level import extract_text
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdfminer.utils import open_filename
+
+# Pages of a PDF extracted by one job, see `pdf_page_chunks`.
+PDF_PAGE_CHUNK = 50
 
 
 def get_pdf_text(input_):
@@ -23,91 +31,141 @@ def get_pdf_text(input_):
     return text
 
 
+def pdf_page_count(input_):
+    with open_filename(input_, "rb") as fp:
+        document = PDFDocument(PDFParser(fp))
+        return sum(1 for _ in PDFPage.create_pages(document))
+
+
+def pdf_page_chunks(page_count, done=(), size=PDF_PAGE_CHUNK):
+    """Split the pages (numbered from 1) of a PDF that are not in `done`
+    into lists of at most `size` pages."""
+    missing = [page for page in range(1, page_count + 1) if page not in done]
+    return [missing[i : i + size] for i in range(0, len(missing), size)]
+
+
+def get_pdf_pages_text(input_, pages):
+    """Returns `[(page, text)]` for the `pages` (numbered from 1) of a PDF.
+
+    The text of each page is what `extract_text` would produce for it, so
+    joining all the pages gives the text of the whole file. Unlike
+    `get_pdf_text` errors are raised, the caller decides what to retry."""
+    wanted = set(page - 1 for page in pages)
+    ret = []
+    with open_filename(input_, "rb") as fp, io.StringIO() as output:
+        rsrcmgr = PDFResourceManager(caching=True)
+        device = TextConverter(rsrcmgr, output, laparams=LAParams())
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for pageno, page in enumerate(PDFPage.get_pages(fp, caching=True)):
+            if pageno not in wanted:
+                continue
+            output.seek(0)
+            output.truncate()
+            interpreter.process_page(page)
+            ret.append((pageno + 1, output.getvalue()))
+            if len(ret) == len(wanted):
+                break
+    return ret
+
+
+def extract_document_text(kind, path, blob=None):
+    """Returns the text of a PDF or EPUB file, or `None`.
+
+    `kind` is `"pdf"` or `"epub"` and `blob` holds the file contents if it
+    isn't read from `path`. Called in worker processes (see
+    `background_tasks`), so the arguments and result must be picklable."""
+    input_ = path if blob is None else io.BytesIO(blob)
+    if kind == "pdf":
+        return get_pdf_text(input_)
+    if kind == "epub":
+        return get_epub_text(input_)
+    raise ValueError(f"Cannot extract text from {kind} files")
+
+
+EPUB_IGNORE_FILES = set(
+    [
+        "titlepage.xhtml",
+        "halftitlepage.xhtml",
+        "imprint.xhtml",
+        "colophon.xhtml",
+        "copyright.xhtml",
+        "uncopyright.xhtml",
+    ]
+)
+
+
+def epub_spine(z):
+    """Returns the names of the HTML members of an EPUB `zipfile.ZipFile` in
+    reading (spine) order, without the front and back matter in
+    `EPUB_IGNORE_FILES`."""
+    container = minidom.parseString(z.read("META-INF/container.xml"))
+
+    # locate the rootfile
+    elem = container.getElementsByTagName("rootfile")[0]
+    rootfile_path = elem.getAttribute("full-path")
+    rootfile_dir = posixpath.dirname(rootfile_path)
+
+    # open the rootfile
+    rootfile_root = minidom.parseString(z.read(rootfile_path))
+    manifest_items = {
+        item.getAttribute("id"): item
+        for item in rootfile_root.getElementsByTagName("manifest")[
+            0
+        ].getElementsByTagName("item")
+    }
+    names = set(z.namelist())
+    spine = rootfile_root.getElementsByTagName("spine")
+    members = []
+    if spine:
+        for itemref in spine[0].getElementsByTagName("itemref"):
+            item = manifest_items.get(itemref.getAttribute("idref"))
+            if item is None:
+                continue
+            href = urllib.parse.unquote(item.getAttribute("href"))
+            if (
+                item.getAttribute("id").lower() in EPUB_IGNORE_FILES
+                or posixpath.basename(href).lower() in EPUB_IGNORE_FILES
+            ):
+                continue
+            name = posixpath.normpath(posixpath.join(rootfile_dir, href))
+            if name in names:
+                members.append(name)
+    if not members:
+        # No usable spine, fall back to every HTML member in archive order.
+        members = [name for name in z.namelist() if name.endswith("html")]
+    return members
+
+
+def iter_epub_text(input_):
+    """Yields the text of each chapter of an EPUB file path or file-like
+    object, in reading order.
+
+    Spine items are read straight from the archive and fed to the parser a
+    line at a time, so nothing is written to disk and it is safe to call
+    from several threads."""
+    with zipfile.ZipFile(input_, "r") as z:
+        parser = Textractor()
+        for name in epub_spine(z):
+            try:
+                with z.open(name) as member:
+                    for line in io.TextIOWrapper(
+                        member, encoding="utf-8", errors="strict"
+                    ):
+                        parser.feed(line)
+                parser.close()
+                text = parser.output.strip()
+            except Exception as exc:
+                print("Exception:", name, exc)
+                continue
+            finally:
+                parser.reset()
+            if text:
+                yield text
+
+
 def get_epub_text(input_):
-    IGNORE_FILES = set(
-        [
-            "titlepage.xhtml",
-            "halftitlepage.xhtml",
-            "imprint.xhtml",
-            "colophon.xhtml",
-            "copyright.xhtml",
-            "uncopyright.xhtml",
-        ]
-    )
-    ret = ""
     try:
-        with tempfile.TemporaryDirectory() as tmpdir, zipfile.ZipFile(input_, "r") as z:
-            os.chdir(tmpdir)
-            cwd = pathlib.Path.cwd()
-            container = z.open("META-INF/container.xml")
-            container_root = minidom.parseString(container.read())
-
-            # locate the rootfile
-            elem = container_root.getElementsByTagName("rootfile")[0]
-            rootfile_path = elem.getAttribute("full-path")
-
-            # open the rootfile
-            rootfile = z.open(rootfile_path)
-            rootfile_root = minidom.parseString(rootfile.read())
-
-            spine = rootfile_root.getElementsByTagName("spine")
-            manifest_items = {
-                item.getAttribute("id"): item
-                for item in rootfile_root.getElementsByTagName("manifest")[
-                    0
-                ].getElementsByTagName("item")
-            }
-            stuff = []
-
-            def get_attrs(n):
-                href = None
-                _id = None
-                for i in range(0, n.attributes.length):
-                    if n.attributes.item(i).name == "href":
-                        href = n.attributes.item(i).value
-                    elif n.attributes.item(i).name == "id":
-                        _id = n.attributes.item(i).value
-                return {"href": href, "id": _id}
-
-            if spine and len(spine) > 0:
-                spine = spine[0]
-                stuff = [
-                    item["id"]
-                    for item in map(
-                        get_attrs,
-                        (
-                            manifest_items[item.getAttribute("idref")]
-                            for item in spine.getElementsByTagName("itemref")
-                        ),
-                    )
-                    if item["id"].lower() not in IGNORE_FILES
-                ]
-            members = list(
-                itertools.filterfalse(
-                    lambda m: not m.filename.endswith("html")
-                    and m.filename not in stuff,
-                    z.infolist(),
-                )
-            )
-            members = z.extractall(members=members)
-            file_queue = deque([])
-            parser = Textractor()
-            for c in cwd.iterdir():
-                file_queue.append(c)
-            while len(file_queue) > 0:
-                p = file_queue.pop()
-                if p.is_dir():
-                    for c in p.iterdir():
-                        file_queue.append(c)
-                else:
-                    try:
-                        if p.suffix.endswith("html"):
-                            parser.feed(p.read_text(errors="strict"))
-                            print("parser output is ", len(parser.output), "bytes")
-                            ret += parser.output.strip()
-                            parser.reset()
-                    except Exception as exc:
-                        print("Exception:", exc)
+        return "\n".join(iter_epub_text(input_))
     except Exception as exc:
         print("Could not extract epub text:", exc)
         if isinstance(input_, str):
@@ -115,4 +173,3 @@ def get_epub_text(input_):
         else:
             print("Binary epub")
         return None
-    return ret
@@ -0,0 +1,223 @@
+"""Batch thumbnail generation in a process pool.
+
+Rendering a thumbnail is CPU bound (Ghostscript and ImageMagick), so bulk
+backfills run it in worker processes that each render many documents. PDF
+thumbnails can optionally be rendered by one long-lived `gs` process per
+worker instead of starting the interpreter for every document.
+
+Workers never touch the database: jobs carry the file contents or path and
+results are WebP bytes and their average colour, which the caller stores
+(see `models.create_thumbnails`).
+"""
+import concurrent.futures
+import glob
+import multiprocessing
+import multiprocessing.util
+import os
+import select
+import shutil
+import subprocess
+import tempfile
+import time
+
+from .thumbnails import (
+    GHOSTSCRIPT_ARGS,
+    average_color,
+    generate_thumbnail,
+    jpeg_to_webp_thumbnail,
+)
+
+
+class GhostscriptProcess:
+    """A `gs` process that reads PostScript commands from stdin and renders
+    the first page of each PDF it is given to a JPEG file."""
+
+    DONE_MARKER = b"%%bibliothecula-done"
+    ERROR_MARKER = b"%%bibliothecula-error"
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix="bibliothecula-gs-")
+        self.input_path = os.path.join(self.directory, "input.pdf")
+        self.process = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [
+                "gs",
+                "-dNOPAUSE",
+                f"--permit-file-all={self.directory}/",
+                f"-sOutputFile={self.directory}/page-%d.jpg",
+                *GHOSTSCRIPT_ARGS,
+                "-",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+        )
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def cleanup(self):
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _read_until_done(self, timeout):
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        output = b""
+        while self.DONE_MARKER not in output:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.process.args, timeout)
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise RuntimeError("Ghostscript exited unexpectedly")
+            output += chunk
+        return output
+
+    def render_first_page(self, path, blob=None, timeout=120):
+        """Returns the first page of a PDF as JPEG bytes, or `None` if
+        Ghostscript could not render it."""
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        for page in glob.glob(os.path.join(self.directory, "page-*.jpg")):
+            os.remove(page)
+        if blob is None:
+            shutil.copyfile(path, self.input_path)
+        else:
+            with open(self.input_path, "wb") as f:
+                f.write(blob)
+        # The temporary directory name needs no escaping in a PostScript
+        # string.
+        command = (
+            f"{{({self.input_path}) run}} stopped "
+            f"{{(\\n{self.ERROR_MARKER.decode()}\\n) print}} if "
+            f"(\\n{self.DONE_MARKER.decode()}\\n) print flush\n"
+        )
+        try:
+            self.process.stdin.write(command.encode())
+            output = self._read_until_done(timeout)
+        except Exception:
+            self.close()
+            raise
+        if self.ERROR_MARKER in output:
+            # The interpreter state is unknown after an error, start afresh
+            # for the next document.
+            self.close()
+            return None
+        pages = glob.glob(os.path.join(self.directory, "page-*.jpg"))
+        if not pages:
+            return None
+        with open(pages[0], "rb") as f:
+            return f.read()
+
+
+# Set in each worker process by `_init_worker`.
+_ghostscript = None
+
+
+def _init_worker(persistent_ghostscript):
+    global _ghostscript
+    if persistent_ghostscript and shutil.which("gs") is not None:
+        _ghostscript = GhostscriptProcess()
+        # Worker processes exit through multiprocessing, which runs
+        # finalizers but not `atexit` handlers.
+        multiprocessing.util.Finalize(None, _ghostscript.cleanup, exitpriority=10)
+
+
+def render_thumbnail(job):
+    """Runs in a worker process. Returns `(key, data, error, color)`, where
+    `color` is the average colour of the thumbnail (see
+    `thumbnails.average_color`), so that decoding it again doesn't hold up
+    the caller."""
+    key, kind, path, blob, timeout = job
+    try:
+        if kind == "pdf" and _ghostscript is not None:
+            jpeg = _ghostscript.render_first_page(path, blob=blob, timeout=timeout)
+            data = None if jpeg is None else jpeg_to_webp_thumbnail(jpeg)
+        else:
+            data = generate_thumbnail(kind, path, blob, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return (key, None, f"timed out after {timeout} seconds", None)
+    except Exception as exc:
+        return (key, None, str(exc), None)
+    if data is None:
+        return (key, None, "no thumbnail could be generated", None)
+    return (key, data, None, average_color(data))
+
+
+class ThumbnailBatchStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = 0
+        self.failures = []
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def docs_per_second(self):
+        elapsed = self.elapsed()
+        if elapsed <= 0:
+            return 0.0
+        return self.done / elapsed
+
+    def add_failure(self, label, error):
+        self.failures.append((label, error))
+
+    def __str__(self):
+        return (
+            f"{self.done} documents in {self.elapsed():.1f}s "
+            f"({self.docs_per_second():.2f} docs/s), {len(self.failures)} failed"
+        )
+
+
+def generate_thumbnails(
+    jobs, max_workers=None, persistent_ghostscript=True, timeout=120, stats=None
+):
+    """Render thumbnails for `jobs` in a process pool.
+
+    `jobs` is an iterable of `(key, kind, path, blob)` tuples (see
+    `Document.thumbnail_sources`) and is consumed lazily, so that only a few
+    file contents per worker are held in memory at once. Yields
+    `(key, data, error, color)` in completion order, where `data` is WebP
+    bytes or `None`, as returned by `render_thumbnail`. `timeout` applies to
+    each Ghostscript invocation.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if stats is None:
+        stats = ThumbnailBatchStats()
+    jobs = iter(jobs)
+    # Forking a threaded process such as the web server copies its locks and
+    # database connections into the workers.
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(persistent_ghostscript,),
+    ) as executor:
+        in_flight = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < 2 * max_workers:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    break
+                in_flight.add(executor.submit(render_thumbnail, (*job, timeout)))
+            if not in_flight:
+                break
+            done, in_flight = concurrent.futures.wait(
+                in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                stats.done += 1
+                yield future.result()
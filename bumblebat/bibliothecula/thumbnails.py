@@ -1,3 +1,4 @@
+import base64
 import os
 import re
 from io import BytesIO
@@ -34,11 +35,45 @@ def generate_image_thumbnail(path, blob=None):
             return page.data_url()
 
 
+def thumbnail_blob(data):
+    """Returns the image bytes of a thumbnail.
+
+    Thumbnails used to be stored as base64 `data:` URLs and are now stored as
+    raw WebP bytes; this accepts both."""
+    if isinstance(data, str):
+        data = data.encode("ascii")
+    data = bytes(data)
+    if not data.startswith(b"data:"):
+        return data
+    _header, _, data = data.partition(b",")
+    return base64.b64decode(data)
+
+
+def generate_thumbnail(kind, path, blob=None, timeout=120):
+    """Returns the WebP thumbnail bytes of a file or `None`.
+
+    `kind` is one of `"pdf"`, `"epub"` or `"image"`, and `blob` holds the file
+    contents if it isn't read from `path`."""
+    if kind == "pdf":
+        data = generate_pdf_thumbnail(path, blob=blob, timeout=timeout)
+    elif kind == "epub":
+        data = generate_epub_thumbnail(path, blob=blob)
+    elif kind == "image":
+        data = generate_image_thumbnail(path, blob=blob)
+    else:
+        raise ValueError(f"Cannot generate a thumbnail for {kind} files")
+    if data is None:
+        return None
+    return thumbnail_blob(data)
+
+
 def average_color(data_url):
-    import urllib.request
+    """Returns the average colour of a WebP thumbnail as a `#rrggbb` string.
 
-    blob = urllib.request.urlopen(data_url).read()
+    This decodes the image, so compute it once when the thumbnail is created
+    and store it (see `models.ThumbnailColor`)."""
     try:
+        blob = thumbnail_blob(data_url)
         with Image(format="webp", blob=blob) as img:
             # print(img)
             img.resize(width=1, height=1)
@@ -49,77 +84,61 @@ def average_color(data_url):
         return None
 
 
-def generate_pdf_thumbnail(path, blob=None):
+GHOSTSCRIPT_ARGS = [
+    "-sDEVICE=jpeg",
+    "-r72x72",
+    "-q",
+    "-dFirstPage=1",
+    "-dLastPage=1",
+    "-dUseCropBox",
+    "-dJPEQ=30",
+]
+
+
+def jpeg_to_webp_thumbnail(jpeg):
+    """Returns the WebP thumbnail bytes of a JPEG rendered by Ghostscript."""
+    with Image(format="jpg:file.jpg", blob=jpeg) as i:
+        with i.convert("webp") as first_page:
+            width = first_page.width
+            height = first_page.height
+            ratio = 100.0 / (width * 1.0)
+            new_height = int(ratio * height)
+            # print("webp dims before:", first_page.width, " x ", first_page.height)
+            first_page.thumbnail(width=100, height=new_height)
+            # print("webp dims after:", first_page.width, " x ", first_page.height)
+            return first_page.make_blob("webp")
+
+
+def generate_pdf_thumbnail(path, blob=None, timeout=120):
+    """Returns the thumbnail data URL of a PDF's first page, or `None` if
+    Ghostscript produced no image. Raises `RuntimeError` if Ghostscript fails
+    and `subprocess.TimeoutExpired` if it runs longer than `timeout` seconds."""
     if blob is None:
-        with subprocess.Popen(
-            [
-                "gs",
-                "-sDEVICE=jpeg",
-                "-r72x72",
-                "-o%stdout%",
-                "-q",
-                "-dFirstPage=1",
-                "-dLastPage=1",
-                "-dUseCropBox",
-                "-dJPEQ=30",
-                path,
-            ],
-            stdout=subprocess.PIPE,
-        ) as gs:
-            try:
-                outs, errs = gs.communicate(timeout=60)
-            except subprocess.TimeoutExpired:
-                print("expired")
-                gs.kill()
-                outs, errs = gs.communicate()
-                print(outs, errs)
-                return None
-            with Image(format="jpg:file.jpg", blob=outs) as i:
-                with i.convert("webp") as first_page:
-                    width = first_page.width
-                    height = first_page.height
-                    ratio = 100.0 / (width * 1.0)
-                    new_height = int(ratio * height)
-                    # print("webp dims before:", first_page.width, " x ", first_page.height)
-                    first_page.thumbnail(width=100, height=new_height)
-                    # print("webp dims after:", first_page.width, " x ", first_page.height)
-                    return first_page.data_url()
+        args = ["gs", "-o%stdout%", *GHOSTSCRIPT_ARGS, path]
     else:
-        with subprocess.Popen(
-            [
-                "gs",
-                "-sDEVICE=jpeg",
-                "-r72x72",
-                "-o%stdout%",
-                "-q",
-                "-dFirstPage=1",
-                "-dLastPage=1",
-                "-dUseCropBox",
-                "-dJPEQ=30",
-                "%stdin%",
-            ],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-        ) as gs:
-            # gs.stdin.write(blob)
-            try:
-                outs, errs = gs.communicate(input=blob, timeout=120)
-            except subprocess.TimeoutExpired:
-                print("expired")
-                gs.kill()
-                outs, errs = gs.communicate()
-                print(outs, errs)
-                return None
-            with Image(format="jpg:file.jpg", blob=outs) as i:
-                with i.convert("webp") as first_page:
-                    width = first_page.width
-                    height = first_page.height
-                    ratio = 100.0 / (width * 1.0)
-                    new_height = int(ratio * height)
-                    # print("webp dims before:", first_page.width, " x ", first_page.height)
-                    first_page.thumbnail(width=100, height=new_height)
-                    # print("webp dims after:", first_page.width, " x ", first_page.height)
-                    return first_page.data_url()
+        args = ["gs", "-o%stdout%", *GHOSTSCRIPT_ARGS, "%stdin%"]
+    with subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE if blob is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as gs:
+        try:
+            outs, errs = gs.communicate(input=blob, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            gs.kill()
+            gs.communicate()
+            raise
+    if gs.returncode != 0:
+        message = errs.decode(errors="replace").strip().splitlines()
+        raise RuntimeError(
+            f"Ghostscript exited with status {gs.returncode}"
+            + (f": {message[-1]}" if message else "")
+        )
+    if not outs:
+        return None
+    thumbnail = jpeg_to_webp_thumbnail(outs)
+    return "data:image/webp;base64," + base64.b64encode(thumbnail).decode("ascii")
 
 
 def generate_pdf_thumbnail_imagemagick(path, blob=None):
@@ -23,9 +23,15 @@ from . import views
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", views.view_collection, name="view_collection"),
+    path("typeahead.json", views.view_typeahead, name="view_typeahead"),
     path("database/", views.database_overview, name="database_overview"),
     path("database/docs/", views.database_docs, name="database_docs"),
     path("database/index/", views.database_index, name="database_index"),
+    path(
+        "database/index/progress.json",
+        views.database_index_progress,
+        name="database_index_progress",
+    ),
     path(
         "database/index/<document_uuid>",
         views.database_index,
@@ -40,6 +46,11 @@ urlpatterns = [
     path("add/document/", views.add_document, name="add_document"),
     path("notes/<uuid>/", views.view_notes, name="view_notes"),
     path("document/<uuid>/", views.view_document, name="view_document"),
+    path(
+        "thumbnail/<uuid:metadata_uuid>.webp",
+        views.view_thumbnail,
+        name="view_thumbnail",
+    ),
     path(
         "document/<uuid>/add-storage/",
         views.add_document_storage,
@@ -6,18 +6,28 @@ import re
 
 
 class Textractor(HTMLParser):
-    whitespace = r"\s{2,}"
-    output = ""
+    whitespace = re.compile(r"\s{2,}")
     ignore = 2
     in_header = False
     extract_href = False
 
     def reset(self):
-        self.output = ""
+        # Text is collected in a list and joined on demand, appending to a
+        # string attribute copies it every time.
+        self.chunks = []
         self.ignore = 2
         self.in_header = False
         super().reset()
 
+    @property
+    def output(self):
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
+
+    def clean(self, data):
+        return self.whitespace.sub(" ", data).replace("\ufeff", "")
+
     def handle_starttag(self, tag, attrs):
         attrs = {a[0]: a[1] for a in attrs}
         if tag == "body" and (
@@ -32,10 +42,8 @@ class Textractor(HTMLParser):
             self.ignore += 1
             self.in_header = True
         if tag == "a" and self.extract_href and "href" in attrs:
-            self.output += re.sub(self.whitespace, " ", attrs["href"]).replace(
-                "\ufeff", ""
-            )
-            self.output += " "
+            self.chunks.append(self.clean(attrs["href"]))
+            self.chunks.append(" ")
 
     def handle_endtag(self, tag):
         if tag == "head":
@@ -46,4 +54,4 @@ class Textractor(HTMLParser):
 
     def handle_data(self, data):
         if self.ignore == 0:
-            self.output += re.sub(self.whitespace, " ", data).replace("\ufeff", "")
+            self.chunks.append(self.clean(data))
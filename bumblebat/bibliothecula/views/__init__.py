@@ -1,10 +1,16 @@
-from django.http import HttpResponse, Http404, HttpResponseRedirect
+from django.http import (
+    HttpResponse,
+    Http404,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.urls import reverse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import loader
 from django.db import transaction
 from django.db.models.functions import Lower
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Sum
 from django.db.models.expressions import RawSQL
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
@@ -14,10 +20,19 @@ from django.views.decorators.cache import cache_page
 from django.forms import formset_factory
 from ..models import *
 from ..forms import *
+from ..pagination import keyset_order, keyset_page
+from ..search import (
+    count_matches,
+    matching_documents,
+    metadata_search,
+    search_page,
+    typeahead,
+)
 from ..thumbnails import (
     generate_pdf_thumbnail,
     generate_epub_thumbnail,
     generate_image_thumbnail,
+    thumbnail_blob,
 )
 from ..text_extract import get_pdf_text, get_epub_text
 import re
@@ -68,10 +83,19 @@ def extract_dbg(code_fragment):
     return "???"
 
 
+def reused_file_message(m, filename):
+    """Returns a message telling that the file stored as `filename` has the
+    same contents as the existing file `m`, returned by
+    `BinaryMetadata.new_file` or `BinaryMetadata.from_file`."""
+    content_type = m.try_get_content_type() or {}
+    existing = content_type.get("filename") or m.uuid
+    return f'"{filename}" has the same contents as the stored file "{existing}", which is used instead with its own name and content type.'
+
+
 @staff_member_required
 def view_collection(request):
     # print("\n\n")
-    snippets = None
+    full_text_query = None
     request_object = request.GET
     get_request = request_object.copy()
     should_redirect_flag = request.method == "POST"
@@ -96,6 +120,12 @@ def view_collection(request):
     )
     sort_form = CollectionSort({"field": sort_field, "ascending": sort_ascending})
     search_form = DocumentMetadataSearch(request.GET)
+    # Pagination parameters are not part of the query; drop them so that tag
+    # and redirect URLs start over from the first page.
+    after = get_request.pop("after", [None])[-1]
+    partial_flag = "partial" in get_request
+    if partial_flag:
+        get_request.pop("partial")
     full_text_search_form = DocumentFullTextSearch(request.GET)
     if request.method == "POST":
         if "change-layout" in request.POST:
@@ -176,24 +206,10 @@ def view_collection(request):
         t.url = query_dict.urlencode()
     # print("query_s=",query_string)
     if full_text_flag and query_string is not None and len(query_string) != 0:
-        # results = Document.objects.raw('select uuid from document_title_authors_text_view_fts(%s);', params=["journal woodcut"])
-        escaped = query_string.replace('"', '""')
-        collection = Document.objects.all().filter(
-            uuid__in=RawSQL(
-                f"select uuid from {FTS_NAME}('\"{escaped}\"')",
-                (),
-            )
-        )
-        try:
-            with connections["bibliothecula"].cursor() as cursor:
-                cursor.execute(
-                    f"select uuid, snippet({FTS_NAME},-1,'<mark>','</mark>','\u200a[…]\u200a',36) as snippet from {FTS_NAME}('\"{escaped}\"')"
-                )
-                snippets = {uuid.UUID(i[0]): i[1] for i in cursor.fetchall()}
-        except Exception as exc:
-            print("snippets exc:", exc)
-    else:
-        collection = Document.objects.all()
+        # Results are ranked by search.search_page, the other filters below
+        # restrict which documents it returns.
+        full_text_query = query_string
+    collection = Document.objects.all()
     if tags:
         # print("tag len is ", len(tags))
         if combination == "AND":
@@ -208,42 +224,34 @@ def view_collection(request):
             collection = collection.filter(uuid__in=metadata_objects)
         # print("col len is ", len(collection))
     if query_string and not full_text_flag:
-        collection = collection.filter(
-            Q(title__icontains=query_string)
-            | Q(text_metadata__metadata__data__icontains=query_string)
-            | Q(binary_metadata__metadata__name__icontains=query_string)
-        ).distinct()
-    if layout_preference == "grid":
-        template = loader.get_template("collection_grid.html")
-    elif layout_preference == "table":
+        collection = collection.filter(metadata_search(query_string))
+    if layout_preference == "table":
         template = loader.get_template("collection_table.html")
+        items_template = loader.get_template("collection_table_items.html")
+    else:
+        template = loader.get_template("collection_grid.html")
+        items_template = loader.get_template("collection_grid_items.html")
     if document_type_null:
         collection = collection.exclude(text_metadata__metadata__name=TYPE_NAME)
     elif len(document_types) > 0:
         collection = collection.filter(text_metadata__metadata__uuid__in=document_types)
 
-    collection = collection.order_by(
-        ("-" + sort_field) if not sort_ascending else sort_field
-    )
-    result_tags = set(
-        TextMetadata.objects.all().filter(
-            name=TAG_NAME, documents__document__in=collection
-        )
-    )
-    context = {
-        "all_tags": [t for t in all_tags if t.active or t in result_tags],
-        "has_selected_tags": len(tags) > 0,
-        "collection": collection,
-        "snippets": snippets,
-        "search_form": search_form,
-        "full_text_search_form": full_text_search_form,
-        "layout_form": layout_form,
-        "sort_form": sort_form,
-        "type_form": type_form,
-        "combination_form": combination_form,
-        "add_document_form": AddDocument(),
-        "total_documents": Document.objects.all().count(),
-    }
+    if full_text_query is not None:
+        filtered = bool(tags) or document_type_null or len(document_types) > 0
+        matching = collection if filtered else None
+
+        def paginate(after):
+            return search_page(full_text_query, matching, after)
+
+        collection = collection.filter(uuid__in=matching_documents(full_text_query))
+    else:
+        collection = collection.order_by(*keyset_order(sort_field, sort_ascending))
+
+        def paginate(after):
+            page, next_cursor = keyset_page(
+                collection, sort_field, sort_ascending, after
+            )
+            return (page, next_cursor, {})
     if "csrfmiddlewaretoken" in get_request:
         get_request.pop("csrfmiddlewaretoken")
     if request.method == "POST":
@@ -262,9 +270,131 @@ def view_collection(request):
         else:
             redirect_url = view_url + "?" + url_suffix
         # print("redirect = ", redirect_url)
-        return HttpResponseRedirect(redirect_url, template.render(context, request))
+        return HttpResponseRedirect(redirect_url)
+    if partial_flag:
+        # Only the next page of cards/rows, requested by the "load more" script.
+        page, next_cursor, snippets = paginate(after)
+        load_document_summaries(page)
+        response = HttpResponse(
+            items_template.render({"collection": page, "snippets": snippets}, request)
+        )
+        if next_cursor is not None:
+            response["X-Next-Page"] = next_cursor
+        return response
+    narrowed = (
+        bool(tags)
+        or bool(query_string)
+        or document_type_null
+        or len(document_types) > 0
+    )
+    # Only the first page is queried before the response starts, its cost
+    # doesn't depend on the size of the library. The counts are sent after
+    # the results, see `stream_collection`.
+    page, next_cursor, snippets = paginate(after)
+    load_document_summaries(page)
+    if narrowed:
+        # The tags of the shown documents, not of all matches, which would
+        # take a query over the whole collection.
+        page_tags = set(tag for doc in page for tag in doc.summary.tags_list())
+        shown_tags = [t for t in all_tags if t.active or t.data in page_tags]
     else:
-        return HttpResponse(template.render(context, request))
+        shown_tags = list(all_tags)
+
+    def counts():
+        return {
+            "result_count": (
+                collection.count()
+                if full_text_query is None
+                else count_matches(full_text_query, matching)
+            ),
+            "total_documents": Document.objects.all().count(),
+        }
+
+    context = {
+        "all_tags": shown_tags,
+        "has_selected_tags": len(tags) > 0,
+        "has_results": len(page) > 0,
+        "full_text_query": full_text_query,
+        "search_form": search_form,
+        "full_text_search_form": full_text_search_form,
+        "layout_form": layout_form,
+        "sort_form": sort_form,
+        "type_form": type_form,
+        "combination_form": combination_form,
+        "add_document_form": AddDocument(),
+        "stream_items_marker": STREAM_ITEMS_MARKER,
+        "stream_load_more_marker": STREAM_LOAD_MORE_MARKER,
+    }
+    return StreamingHttpResponse(
+        stream_collection(
+            request,
+            template,
+            items_template,
+            context,
+            (page, next_cursor, snippets),
+            counts,
+        )
+    )
+
+
+@staff_member_required
+def view_typeahead(request):
+    """Suggestions for the search fields as they are typed, see
+    `search.typeahead`. The `q` parameter is the query and a `full_text`
+    parameter asks for full-text search matches."""
+    return JsonResponse(
+        typeahead(request.GET.get("q", ""), full_text="full_text" in request.GET)
+    )
+
+
+STREAM_ITEMS_MARKER = mark_safe("<!--collection-items-->")
+STREAM_LOAD_MORE_MARKER = mark_safe("<!--collection-load-more-->")
+STREAM_CHUNK_SIZE = 24
+
+
+def stream_collection(
+    request,
+    template,
+    items_template,
+    context,
+    first_page,
+    counts,
+):
+    """Yield the collection page in pieces: everything up to the results
+    container first, then the cards in chunks, and finally the "load more"
+    link and the number of matching documents.
+
+    `first_page` is `(page, next_cursor, snippets)` and `counts()` returns
+    the context of `collection_count.html`; it runs last since counting
+    all matches takes longer the bigger the library is."""
+    html = template.render(context, request)
+    if STREAM_ITEMS_MARKER not in html:
+        # Empty collection
+        yield html
+        return
+    head, rest = html.split(STREAM_ITEMS_MARKER, 1)
+    middle, tail = rest.split(STREAM_LOAD_MORE_MARKER, 1)
+    yield head
+    page, next_cursor, snippets = first_page
+    for i in range(0, len(page), STREAM_CHUNK_SIZE):
+        yield items_template.render(
+            {
+                "collection": page[i : i + STREAM_CHUNK_SIZE],
+                "snippets": snippets,
+            },
+            request,
+        )
+    yield middle
+    next_page_query = None
+    if next_cursor is not None:
+        query_dict = request.GET.copy()
+        query_dict["after"] = next_cursor
+        next_page_query = query_dict.urlencode()
+    yield loader.render_to_string(
+        "collection_load_more.html", {"next_page_query": next_page_query}, request
+    )
+    yield loader.render_to_string("collection_count.html", counts(), request)
+    yield tail
 
 
 from html.parser import HTMLParser
@@ -1,6 +1,7 @@
 from . import *
+from django.conf import settings
 from django.db import connections
-from django.template.defaultfilters import filesizeformat
+from django.template.defaultfilters import filesizeformat, pluralize
 from django.core.cache import cache
 import inspect
 from bibliothecula import sql_statements
@@ -32,35 +33,46 @@ def make_treemap_svg(request, fts5_size):
     dbg("Make treemap called!")
     try:
         labels = "embedded files", "linked files"
-        no_linked_size = (
-            DocumentHasBinaryMetadata.objects.all()
-            .filter(name=STORAGE_NAME, metadata__name=PATH_NAME)
-            .count()
-        )
-        no_total_storages = (
-            DocumentHasBinaryMetadata.objects.all().filter(name=STORAGE_NAME).count()
-        )
+        if document_summary_exists():
+            totals = DocumentSummary.objects.aggregate(
+                files_no=Sum("files_no"),
+                linked_files_no=Sum("linked_files_no"),
+                embedded_size=Sum("embedded_size"),
+            )
+            no_total_storages = totals["files_no"] or 0
+            no_linked_size = totals["linked_files_no"] or 0
+            size_embedded_size = totals["embedded_size"] or 0
+        else:
+            no_linked_size = (
+                DocumentHasBinaryMetadata.objects.all()
+                .filter(name=STORAGE_NAME, metadata__name=PATH_NAME)
+                .count()
+            )
+            no_total_storages = (
+                DocumentHasBinaryMetadata.objects.all()
+                .filter(name=STORAGE_NAME)
+                .count()
+            )
+            size_embedded_size = sum(
+                has.metadata.size()
+                for has in DocumentHasBinaryMetadata.objects.all()
+                .filter(name=STORAGE_NAME)
+                .exclude(metadata__name=PATH_NAME)
+            )
         if no_total_storages > 0:
             no_embedded_size = no_total_storages - no_linked_size
         else:
             no_linked_size = 0
             no_embedded_size = 0
 
+        # Linked files live outside the database, so their sizes can only be
+        # found by looking at the filesystem.
         size_linked_size = sum(
             has.metadata.size()
             for has in DocumentHasBinaryMetadata.objects.all().filter(
                 name=STORAGE_NAME, metadata__name=PATH_NAME
             )
         )
-        size_total_storages = sum(
-            has.metadata.size()
-            for has in DocumentHasBinaryMetadata.objects.all().filter(name=STORAGE_NAME)
-        )
-        if size_total_storages > 0:
-            size_embedded_size = size_total_storages - size_linked_size
-        else:
-            size_linked_size = 0
-            size_embedded_size = 0
 
         no_tree = (no_embedded_size, no_linked_size)
         if fts5_size and fts5_size > 0:
@@ -158,12 +170,9 @@ def database_overview(request):
         except:
             fts5_table_exists = False
         if fts5_table_exists:
-            cursor.execute(f"SELECT COUNT(uuid) FROM {FTS_NAME}")
+            cursor.execute(f"SELECT COUNT(*) FROM {FTS_NAME}")
             fts5_indexed_documents_no = cursor.fetchone()[0]
-            cursor.execute(
-                f"SELECT SUM(pgsize) FROM dbstat WHERE name = '{FTS_CONTENT_NAME}'"
-            )
-            fts5_size = cursor.fetchone()[0]
+            fts5_size = full_text_index_size(cursor)
         cursor.execute(
             "SELECT * FROM sqlite_master WHERE type IN ('trigger', 'table', 'index')"
         )
@@ -330,6 +339,8 @@ def database_index(request, document_uuid=None):
         fts5_indexed_documents_no = 0
         fts5_size = ""
         integrity_check = None
+        current = False
+        segments = None
         with connections["bibliothecula"].cursor() as cursor:
             cursor.execute(f"SELECT name FROM sqlite_master WHERE name = '{FTS_NAME}'")
             try:
@@ -337,12 +348,11 @@ def database_index(request, document_uuid=None):
             except:
                 fts5_table_exists = False
             if fts5_table_exists:
-                cursor.execute(f"SELECT COUNT(uuid) FROM {FTS_NAME}")
+                cursor.execute(f"SELECT COUNT(*) FROM {FTS_NAME}")
                 fts5_indexed_documents_no = cursor.fetchone()[0]
-                cursor.execute(
-                    f"SELECT SUM(pgsize) FROM dbstat WHERE name = '{FTS_CONTENT_NAME}'"
-                )
-                fts5_size = filesizeformat(cursor.fetchone()[0])
+                fts5_size = filesizeformat(full_text_index_size(cursor))
+                current = full_text_index_is_current(cursor)
+                segments = full_text_index_segments(cursor)
                 try:
                     cursor.execute(
                         f"INSERT INTO {FTS_NAME}({FTS_NAME}) VALUES('integrity-check')"
@@ -354,6 +364,9 @@ def database_index(request, document_uuid=None):
                 "no": fts5_indexed_documents_no,
                 "size": fts5_size,
                 "check": integrity_check,
+                "current": current,
+                "levels": segments[0] if segments else 0,
+                "segments": segments[1] if segments else 0,
             }
             if fts5_table_exists
             else None
@@ -375,7 +388,7 @@ def database_index(request, document_uuid=None):
             force = "force" in request.GET
             forced = "forced " if force else ""
             try:
-                tasks_no = TaskManager().index_document(
+                jobs_no = TaskManager().index_document(
                     document_uuid=document_uuid, force=force
                 )
             except Exception as exc:
@@ -390,27 +403,57 @@ def database_index(request, document_uuid=None):
                     messages.add_message(
                         request,
                         messages.INFO,
-                        f"Scheduled {forced}indexing task for uuid {document_uuid} with {tasks_no} tasks.",
+                        f"Queued {forced}indexing job for uuid {document_uuid}.",
                     )
                 else:
                     messages.add_message(
                         request,
                         messages.INFO,
-                        f"Scheduled {forced}indexing task for all documents with {tasks_no} tasks.",
+                        f"Queued {forced}indexing jobs for {jobs_no} document{pluralize(jobs_no)}.",
                     )
+        elif "start-thumbnails" in request.POST:
+            try:
+                jobs_no = TaskManager().create_thumbnails()
+            except Exception as exc:
+                errored = True
+                messages.add_message(
+                    request,
+                    messages.ERROR,
+                    f"Error: could not schedule background tasks: {exc}",
+                )
+            if not errored:
+                messages.add_message(
+                    request,
+                    messages.INFO,
+                    f"Queued thumbnail jobs for {jobs_no} document{pluralize(jobs_no)}.",
+                )
+        elif "resume" in request.POST:
+            if TaskManager().start():
+                messages.add_message(request, messages.INFO, "Resumed queued jobs.")
+            else:
+                messages.add_message(
+                    request, messages.INFO, "Jobs are already running."
+                )
         elif "stop" in request.POST:
             if active_tasks > 0:
                 TaskManager().kill_all()
                 clear_index_stats_cache_fn()
                 messages.add_message(
-                    request, messages.INFO, f"{active_tasks} tasks stopped."
+                    request,
+                    messages.INFO,
+                    "Stopping; running jobs will be resumed on the next start.",
                 )
             else:
                 messages.add_message(request, messages.INFO, f"No active tasks found.")
         elif "clear-index" in request.POST:
             with connections["bibliothecula"].cursor() as cursor:
                 try:
-                    cursor.execute(f"DELETE FROM {FTS_NAME}")
+                    if full_text_index_is_external(cursor):
+                        cursor.execute(
+                            f"INSERT INTO {FTS_NAME}({FTS_NAME}) VALUES('delete-all')"
+                        )
+                    else:
+                        cursor.execute(f"DELETE FROM {FTS_NAME}")
                 except Exception as exc:
                     errored = True
                     messages.add_message(
@@ -426,46 +469,152 @@ def database_index(request, document_uuid=None):
                     f"Cleared index `{FTS_NAME}`.",
                 )
         elif "build-index" in request.POST:
+            try:
+                size = filesizeformat(build_full_text_index())
+            except Exception as exc:
+                errored = True
+                messages.add_message(
+                    request,
+                    messages.ERROR,
+                    f"Error: could not build index: {exc}",
+                )
+            if not errored:
+                clear_index_stats_cache_fn()
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    f"Built index `{FTS_NAME}`: Size: {size}.",
+                )
+
+        elif "build-summary" in request.POST:
             with connections["bibliothecula"].cursor() as cursor:
                 try:
-                    cursor.execute(
-                        f"""INSERT INTO {FTS_NAME}(uuid, title, authors, full_text)
-                SELECT d.rowid AS rowid, d.title AS title, d.authors AS authors, d.full_text AS full_text
-                FROM document_title_authors_text_view AS d"""
-                    )
-                    cursor.execute(
-                        f"SELECT SUM(pgsize) FROM dbstat WHERE name = '{FTS_CONTENT_NAME}'"
-                    )
-                    size = filesizeformat(cursor.fetchone()[0])
+                    for statement in sql_statements.SUMMARY_SCHEMA:
+                        cursor.execute(str(statement))
+                    cursor.execute(str(sql_statements.DOCUMENT_SUMMARY_REBUILD))
+                    cursor.execute("SELECT COUNT(*) FROM document_summary")
+                    summary_no = cursor.fetchone()[0]
                 except Exception as exc:
                     errored = True
                     messages.add_message(
                         request,
                         messages.ERROR,
-                        f"Error: could not build index: {exc}",
+                        f"Error: could not build document summary: {exc}",
                     )
             if not errored:
-                clear_index_stats_cache_fn()
                 messages.add_message(
                     request,
                     messages.SUCCESS,
-                    f"Built index `{FTS_NAME}`: Size: {size}.",
+                    f"Built `document_summary` table with {summary_no} document{pluralize(summary_no)}.",
                 )
+        elif "build-trigram-index" in request.POST:
+            try:
+                trigram_no = build_trigram_index()
+            except Exception as exc:
+                errored = True
+                messages.add_message(
+                    request,
+                    messages.ERROR,
+                    f"Error: could not build trigram index: {exc}",
+                )
+            if not errored:
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    f"Built index `{TRIGRAM_NAME}` with {trigram_no} value{pluralize(trigram_no)}.",
+                )
+        elif "convert-thumbnails" in request.POST:
+            converted = convert_data_url_thumbnails()
+            messages.add_message(
+                request,
+                messages.SUCCESS,
+                f"Converted {converted} data URL thumbnail{pluralize(converted)} to WebP.",
+            )
+        elif "upgrade-schema" in request.POST:
+            try:
+                with transaction.atomic(using="bibliothecula"):
+                    with connections["bibliothecula"].cursor() as cursor:
+                        upgrades = upgrade_schema(cursor)
+            except Exception as exc:
+                errored = True
+                messages.add_message(
+                    request,
+                    messages.ERROR,
+                    f"Error: could not upgrade the schema: {exc}",
+                )
+            if not errored:
+                from ..middleware import SchemaUpgradeMiddleware
 
+                SchemaUpgradeMiddleware.schema_current = True
+                clear_index_stats_cache_fn()
+                if upgrades:
+                    messages.add_message(
+                        request,
+                        messages.SUCCESS,
+                        f"Upgraded the schema: {'; '.join(upgrades)}.",
+                    )
+                else:
+                    messages.add_message(
+                        request,
+                        messages.INFO,
+                        "The schema is already up to date.",
+                    )
+        elif "set-merge-config" in request.POST:
+            try:
+                merge_config = {
+                    option: int(request.POST[option])
+                    for option in FTS5_MERGE_DEFAULTS
+                }
+                with connections["bibliothecula"].cursor() as cursor:
+                    configure_full_text_index(cursor, merge_config)
+            except Exception as exc:
+                errored = True
+                messages.add_message(
+                    request,
+                    messages.ERROR,
+                    f"Error: could not set the merge options of `{FTS_NAME}`: {exc}",
+                )
+            if not errored:
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    f"Set the merge options of `{FTS_NAME}`: "
+                    + ", ".join(
+                        f"{option} {value}" for option, value in merge_config.items()
+                    )
+                    + ".",
+                )
+        elif "deduplicate-files" in request.POST:
+            deleted = deduplicate_files()
+            messages.add_message(
+                request,
+                messages.SUCCESS,
+                f"Removed {deleted} duplicate file{pluralize(deleted)}.",
+            )
+        elif "recompress" in request.POST:
+            rows, before, after = recompress_binary_metadata()
+            if settings.COMPRESS_STORED_FILES:
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    f"Recompressed {rows} blob{pluralize(rows)}: {filesizeformat(before)} before, {filesizeformat(after)} after, saved {filesizeformat(before - after)}.",
+                )
+            else:
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    f"Compression of stored files is off, decompressed {rows} blob{pluralize(rows)}: {filesizeformat(before)} before, {filesizeformat(after)} after.",
+                )
         elif "optimize-index" in request.POST:
             with connections["bibliothecula"].cursor() as cursor:
                 try:
-                    cursor.execute(
-                        f"SELECT SUM(pgsize) FROM dbstat WHERE name = '{FTS_CONTENT_NAME}'"
-                    )
-                    size_before = filesizeformat(cursor.fetchone()[0])
+                    size_before = filesizeformat(full_text_index_size(cursor))
+                    segments_before = (full_text_index_segments(cursor) or (0, 0))[1]
                     cursor.execute(
                         f"INSERT INTO {FTS_NAME}({FTS_NAME}) VALUES('optimize')"
                     )
-                    cursor.execute(
-                        f"SELECT SUM(pgsize) FROM dbstat WHERE name = '{FTS_CONTENT_NAME}'"
-                    )
-                    size_after = filesizeformat(cursor.fetchone()[0])
+                    size_after = filesizeformat(full_text_index_size(cursor))
+                    segments_after = (full_text_index_segments(cursor) or (0, 0))[1]
                 except Exception as exc:
                     errored = True
                     messages.add_message(
@@ -478,17 +627,53 @@ def database_index(request, document_uuid=None):
                 messages.add_message(
                     request,
                     messages.SUCCESS,
-                    f"Optimized index `{FTS_NAME}`: Size before: {size_before}, size after: {size_after}.",
+                    f"Optimized index `{FTS_NAME}`: Size before: {size_before}, size after: {size_after}. Segments before: {segments_before}, segments after: {segments_after}.",
+                )
+        elif "merge-index" in request.POST:
+            if TaskManager().merge_index():
+                messages.add_message(
+                    request,
+                    messages.INFO,
+                    f"Merging index `{FTS_NAME}` in the background.",
+                )
+            else:
+                messages.add_message(
+                    request,
+                    messages.INFO,
+                    f"Index `{FTS_NAME}` will be merged once the running tasks are done.",
                 )
     active_tasks = config.workers_ns.active_tasks
+    with connections["bibliothecula"].cursor() as cursor:
+        upgrades = schema_upgrades(cursor)
+        merge_config = full_text_index_config(cursor)
+    merge_settings = full_text_index_merge_settings()
     context = {
         "active_tasks": active_tasks,
         "index_stats_fn": index_stats_fn,
+        "job_stats": job_stats() if not upgrades else None,
+        "schema_upgrades": upgrades,
+        "compress_stored_files": settings.COMPRESS_STORED_FILES,
+        # Rows of (option, value in the index, value in settings.py).
+        "merge_options": [
+            (option, value, merge_settings[option])
+            for option, value in merge_config.items()
+        ]
+        if merge_config
+        else None,
     }
     template = loader.get_template("database_index.html")
     return HttpResponse(template.render(context, request))
 
 
+@staff_member_required
+def database_index_progress(request):
+    from ..background_tasks import task_progress
+    from django.apps import apps as django_apps
+
+    config = django_apps.get_app_config("bibliothecula")
+    return JsonResponse(task_progress(config.workers_ns))
+
+
 def database_docs(request):
     (exports, extended_exports) = sql_statements.get_exports()
     toc = []
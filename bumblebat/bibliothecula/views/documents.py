@@ -138,6 +138,10 @@ def add_document_storage(request, uuid):
                 print("Added file", _f)
                 bm = BinaryMetadata.from_file(_f)
                 print("new met", bm)
+                if bm.reused:
+                    messages.add_message(
+                        request, messages.INFO, reused_file_message(bm, _f.name)
+                    )
                 has, _ = DocumentHasBinaryMetadata.objects.get_or_create(
                     name=STORAGE_NAME, document=doc, metadata=bm
                 )
@@ -314,7 +318,22 @@ def remove_document_storage(request, uuid, metadata_uuid=None):
     return redirect(doc)
 
 
-from django.core.cache import cache
+from ..import_staging import (
+    SESSION_KEY as IMPORT_STAGING_KEY,
+    stage_uploads,
+    open_staged_file,
+    is_staged,
+    discard_staging,
+    staged_kind,
+    staged_thumbnails,
+    staged_texts,
+)
+
+
+def import_extractors():
+    from django.apps import apps as django_apps
+
+    return django_apps.get_app_config("bibliothecula").extractors
 
 
 @staff_member_required
@@ -327,28 +346,21 @@ def import_documents(request):
         print(files)
         if form.is_valid():
             print("got ", len(files), "files")
-            data_urls = []
-            for f in files:
-                dbg(f.name)
-                data_url = None
-                try:
-                    dbg(f.name.endswith(".pdf"))
-                    dbg(f.name.endswith(".epub"))
-                    if f.name.endswith(".pdf"):
-                        data_url = generate_pdf_thumbnail(f.name, blob=f.read())
-                    elif f.name.endswith(".epub"):
-                        data_url = generate_epub_thumbnail(f.name, blob=f.read())
-                    elif f.content_type.startswith("image"):
-                        data_url = generate_image_thumbnail(f.name, blob=f.read())
-                except Exception as exc:
-                    messages.add_message(
-                        request,
-                        messages.WARNING,
-                        f"Could not create thumbnail for {f.name}: {exc}",
-                    )
-                data_urls.append(data_url)
+            # A previous import that was never finished.
+            discard_staging(request.session.pop(IMPORT_STAGING_KEY, None))
+            manifest = stage_uploads(files)
+            data_urls, colors, errors = staged_thumbnails(
+                import_extractors(), manifest
+            )
+            for name, error in errors:
+                messages.add_message(
+                    request,
+                    messages.WARNING,
+                    f"Could not create thumbnail for {name}: {error}",
+                )
             request.session["import_thumbnails"] = json.dumps(data_urls)
-            cache.set("import_files", files, timeout=15 * 60)
+            request.session["import_thumbnail_colors"] = json.dumps(colors)
+            request.session[IMPORT_STAGING_KEY] = manifest
             return HttpResponseRedirect(reverse("import_documents_2"))
         else:
             messages.add_message(request, messages.ERROR, f"Form data is invalid.")
@@ -371,17 +383,25 @@ def import_documents_2(request, files=None):
     print("import_documents_2")
     dbg(request)
     dbg(request.method)
-    dbg("import_files" in cache)
-    if "import_files" not in cache:
-        messages.add_message(request, messages.ERROR, f"Files were not in cache?")
+    manifest = request.session.get(IMPORT_STAGING_KEY)
+    if not is_staged(manifest):
+        messages.add_message(
+            request,
+            messages.ERROR,
+            "Uploaded files were not found, upload them again.",
+        )
         return HttpResponseRedirect(reverse("import_documents"))
-    files = cache.get("import_files")
     DocFormSet = formset_factory(NewDocument, extra=0)
     try:
         thumbnails = json.loads(request.session["import_thumbnails"])
     except Exception as exc:
         dbg(exc)
-        thumbnails = [None for f in files]
+        thumbnails = [None for f in manifest]
+    try:
+        thumbnail_colors = json.loads(request.session["import_thumbnail_colors"])
+    except Exception as exc:
+        dbg(exc)
+        thumbnail_colors = [None for f in manifest]
     if request.method == "POST":
         print(request.POST)
         formset = DocFormSet(request.POST)
@@ -391,18 +411,42 @@ def import_documents_2(request, files=None):
                 new_docs = []
                 errored = False
                 try:
-                    with transaction.atomic():
+                    # Extract text before the transaction, which then only
+                    # holds the write lock while inserting.
+                    texts, errors = staged_texts(
+                        import_extractors(),
+                        manifest,
+                        [
+                            index
+                            for index, form in enumerate(formset)
+                            if form.cleaned_data["index"]
+                            and staged_kind(manifest[index]) == "pdf"
+                        ],
+                    )
+                    for name, error in errors:
+                        messages.add_message(
+                            request,
+                            messages.WARNING,
+                            f"Could not extract text of {name}: {error}",
+                        )
+                    # Look up files with the same contents (by the digests
+                    # computed while staging) and compress files before the
+                    # transaction as well.
+                    files = []
+                    for index, form in enumerate(formset):
+                        with open_staged_file(manifest[index]) as f:
+                            f.name = form.cleaned_data["filename"]
+                            files.append(BinaryMetadata.prepare_file(f))
+                    reused = []
+                    # New files by digest, for uploads staged more than once.
+                    stored = {}
+                    with transaction.atomic(using="bibliothecula"):
+                        entries = []
+                        colors = []
                         for index, form in enumerate(formset):
-                            f = files[index]
                             title = form.cleaned_data["title"]
-                            index_flag = form.cleaned_data["index"]
-                            is_pdf = f.name.endswith(".pdf")
-                            f.name = form.cleaned_data["filename"]
-                            dbg(f)
                             dbg(form.cleaned_data.items())
-                            print("transaction for index =", index, " title", title)
-                            doc = Document.objects.create(title=title)
-                            _type = None
+                            text_metadata = []
                             for (field_name, field_value) in [
                                 (TYPE_NAME, form.cleaned_data["_type"]),
                                 (DATE_NAME, form.cleaned_data["date"]),
@@ -411,61 +455,63 @@ def import_documents_2(request, files=None):
                             ]:
                                 if field_value != "":
                                     try:
-                                        u = uuid_lib.UUID(field_value)
-                                        m = TextMetadata.objects.all().get(uuid=u)
+                                        field_value = uuid_lib.UUID(field_value)
                                     except ValueError:
-                                        m, _ = TextMetadata.objects.get_or_create(
-                                            name=field_name, data=field_value
-                                        )
-                                    has = DocumentHasTextMetadata.objects.create(
-                                        name=field_name, document=doc, metadata=m
-                                    )
-                                    m.save()
-                                    has.save()
+                                        pass
+                                    text_metadata.append((field_name, field_value))
+                            binary_metadata = []
                             thumbnail = thumbnails[index]
                             if thumbnail is not None:
-                                # print("thumbnail for idx =", index," is ", thumbnail)
-                                m = BinaryMetadata.objects.create(
-                                    name=THUMBNAIL_NAME, data=str.encode(thumbnail)
-                                )
-                                has = DocumentHasBinaryMetadata.objects.create(
-                                    name=THUMBNAIL_NAME, document=doc, metadata=m
-                                )
-                                m.save()
-                                has.save()
-                            text = None
-                            if is_pdf and index_flag:
-                                f.seek(0)
-                                contents = f.read()
-                                text = get_pdf_text(io.BytesIO(contents))
-                            if text is not None:
-                                m = BinaryMetadata.objects.create(
-                                    name=FULL_TEXT_NAME, data=str.encode(text)
+                                thumbnail = BinaryMetadata(
+                                    name=THUMBNAIL_NAME,
+                                    data=thumbnail_blob(thumbnail),
                                 )
-                                has = DocumentHasBinaryMetadata.objects.create(
-                                    name=FULL_TEXT_NAME, document=doc, metadata=m
+                                binary_metadata.append((THUMBNAIL_NAME, thumbnail))
+                                if thumbnail_colors[index] is not None:
+                                    colors.append(
+                                        ThumbnailColor(
+                                            metadata=thumbnail,
+                                            color=thumbnail_colors[index],
+                                        )
+                                    )
+                            bm = files[index]
+                            if not bm.reused and bm.sha256 in stored:
+                                bm = stored[bm.sha256]
+                                bm.reused = True
+                            elif not bm.reused:
+                                with open_staged_file(manifest[index]) as f:
+                                    BinaryMetadata.save_file(bm, f)
+                                stored[bm.sha256] = bm
+                            if bm.reused:
+                                reused.append((form.cleaned_data["filename"], bm))
+                            binary_metadata.append((STORAGE_NAME, bm))
+                            entries.append(
+                                ImportEntry(
+                                    title,
+                                    text_metadata,
+                                    binary_metadata,
+                                    full_text=texts.get(index),
                                 )
-                                m.save()
-                                has.save()
-                            bm = BinaryMetadata.from_file(f)
-                            has = DocumentHasBinaryMetadata.objects.create(
-                                name=STORAGE_NAME, document=doc, metadata=bm
                             )
-                            bm.save()
-                            has.save()
-                            doc.save()
-                            new_docs.append(doc)
+                        new_docs, stats = bulk_import_documents(entries)
+                        ThumbnailColor.objects.bulk_create(colors)
                 except Exception as exc:
                     dbg(exc)
                     messages.add_message(request, messages.ERROR, f"Exception: {exc}.")
                     errored = True
                 if not errored:
+                    discard_staging(request.session.pop(IMPORT_STAGING_KEY, None))
                     for doc in new_docs:
                         messages.add_message(
                             request,
                             messages.SUCCESS,
                             f'Added document "{doc.title}" with uuid {doc.uuid}',
                         )
+                    for filename, bm in reused:
+                        messages.add_message(
+                            request, messages.INFO, reused_file_message(bm, filename)
+                        )
+                    messages.add_message(request, messages.INFO, f"Imported {stats}.")
                     if len(new_docs) == 1:
                         return redirect(new_docs[0])
                     return redirect(reverse("view_collection"))
@@ -496,8 +542,9 @@ def import_documents_2(request, files=None):
         except:
             book_type_uuid = None
         initials = []
-        for f in files:
-            title = f.name
+        for entry in manifest:
+            name = entry["name"]
+            title = name
             author = ""
             date = ""
             _type = "book"
@@ -505,24 +552,24 @@ def import_documents_2(request, files=None):
             if _type_uuid is not None:
                 _type = ""
             try:
-                date_m = year_pattern.search(f.name)
+                date_m = year_pattern.search(name)
                 date = date_m[1]
             except:
                 pass
             try:
-                author_title = author_title_pattern.search(f.name)
+                author_title = author_title_pattern.search(name)
                 author = author_title[1]
                 title = author_title[2]
             except:
                 pass
             try:
-                author_title_medium = author_title_medium_pattern.search(f.name)
+                author_title_medium = author_title_medium_pattern.search(name)
                 author = author_title[1]
                 title = author_title[2]
             except:
                 pass
             try:
-                if f.content_type.startswith("image"):
+                if entry["content_type"].startswith("image"):
                     _type_uuid = (
                         TextMetadata.objects.all()
                         .filter(name=TYPE_NAME, data="artwork")
@@ -533,11 +580,11 @@ def import_documents_2(request, files=None):
             except:
                 pass
             print("\n\ninitials\\")
-            dbg(f.name)
+            dbg(name)
             initials.append(
                 {
-                    "original_filename": f.name,
-                    "filename": f.name,
+                    "original_filename": name,
+                    "filename": name,
                     "index": _type
                     not in [
                         "artwork",
@@ -551,9 +598,8 @@ def import_documents_2(request, files=None):
             )
         formset = DocFormSet(initial=initials)
         # return HttpResponseRedirect(reverse('import_documents'))
-    # request.session['import_files'] = files
     context = {
-        "title": f'import {len(files)} file{"" if len(files) == 1 else "s"}',
+        "title": f'import {len(manifest)} file{"" if len(manifest) == 1 else "s"}',
         "formset": formset,
         "thumbnails": thumbnails,
         "add_document_form": AddDocument(),
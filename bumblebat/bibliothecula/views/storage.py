@@ -1,12 +1,20 @@
 from . import *
 from django import db
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
 from django.views.decorators.http import condition
 from django.utils.safestring import mark_safe
 from django.urls import reverse
 from uuid import UUID
 import html
 
+from ..blob_io import (
+    CHUNK_SIZE,
+    BlobReader,
+    content_disposition,
+    iter_range,
+    parse_range,
+)
 from markdown_it.rules_inline import StateInline
 from markdown_it.token import Token
 
@@ -135,6 +143,19 @@ def reflink(md):
     md.add_render_rule("link_open", reflink_render, fmt="html")
 
 
+@staff_member_required
+@condition(etag_func=thumbnail_etag)
+def view_thumbnail(request, metadata_uuid):
+    try:
+        m = BinaryMetadata.objects.get(pk=metadata_uuid, name=THUMBNAIL_NAME)
+    except BinaryMetadata.DoesNotExist:
+        raise Http404("Thumbnail with this uuid does not exist")
+    response = HttpResponse(thumbnail_blob(m.data), content_type="image/webp")
+    # A changed thumbnail gets a new uuid, so the URL's contents never change.
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
 @staff_member_required
 @condition(last_modified_func=last_modified_binary_metadata)
 def view_document_storage(request, uuid, metadata_uuid):
@@ -144,29 +165,66 @@ def view_document_storage(request, uuid, metadata_uuid):
         metadata_uuid = UUID(metadata_uuid)
 
     try:
-        m = BinaryMetadata.objects.get(pk=metadata_uuid)
+        # The blob is streamed below, don't load it here.
+        m = BinaryMetadata.objects.defer("data").get(pk=metadata_uuid)
     except BinaryMetadata.DoesNotExist:
         raise Http404("Binary metadata with this uuid does not exist")
+    if m.compressed:
+        filelike = io.BytesIO(m.contents())
+        length = len(filelike.getvalue())
+    else:
+        filelike = BlobReader.open(connections["bibliothecula"], metadata_uuid)
+        length = filelike.length
     _t = m.try_get_content_type()
     if _t is not None:
         filename = _t["filename"]
+        as_attachment = (
+            _t["content_type"]
+            not in [
+                "application/pdf",
+            ]
+            and not _t["content_type"].startswith("text/")
+            and not _t["content_type"].startswith("image/")
+        )
+    else:
+        filename = m.name
+        as_attachment = True
+
+    byte_range = None
+    last_modified = http_date(m.last_modified.timestamp())
+    # A range of a file that changed since If-Range is useless to the
+    # client, send the whole file instead.
+    if (
+        "HTTP_RANGE" in request.META
+        and request.META.get("HTTP_IF_RANGE", last_modified) == last_modified
+    ):
+        try:
+            byte_range = parse_range(request.META["HTTP_RANGE"], length)
+        except ValueError:
+            filelike.close()
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{length}"
+            return response
+    if byte_range is None:
         response = FileResponse(
-            io.BytesIO(m.data),
-            filename=filename,
-            as_attachment=(
-                _t["content_type"]
-                not in [
-                    "application/pdf",
-                ]
-                and not _t["content_type"].startswith("text/")
-                and not _t["content_type"].startswith("image/")
-            ),
+            filelike, filename=filename, as_attachment=as_attachment
         )
+        response.block_size = CHUNK_SIZE
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(filelike, start, end), status=206)
+        response["Content-Range"] = f"bytes {start}-{end}/{length}"
+        response["Content-Length"] = str(end - start + 1)
+        disposition = content_disposition(as_attachment, filename)
+        if disposition is not None:
+            response["Content-Disposition"] = disposition
+    response["Accept-Ranges"] = "bytes"
+    if _t is not None:
         response["Content-Type"] = _t["content_type"]
         if _t["content_type"].startswith("text/"):
             response["Content-Type"] += "; charset=UTF-8"
     else:
-        response = FileResponse(io.BytesIO(m.data), filename=m.name, as_attachment=True)
+        response["Content-Type"] = "application/octet-stream"
     return response
 
 
@@ -217,7 +275,7 @@ def document_storage_viewer(request, uuid, metadata_uuid):
     if _t is None or not _t["content_type"].startswith("text/"):
         return HttpResponseRedirect(reverse("view_document_storage"))
     try:
-        text = m.data.decode("utf-8")
+        text = m.contents().decode("utf-8")
         text_raw = text
 
         text = text2html(text, _t["content_type"])
@@ -309,20 +367,33 @@ def edit_plain_text_document(request, uuid, metadata_uuid=None):
             blob = str.encode(form.cleaned_data["content"])
             content_type = form.cleaned_data["content_type"]
             if has_metadata:
-                # Create new dummy BinaryMetadata
-                m = BinaryMetadata.new_file(
-                    blob,
-                    len(blob),
-                    uuid=None,
-                    content_type=content_type,
-                    filename=filename,
-                )
-                has_metadata.metadata.name = m.name
-                has_metadata.metadata.data = m.data
-                has_metadata.metadata.set_last_modified()
-                has_metadata.set_last_modified()
+                m = has_metadata.metadata
+                if m.documents.count() > 1:
+                    # The file is shared with other documents, which keep
+                    # the old contents.
+                    m = BinaryMetadata.new_file(
+                        blob,
+                        len(blob),
+                        content_type=content_type,
+                        filename=filename,
+                    )
+                    if m.reused and m.uuid != has_metadata.metadata_id:
+                        messages.add_message(
+                            request, messages.INFO, reused_file_message(m, filename)
+                        )
+                    if doc.binary_metadata.all().filter(metadata=m).exists():
+                        has_metadata.delete()
+                    else:
+                        has_metadata.metadata = m
+                        has_metadata.set_last_modified()
+                else:
+                    m.name = BinaryMetadata.file_name(
+                        len(blob), content_type, filename
+                    )
+                    m.data = blob
+                    m.set_last_modified()
+                    has_metadata.set_last_modified()
                 doc.set_last_modified()
-                m.delete()
             else:
                 m = BinaryMetadata.new_file(
                     blob,
@@ -332,6 +403,10 @@ def edit_plain_text_document(request, uuid, metadata_uuid=None):
                     filename=filename,
                 )
                 m.save()
+                if m.reused:
+                    messages.add_message(
+                        request, messages.INFO, reused_file_message(m, filename)
+                    )
                 has, _ = DocumentHasBinaryMetadata.objects.get_or_create(
                     name=STORAGE_NAME, document=doc, metadata=m
                 )
@@ -351,7 +426,7 @@ def edit_plain_text_document(request, uuid, metadata_uuid=None):
         filename = _t["filename"]
         _type = _t["content_type"]
         try:
-            content = has_metadata.metadata.data.decode(
+            content = has_metadata.metadata.contents().decode(
                 encoding="utf-8", errors="strict"
             )
         except:
@@ -25,29 +25,19 @@ books = entry_get_fn(root, ["entry"])
 print(root_uri)
 print(len(books), "books.")
 
-def add_text_metadata(doc, name, value):
-    m,_ = TextMetadata.objects.get_or_create(name=name,data=value)
-    has,_ = DocumentHasTextMetadata.objects.get_or_create(name=name, document=doc, metadata=m)
-    m.save()
-    has.save()
-
-def add_storage(doc, mime_type, filename, blob):
-    d = {
-            'content_type': mime_type.strip(),
-            'filename': filename.strip(),
-            'size': len(blob),
-            }
-    name = json.dumps(d,  separators=(',', ':'))
-    buf = io.BytesIO()
-    buf.write(blob)
-    buf.seek(0)
-    m,_ = BinaryMetadata.objects.get_or_create(name=name,data=buf.getvalue())
-    has,_ = DocumentHasBinaryMetadata.objects.get_or_create(name=STORAGE_NAME, document=doc, metadata=m)
-    m.save()
-    has.save()
-
 epub_mime_type = 'application/epub+zip'
+# Documents inserted per bulk_import_documents call; their downloaded epubs
+# are held in memory until then.
+IMPORT_BATCH = 100
 counter = 0
+imported = []
+entries = []
+import_stats = ImportStats()
+
+def flush():
+    docs, _ = bulk_import_documents(entries, stats=import_stats)
+    imported.extend(doc.uuid for doc in docs)
+    entries.clear()
 
 for b in books:
     url = entry_get_fn(b, ["id"])[0].text
@@ -59,17 +49,21 @@ for b in books:
     print(counter, title, epub_url)
     with urllib.request.urlopen(root_uri+epub_url) as ebook:
         blob =  ebook.read()
-    doc = Document.objects.create(title=title)
-    doc.save()
-    for t in tags:
-        add_text_metadata(doc, TAG_NAME, t)
-    add_text_metadata(doc, AUTHOR_NAME, author)
-    add_text_metadata(doc, TYPE_NAME, 'book')
-    add_text_metadata(doc, 'url', url)
-    add_text_metadata(doc, 'summary', summary)
     filename = epub_url.rpartition('/')[2]
-    add_storage(doc, epub_mime_type, filename, blob)
-    doc.create_thumbnail()
+    storage = BinaryMetadata(name=BinaryMetadata.file_name(len(blob), epub_mime_type, filename), data=blob)
+    text_metadata = [(TAG_NAME, t) for t in tags]
+    text_metadata += [(AUTHOR_NAME, author), (TYPE_NAME, 'book'), ('url', url), ('summary', summary)]
+    entries.append(ImportEntry(title, text_metadata, [(STORAGE_NAME, storage)]))
+    if len(entries) == IMPORT_BATCH:
+        flush()
     counter += 1
     if counter == MAX_BOOKS:
         break
+flush()
+print(import_stats)
+
+# Render all thumbnails in a process pool instead of one by one.
+stats = create_thumbnails(Document.objects.filter(uuid__in=imported), progress=print)
+for title, error in stats.failures:
+    print("Could not create thumbnail for", title, ":", error)
+print(stats)
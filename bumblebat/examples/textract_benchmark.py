@@ -0,0 +1,111 @@
+import argparse
+import io
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bibliothecula.text_extract import get_epub_text
+from bibliothecula.utils import Textractor
+
+# Time text extraction from synthetic EPUB files:
+# python3 examples/textract_benchmark.py
+# python3 examples/textract_benchmark.py --sizes 10x50000 --baseline
+#
+# "epub" is `get_epub_text` on an EPUB with CHAPTERS chapters of PARAGRAPHS
+# paragraphs each, "one document" feeds all the paragraphs to one
+# `Textractor`. --baseline also times a parser that appends to a string, as
+# `Textractor` did before it collected its output in a list.
+
+PARAGRAPH = "<p>Lorem ipsum  dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor.</p>\n"
+
+
+class StringTextractor(Textractor):
+    def reset(self):
+        super().reset()
+        self.text = ""
+
+    @property
+    def output(self):
+        return self.text
+
+    def handle_data(self, data):
+        if self.ignore == 0:
+            self.text += self.clean(data)
+
+
+def chapter(paragraphs):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml"><head><title>chapter</title></head>\n<body>\n'
+        + PARAGRAPH * paragraphs
+        + "</body></html>\n"
+    )
+
+
+def make_epub(chapters, paragraphs):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("mimetype", "application/epub+zip", zipfile.ZIP_STORED)
+        z.writestr(
+            "META-INF/container.xml",
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>',
+        )
+        items = "".join(
+            f'<item id="c{i}" href="c{i}.xhtml" media-type="application/xhtml+xml"/>'
+            for i in range(chapters)
+        )
+        itemrefs = "".join(f'<itemref idref="c{i}"/>' for i in range(chapters))
+        z.writestr(
+            "OEBPS/content.opf",
+            f'<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0"><manifest>{items}</manifest><spine>{itemrefs}</spine></package>',
+        )
+        for i in range(chapters):
+            z.writestr(f"OEBPS/c{i}.xhtml", chapter(paragraphs))
+    return buf.getvalue()
+
+
+def one_document(parser_class, html):
+    parser = parser_class()
+    for line in io.StringIO(html):
+        parser.feed(line)
+    parser.close()
+    return parser.output
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=["20x2000", "40x5000"],
+        metavar="CHAPTERSxPARAGRAPHS",
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        action="store_true",
+        help="also time a parser that appends its output to a string",
+    )
+    args = arg_parser.parse_args()
+    for size in args.sizes:
+        chapters, paragraphs = (int(n) for n in size.split("x"))
+        epub = make_epub(chapters, paragraphs)
+        html = chapter(chapters * paragraphs)
+        print(
+            f"{size}: epub {timed(get_epub_text, io.BytesIO(epub)):.2f}s, one document {timed(one_document, Textractor, html):.2f}s"
+        )
+        if args.baseline:
+            print(
+                f"{size}: one document (string output) {timed(one_document, StringTextractor, html):.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,13 @@ UPDATE_LAST_MODIFIED_DOCUMENT                           | Update Document last_m
 UPDATE_LAST_MODIFIED_HAS_BINARY                         | Update DocumentHasBinaryMetadata last_modified field on UPDATE
 UPDATE_LAST_MODIFIED_HAS_TEXT                           | Update DocumentHasTextMetadata last_modified field on UPDATE
 UPDATE_LAST_MODIFIED_TEXT                               | Update TextMetadata last_modified field on UPDATE
+BINARYMETADATA_SHA256_RESET                             | Forget the digest of a blob changed by a client that doesn't compute...
+CREATE_INDEX_BINARYMETADATA_SHA256                      | Index binary metadata by content digest, to find an existing copy of...
+CREATE_PDF_PAGE_TEXT                                    | Text extracted from each page of a PDF file, keyed by the binary...
+CREATE_THUMBNAIL_COLOR                                  | Average colour of each thumbnail, keyed by the thumbnail's binary...
+CREATE_DOCUMENT_SUMMARY                                 | Optional materialized summary of each document: everything a...
+CREATE_JOBS                                             | Persistent queue of background work (full-text extraction and...
+CREATE_TRIGRAM_ROWS                                     | Integer keys of the rows of the optional metadata_trigram_fts index,...
 UNDOLOG_CREATE_TRIGGER_BINARYMETADATA_DELETE            | CREATE TRIGGER binary_dt BEFORE DELETE ON BinaryMetadata BEGIN INSERT...
 UNDOLOG_CREATE_TRIGGER_BINARYMETADATA_INSERT            | CREATE TRIGGER binary_it AFTER INSERT ON BinaryMetadata BEGIN INSERT...
 UNDOLOG_CREATE_TRIGGER_BINARYMETADATA_UPDATE            | CREATE TRIGGER binary_ut AFTER UPDATE ON BinaryMetadata BEGIN INSERT...
@@ -25,29 +32,69 @@ UNDOLOG_CREATE_TRIGGER_DOCUMENTS_UPDATE                 | CREATE TRIGGER doc_ut
 UNDOLOG_CREATE_TRIGGER_TEXTMETADATA_DELETE              | CREATE TRIGGER text_dt BEFORE DELETE ON TextMetadata BEGIN INSERT...
 UNDOLOG_CREATE_TRIGGER_TEXTMETADATA_INSERT              | CREATE TRIGGER text_it AFTER INSERT ON TextMetadata BEGIN INSERT INTO...
 UNDOLOG_CREATE_TRIGGER_TEXTMETADATA_UPDATE              | CREATE TRIGGER text_ut AFTER UPDATE ON TextMetadata BEGIN INSERT INTO...
+CREATE_DOCUMENT_SUMMARY_VIEW                            | Computes the rows of document_summary. Selecting a single uuid from...
+CREATE_INDEX_JOBS_QUEUE                                 | Index for claiming the next queued job of a kind....
+CREATE_VIEW_METADATA_TRIGRAM                            | Content of the metadata_trigram_fts index: the title of each...
+DOCUMENT_SUMMARY_BINARYMETADATA_UPDATE                  | Update the document_summary rows of all documents that have a...
+DOCUMENT_SUMMARY_DOCUMENTS_DELETE                       | Remove the document_summary row of deleted documents....
+DOCUMENT_SUMMARY_DOCUMENTS_INSERT                       | Add a document_summary row for new documents....
+DOCUMENT_SUMMARY_DOCUMENTS_UPDATE                       | Update document_summary when a document's title changes....
+DOCUMENT_SUMMARY_HAS_BINARY_DELETE                      | Update document_summary when binary metadata is removed from a...
+DOCUMENT_SUMMARY_HAS_BINARY_INSERT                      | Update document_summary when binary metadata is added to a document....
+DOCUMENT_SUMMARY_HAS_BINARY_UPDATE                      | Update document_summary when binary metadata of a document is...
+DOCUMENT_SUMMARY_HAS_TEXT_DELETE                        | Update document_summary when text metadata is removed from a...
+DOCUMENT_SUMMARY_HAS_TEXT_INSERT                        | Update document_summary when text metadata is added to a document....
+DOCUMENT_SUMMARY_HAS_TEXT_UPDATE                        | Update document_summary when text metadata of a document is replaced....
+DOCUMENT_SUMMARY_TEXTMETADATA_UPDATE                    | Update the document_summary rows of all documents that have a...
+DOCUMENT_SUMMARY_THUMBNAIL_COLOR_INSERT                 | Update the document_summary rows of the documents of a thumbnail when...
+DOCUMENT_SUMMARY_THUMBNAIL_COLOR_UPDATE                 | Update the document_summary rows of the documents of a thumbnail when...
+TRIGRAM_CREATE_TABLE                                    | Create an optional index of titles, text metadata values and binary...
+TRIGRAM_BINARYMETADATA_DELETE                           | Remove deleted binary metadata names from metadata_trigram_fts....
+TRIGRAM_BINARYMETADATA_INSERT                           | Index new binary metadata names in metadata_trigram_fts....
+TRIGRAM_BINARYMETADATA_UPDATE                           | Reindex changed binary metadata names in metadata_trigram_fts. The...
+TRIGRAM_DOCUMENTS_DELETE                                | Remove deleted document titles from metadata_trigram_fts....
+TRIGRAM_DOCUMENTS_INSERT                                | Index new document titles in metadata_trigram_fts....
+TRIGRAM_DOCUMENTS_UPDATE                                | Reindex changed document titles in metadata_trigram_fts. The old...
+TRIGRAM_TEXTMETADATA_DELETE                             | Remove deleted text metadata values from metadata_trigram_fts....
+TRIGRAM_TEXTMETADATA_INSERT                             | Index new text metadata values in metadata_trigram_fts....
+TRIGRAM_TEXTMETADATA_UPDATE                             | Reindex changed text metadata values in metadata_trigram_fts. The old...
 
 
 Appendix: useful statements
 
-id                             | summary
--------------------------------+-------------------------------------------------------------------------
-CLI_EDIT_FILE                  | Edit any binary BLOB with the edit() function in the CLI....
-CLI_EXCTRACT_FILE              | Exctract a binary BLOB from any column using the CLI....
-CLI_INSERT_FILE                | The sqlite3 CLI has some special I/O function to facilate reading and...
-CLI_VIEW_FILE                  | View any binary BLOB with the edit() function in the CLI by ignoring...
-REMOVE_DUPLICATE_ROWS          | If you need to remove duplicate rows, adapt this statement to your...
-UNDOLOG_DELETE_BIG_ENTRIES     | Delete big binary files (> 1MiB) from undolog to free up space
-UNDOLOG_QUERY_SIZE             | Query total size of undolog table.
-FTS_INTEGRITY_CHECK            | This command is used to verify that the full-text index is internally...
-FTS_OPTIMIZE                   | This command merges all individual b-trees that currently make up the...
-FTS_REBUILD                    | This command first deletes the entire full-text index, then rebuilds...
-FTS_SEARCH                     | This command queries the full-text search index for documents....
-FTS_SELECT_CONFIG              | This command returns the values of persistent configuration...
-QUERY_UUID_WITH_HYPHENS        | Match against uuid string with hyphens.
-QUERY_BACKREFS_FROM_TEXT_FILES | Find backreferences from plain text files.
-QUERY_BACKREF_CANDIDATES       | SELECT DISTINCT token FROM uuidtok WHERE input = (SELECT data FROM...
-QUERY_TEXT_FILES               | Select text files.
-QUERY_VALID_JSON_NAMES         | Search for valid JSON names.
+id                                 | summary
+-----------------------------------+-------------------------------------------------------------------------
+CLI_EDIT_FILE                      | Edit any binary BLOB with the edit() function in the CLI....
+CLI_EXCTRACT_FILE                  | Exctract a binary BLOB from any column using the CLI....
+CLI_INSERT_FILE                    | The sqlite3 CLI has some special I/O function to facilate reading and...
+CLI_VIEW_FILE                      | View any binary BLOB with the edit() function in the CLI by ignoring...
+REMOVE_DUPLICATE_ROWS              | If you need to remove duplicate rows, adapt this statement to your...
+BINARYMETADATA_ADD_SHA256          | Add the sha256 column to databases created before it existed. It...
+QUERY_TEXT_FILES                   | Select text files.
+QUERY_VALID_JSON_NAMES             | Search for valid JSON names.
+QUERY_UUID_WITH_HYPHENS            | Match against uuid string with hyphens.
+UNDOLOG_DELETE_BIG_ENTRIES         | Delete big binary files (> 1MiB) from undolog to free up space
+UNDOLOG_QUERY_SIZE                 | Query total size of undolog table.
+QUERY_BACKREFS_FROM_TEXT_FILES     | Find backreferences from plain text files.
+QUERY_BACKREF_CANDIDATES           | SELECT DISTINCT token FROM uuidtok WHERE input = (SELECT data FROM...
+FTS_INTEGRITY_CHECK                | This command is used to verify that the full-text index is internally...
+FTS_OPTIMIZE                       | This command merges all individual b-trees that currently make up the...
+FTS_REBUILD                        | This command first deletes the entire full-text index, then rebuilds...
+FTS_SEARCH                         | This command queries the full-text search index for documents....
+FTS_SELECT_CONFIG                  | This command returns the values of persistent configuration...
+PDF_PAGE_TEXT_INSERT               | Store the text of a page.
+THUMBNAIL_COLOR_FROM_TEXT_METADATA | Copy thumbnail colours stored as thumbnail-color text metadata of...
+JOBS_ADD_HEARTBEAT                 | Add the heartbeat column to job tables created before it existed....
+JOBS_ADD_OWNER                     | Add the owner column to job tables created before it existed....
+JOBS_DONE                          | Mark a claimed job as done.
+JOBS_ENQUEUE                       | Queue a job, or queue it again if it has finished. Jobs that are...
+JOBS_FAIL                          | Record the error of a claimed job and queue it again after a backoff...
+JOBS_HEARTBEAT                     | Record that an owner is still working on its running jobs.
+JOBS_REQUEUE_RUNNING               | Put the running jobs of an owner that were interrupted (e.g. by a...
+TRIGRAM_REBUILD_ROWS               | Add the missing metadata_trigram_rows. Use this, and then...
+DOCUMENT_SUMMARY_REBUILD           | Recompute every row of document_summary. Use this after creating the...
+JOBS_CLAIM                         | Atomically claim the next queued job of a kind for an owner. Since it...
+TRIGRAM_REBUILD                    | Rebuild the metadata_trigram_fts index from its content....
  */
 
 /* CREATE_BACKREF_INDEX
@@ -125,6 +172,101 @@ BEGIN
     WHERE uuid = NEW.uuid;
 END;
 
+/* BINARYMETADATA_SHA256_RESET
+ Forget the digest of a blob changed by a client that doesn't compute
+ digests. https://sqlite.org/lang_createtrigger.html sqlite3 reference
+ for for creating triggers */
+CREATE TRIGGER IF NOT EXISTS binary_metadata_sha256_reset
+AFTER UPDATE OF data ON BinaryMetadata
+WHEN NEW.sha256 IS NOT NULL AND NEW.sha256 IS OLD.sha256 AND NEW.data IS NOT OLD.data
+BEGIN
+  UPDATE BinaryMetadata SET sha256 = NULL WHERE uuid = NEW.uuid;
+END;
+
+/* CREATE_INDEX_BINARYMETADATA_SHA256
+ Index binary metadata by content digest, to find an existing copy of a
+ file without comparing blobs. https://sqlite.org/lang_createindex.html
+ sqlite3 reference for for creating indexes */
+CREATE INDEX IF NOT EXISTS binary_metadata_sha256_idx
+    ON BinaryMetadata(sha256);
+
+/* CREATE_PDF_PAGE_TEXT
+ Text extracted from each page of a PDF file, keyed by the binary
+ metadata of the file. Extraction of a big PDF is split in ranges of
+ pages; pages already in this table are not extracted again when an
+ interrupted extraction is retried. The pages of a file are deleted
+ once its full text is stored. https://sqlite.org/withoutrowid.html
+ sqlite3 reference for for WITHOUT ROWID tables */
+CREATE TABLE IF NOT EXISTS "pdf_page_text" (
+        "metadata_uuid" CHARACTER(32) NOT NULL REFERENCES "BinaryMetadata" ("uuid") ON DELETE CASCADE,
+        "page" INTEGER NOT NULL, -- numbered from 1
+        "text" TEXT NOT NULL,
+        PRIMARY KEY ("metadata_uuid", "page")
+) WITHOUT ROWID;
+
+/* CREATE_THUMBNAIL_COLOR
+ Average colour of each thumbnail, keyed by the thumbnail's binary
+ metadata, so that listings can tint a card without decoding the image.
+ https://sqlite.org/withoutrowid.html sqlite3 reference for for WITHOUT
+ ROWID tables */
+CREATE TABLE IF NOT EXISTS "thumbnail_color" (
+        "metadata_uuid" CHARACTER(32) NOT NULL PRIMARY KEY REFERENCES "BinaryMetadata" ("uuid") ON DELETE CASCADE,
+        "color" TEXT NOT NULL -- #rrggbb
+) WITHOUT ROWID;
+
+/* CREATE_DOCUMENT_SUMMARY
+ Optional materialized summary of each document: everything a
+ collection listing shows, in one narrow row. Lists are separated by
+ the char(31) unit separator. It is kept up to date by the
+ DOCUMENT_SUMMARY_* triggers; run DOCUMENT_SUMMARY_REBUILD to fill it
+ for an existing database. Linked files live outside the database so
+ only their number is stored, not their size. */
+CREATE TABLE IF NOT EXISTS "document_summary" (
+        "uuid" CHARACTER(32) NOT NULL PRIMARY KEY,
+        "title" TEXT NOT NULL,
+        "authors" TEXT NULL, -- separated by char(31)
+        "tags" TEXT NULL, -- separated by char(31)
+        "type" TEXT NULL,
+        "thumbnail_uuid" CHARACTER(32) NULL,
+        "thumbnail_color" TEXT NULL,
+        "formats" TEXT NULL, -- separated by char(31)
+        "files_no" INTEGER NOT NULL DEFAULT (0),
+        "linked_files_no" INTEGER NOT NULL DEFAULT (0),
+        "embedded_size" INTEGER NOT NULL DEFAULT (0)
+);
+
+/* CREATE_JOBS
+ Persistent queue of background work (full-text extraction and
+ thumbnail generation), one row per kind of work and document. Jobs
+ that fail are retried after not_before until they run out of attempts.
+ A running job records the process that claimed it in owner, which
+ refreshes heartbeat while it works. */
+CREATE TABLE IF NOT EXISTS "jobs" (
+        "id" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        "kind" TEXT NOT NULL, -- 'index' or 'thumbnail'
+        "document_uuid" CHARACTER(32) NOT NULL REFERENCES "Documents" ("uuid") ON DELETE CASCADE,
+        "state" TEXT NOT NULL DEFAULT ('queued') CHECK ("state" IN ('queued', 'running', 'done', 'failed')),
+        "attempts" INTEGER NOT NULL DEFAULT (0),
+        "last_error" TEXT NULL,
+        "not_before" DATETIME NOT NULL DEFAULT (datetime ('now')),
+        "created" DATETIME NOT NULL DEFAULT (datetime ('now')),
+        "started" DATETIME NULL,
+        "finished" DATETIME NULL,
+        "owner" TEXT NULL, -- 'hostname:pid' of the process running the job
+        "heartbeat" DATETIME NULL,
+        UNIQUE ("kind", "document_uuid")
+);
+
+/* CREATE_TRIGRAM_ROWS
+ Integer keys of the rows of the optional metadata_trigram_fts index,
+ one per document, text metadata and binary metadata. These tables have
+ no integer primary key, and their rowid can change on VACUUM, so the
+ index can't use it. */
+CREATE TABLE IF NOT EXISTS "metadata_trigram_rows" (
+        "id" INTEGER NOT NULL PRIMARY KEY,
+        "uuid" CHARACTER(32) NOT NULL UNIQUE
+);
+
 /* UNDOLOG_CREATE_TRIGGER_BINARYMETADATA_DELETE */
 CREATE TRIGGER binary_dt
 BEFORE DELETE ON BinaryMetadata
@@ -289,6 +431,377 @@ BEGIN
   WHERE uuid='||quote(OLD.uuid));
 END;
 
+/* CREATE_DOCUMENT_SUMMARY_VIEW
+ Computes the rows of document_summary. Selecting a single uuid from it
+ only looks at that document's metadata. The size of embedded files is
+ the uncompressed size recorded in their name, not the length of the
+ stored blob. https://sqlite.org/lang_createview.html sqlite3 reference
+ for for creating views */
+CREATE VIEW IF NOT EXISTS document_summary_view AS
+SELECT
+    d.uuid AS uuid,
+    d.title AS title,
+    (SELECT GROUP_CONCAT(data, char(31)) FROM (SELECT tm.data AS data
+            FROM DocumentHasTextMetadata AS has
+            JOIN TextMetadata AS tm ON has.metadata_uuid = tm.uuid
+            WHERE has.document_uuid = d.uuid AND tm.name = 'author'
+            ORDER BY has.id)) AS authors,
+    (SELECT GROUP_CONCAT(data, char(31)) FROM (SELECT tm.data AS data
+            FROM DocumentHasTextMetadata AS has
+            JOIN TextMetadata AS tm ON has.metadata_uuid = tm.uuid
+            WHERE has.document_uuid = d.uuid AND tm.name = 'tag'
+            ORDER BY has.id)) AS tags,
+    (SELECT tm.data
+        FROM DocumentHasTextMetadata AS has
+        JOIN TextMetadata AS tm ON has.metadata_uuid = tm.uuid
+        WHERE has.document_uuid = d.uuid AND tm.name = 'type'
+        ORDER BY has.id LIMIT 1) AS type,
+    (SELECT has.metadata_uuid
+        FROM DocumentHasBinaryMetadata AS has
+        WHERE has.document_uuid = d.uuid AND has.name = 'thumbnail'
+        ORDER BY has.id DESC LIMIT 1) AS thumbnail_uuid,
+    (SELECT tc.color
+        FROM DocumentHasBinaryMetadata AS has
+        JOIN thumbnail_color AS tc ON has.metadata_uuid = tc.metadata_uuid
+        WHERE has.document_uuid = d.uuid AND has.name = 'thumbnail'
+        ORDER BY has.id DESC LIMIT 1) AS thumbnail_color,
+    (SELECT GROUP_CONCAT(suffix, char(31)) FROM (SELECT
+            replace(filename, rtrim(filename, replace(filename, '.', '')), '') AS suffix
+            FROM (SELECT CASE WHEN bm.name = 'path'
+                    THEN CAST(bm.data AS TEXT)
+                    ELSE json_extract(bm.name, '$.filename') END AS filename
+                FROM DocumentHasBinaryMetadata AS has
+                JOIN BinaryMetadata AS bm ON has.metadata_uuid = bm.uuid
+                WHERE has.document_uuid = d.uuid AND has.name = 'storage'
+                AND (bm.name = 'path' OR json_valid(bm.name))
+                ORDER BY has.id)
+            WHERE instr(filename, '.') > 0 AND instr(suffix, '/') = 0
+            AND length(suffix) > 0)) AS formats,
+    (SELECT COUNT(*)
+        FROM DocumentHasBinaryMetadata AS has
+        WHERE has.document_uuid = d.uuid AND has.name = 'storage') AS files_no,
+    (SELECT COUNT(*)
+        FROM DocumentHasBinaryMetadata AS has
+        JOIN BinaryMetadata AS bm ON has.metadata_uuid = bm.uuid
+        WHERE has.document_uuid = d.uuid AND has.name = 'storage'
+        AND bm.name = 'path') AS linked_files_no,
+    (SELECT IFNULL(SUM(CAST(json_extract(bm.name, '$.size') AS INTEGER)), 0)
+        FROM DocumentHasBinaryMetadata AS has
+        JOIN BinaryMetadata AS bm ON has.metadata_uuid = bm.uuid
+        WHERE has.document_uuid = d.uuid AND has.name = 'storage'
+        AND bm.name != 'path' AND json_valid(bm.name)) AS embedded_size
+FROM
+    Documents AS d;
+
+/* CREATE_INDEX_JOBS_QUEUE
+ Index for claiming the next queued job of a kind.
+ https://sqlite.org/lang_createindex.html sqlite3 reference for for
+ creating indexes */
+CREATE INDEX IF NOT EXISTS "jobs_queue_idx" ON "jobs" ("state", "kind", "not_before");
+
+/* CREATE_VIEW_METADATA_TRIGRAM
+ Content of the metadata_trigram_fts index: the title of each document,
+ the value of each text metadata and the name of each binary metadata.
+ https://sqlite.org/lang_createview.html sqlite3 reference for for
+ creating views */
+CREATE VIEW IF NOT EXISTS metadata_trigram_view (id, uuid, data) AS
+SELECT
+    r.id, r.uuid, d.title
+FROM
+    metadata_trigram_rows AS r
+    JOIN Documents AS d ON d.uuid = r.uuid
+UNION ALL
+SELECT
+    r.id, r.uuid, tm.data
+FROM
+    metadata_trigram_rows AS r
+    JOIN TextMetadata AS tm ON tm.uuid = r.uuid
+UNION ALL
+SELECT
+    r.id, r.uuid, bm.name
+FROM
+    metadata_trigram_rows AS r
+    JOIN BinaryMetadata AS bm ON bm.uuid = r.uuid;
+
+/* DOCUMENT_SUMMARY_BINARYMETADATA_UPDATE
+ Update the document_summary rows of all documents that have a modified
+ binary metadata, e.g. a replaced file.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_binary_ut
+    AFTER UPDATE OF name, data ON BinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasBinaryMetadata WHERE metadata_uuid = NEW.uuid);
+END;
+
+/* DOCUMENT_SUMMARY_DOCUMENTS_DELETE
+ Remove the document_summary row of deleted documents.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_doc_dt
+    AFTER DELETE ON Documents
+BEGIN
+    DELETE FROM document_summary WHERE uuid = OLD.uuid;
+END;
+
+/* DOCUMENT_SUMMARY_DOCUMENTS_INSERT
+ Add a document_summary row for new documents.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_doc_it
+    AFTER INSERT ON Documents
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.uuid;
+END;
+
+/* DOCUMENT_SUMMARY_DOCUMENTS_UPDATE
+ Update document_summary when a document's title changes.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_doc_ut
+    AFTER UPDATE OF title ON Documents
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.uuid;
+END;
+
+/* DOCUMENT_SUMMARY_HAS_BINARY_DELETE
+ Update document_summary when binary metadata is removed from a
+ document. https://sqlite.org/lang_createtrigger.html sqlite3 reference
+ for for creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_has_binary_dt
+    AFTER DELETE ON DocumentHasBinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+END;
+
+/* DOCUMENT_SUMMARY_HAS_BINARY_INSERT
+ Update document_summary when binary metadata is added to a document.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_has_binary_it
+    AFTER INSERT ON DocumentHasBinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;
+
+/* DOCUMENT_SUMMARY_HAS_BINARY_UPDATE
+ Update document_summary when binary metadata of a document is
+ replaced. https://sqlite.org/lang_createtrigger.html sqlite3 reference
+ for for creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_has_binary_ut
+    AFTER UPDATE OF name, document_uuid, metadata_uuid ON DocumentHasBinaryMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;
+
+/* DOCUMENT_SUMMARY_HAS_TEXT_DELETE
+ Update document_summary when text metadata is removed from a document.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_has_text_dt
+    AFTER DELETE ON DocumentHasTextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+END;
+
+/* DOCUMENT_SUMMARY_HAS_TEXT_INSERT
+ Update document_summary when text metadata is added to a document.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_has_text_it
+    AFTER INSERT ON DocumentHasTextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;
+
+/* DOCUMENT_SUMMARY_HAS_TEXT_UPDATE
+ Update document_summary when text metadata of a document is replaced.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_has_text_ut
+    AFTER UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = OLD.document_uuid;
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid = NEW.document_uuid;
+END;
+
+/* DOCUMENT_SUMMARY_TEXTMETADATA_UPDATE
+ Update the document_summary rows of all documents that have a modified
+ text metadata, e.g. a renamed tag.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_text_ut
+    AFTER UPDATE OF name, data ON TextMetadata
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasTextMetadata WHERE metadata_uuid = NEW.uuid);
+END;
+
+/* DOCUMENT_SUMMARY_THUMBNAIL_COLOR_INSERT
+ Update the document_summary rows of the documents of a thumbnail when
+ its colour is stored. https://sqlite.org/lang_createtrigger.html
+ sqlite3 reference for for creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_thumbnail_color_it
+    AFTER INSERT ON thumbnail_color
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasBinaryMetadata WHERE metadata_uuid = NEW.metadata_uuid);
+END;
+
+/* DOCUMENT_SUMMARY_THUMBNAIL_COLOR_UPDATE
+ Update the document_summary rows of the documents of a thumbnail when
+ its colour changes. https://sqlite.org/lang_createtrigger.html sqlite3
+ reference for for creating triggers */
+CREATE TRIGGER IF NOT EXISTS document_summary_thumbnail_color_ut
+    AFTER UPDATE OF color ON thumbnail_color
+BEGIN
+    REPLACE INTO document_summary
+    SELECT * FROM document_summary_view WHERE uuid IN
+        (SELECT document_uuid FROM DocumentHasBinaryMetadata WHERE metadata_uuid = NEW.metadata_uuid);
+END;
+
+/* TRIGRAM_CREATE_TABLE
+ Create an optional index of titles, text metadata values and binary
+ metadata names with the trigram tokenizer (SQLite 3.34 and later).
+ Querying it with a phrase finds values that contain the phrase
+ anywhere, like LIKE '%phrase%' does with a full scan, as long as the
+ phrase is at least three characters long.
+ https://sqlite.org/fts5.html#the_trigram_tokenizer sqlite3 reference */
+CREATE VIRTUAL TABLE IF NOT EXISTS metadata_trigram_fts
+    USING fts5(data, content='metadata_trigram_view', content_rowid='id',
+        tokenize='trigram');
+
+/* TRIGRAM_BINARYMETADATA_DELETE
+ Remove deleted binary metadata names from metadata_trigram_fts.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_bm_dt
+    AFTER DELETE ON BinaryMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.name FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    DELETE FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+END;
+
+/* TRIGRAM_BINARYMETADATA_INSERT
+ Index new binary metadata names in metadata_trigram_fts.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_bm_it
+    AFTER INSERT ON BinaryMetadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_trigram_rows (uuid) VALUES (NEW.uuid);
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.name FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;
+
+/* TRIGRAM_BINARYMETADATA_UPDATE
+ Reindex changed binary metadata names in metadata_trigram_fts. The old
+ value is removed from the index with the OLD row, since the view
+ already returns the new one.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_bm_ut
+    AFTER UPDATE OF name ON BinaryMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.name FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.name FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;
+
+/* TRIGRAM_DOCUMENTS_DELETE
+ Remove deleted document titles from metadata_trigram_fts.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_doc_dt
+    AFTER DELETE ON Documents
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.title FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    DELETE FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+END;
+
+/* TRIGRAM_DOCUMENTS_INSERT
+ Index new document titles in metadata_trigram_fts.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_doc_it
+    AFTER INSERT ON Documents
+BEGIN
+    INSERT OR IGNORE INTO metadata_trigram_rows (uuid) VALUES (NEW.uuid);
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.title FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;
+
+/* TRIGRAM_DOCUMENTS_UPDATE
+ Reindex changed document titles in metadata_trigram_fts. The old value
+ is removed from the index with the OLD row, since the view already
+ returns the new one. https://sqlite.org/lang_createtrigger.html
+ sqlite3 reference for for creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_doc_ut
+    AFTER UPDATE OF title ON Documents
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.title FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.title FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;
+
+/* TRIGRAM_TEXTMETADATA_DELETE
+ Remove deleted text metadata values from metadata_trigram_fts.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_tm_dt
+    AFTER DELETE ON TextMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.data FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    DELETE FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+END;
+
+/* TRIGRAM_TEXTMETADATA_INSERT
+ Index new text metadata values in metadata_trigram_fts.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_tm_it
+    AFTER INSERT ON TextMetadata
+BEGIN
+    INSERT OR IGNORE INTO metadata_trigram_rows (uuid) VALUES (NEW.uuid);
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.data FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;
+
+/* TRIGRAM_TEXTMETADATA_UPDATE
+ Reindex changed text metadata values in metadata_trigram_fts. The old
+ value is removed from the index with the OLD row, since the view
+ already returns the new one.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS metadata_trigram_tm_ut
+    AFTER UPDATE OF data ON TextMetadata
+BEGIN
+    INSERT INTO metadata_trigram_fts (metadata_trigram_fts, rowid, data)
+    SELECT 'delete', id, OLD.data FROM metadata_trigram_rows WHERE uuid = OLD.uuid;
+    INSERT INTO metadata_trigram_fts (rowid, data)
+    SELECT id, NEW.data FROM metadata_trigram_rows WHERE uuid = NEW.uuid;
+END;
+
 /* Appendix: useful statements */
 
 
@@ -354,6 +867,42 @@ DELETE FROM table WHERE rowid NOT IN
      GROUP BY unique_column_1, unique_column_2; */
 
 
+/* BINARYMETADATA_ADD_SHA256
+
+ Add the sha256 column to databases created before it existed. It holds
+ the hex SHA-256 digest of data, or NULL if it hasn't been computed
+ yet. https://sqlite.org/lang_altertable.html sqlite3 reference for for
+ altering tables
+
+ALTER TABLE "BinaryMetadata" ADD COLUMN "sha256" CHARACTER(64) NULL; */
+
+
+/* QUERY_TEXT_FILES
+
+ Select text files.
+
+SELECT uuid, name, json_extract(name, '$.content_type') AS _type
+    FROM BinaryMetadata
+    WHERE json_valid(name)
+    AND _type LIKE "%text/%"; */
+
+
+/* QUERY_VALID_JSON_NAMES
+
+ Search for valid JSON names.
+
+SELECT uuid, name FROM BinaryMetadata WHERE json_valid(name); */
+
+
+/* QUERY_UUID_WITH_HYPHENS
+
+ Match against uuid string with hyphens.
+
+SELECT * FROM Documents
+    WHERE uuid =
+    REPLACE('7ec63f30-5882-46ac-855d-bdcaf8f29700', '-', ''); */
+
+
 /* UNDOLOG_DELETE_BIG_ENTRIES
 
  Delete big binary files (> 1MiB) from undolog to free up space
@@ -368,6 +917,31 @@ DELETE FROM undolog WHERE length(sql AS BLOB) > 1000000; */
 SELECT SUM(pgsize) FROM dbstat WHERE name = 'undolog'; */
 
 
+/* QUERY_BACKREFS_FROM_TEXT_FILES
+
+ Find backreferences from plain text files.
+
+SELECT DISTINCT REPLACE(tok.token, '-', '') AS target,
+    texts.uuid AS referrer FROM uuidtok AS tok,
+    (SELECT uuid, data,
+    json_extract(name, '$.content_type') AS _type
+    FROM BinaryMetadata
+    WHERE json_valid(name) AND _type LIKE "%text/%")
+    AS texts
+    WHERE tok.input=texts.data AND LENGTH(tok.token) = 36
+    AND EXISTS (SELECT * FROM Documents WHERE uuid = REPLACE(tok.token, '-', '')); */
+
+
+/* QUERY_BACKREF_CANDIDATES
+
+
+SELECT DISTINCT token FROM uuidtok
+    WHERE input =
+    (SELECT data FROM BinaryMetadata
+    WHERE uuid = '17ee75452e574e03b0b8e4ef2bc9be25')
+    AND LENGTH(token) = 36; */
+
+
 /* FTS_INTEGRITY_CHECK
 
  This command is used to verify that the full-text index is internally
@@ -418,52 +992,158 @@ SELECT uuid FROM document_title_authors_text_view_fts('query text'); */
 SELECT * FROM document_title_authors_text_view_fts_config; */
 
 
-/* QUERY_UUID_WITH_HYPHENS
+/* PDF_PAGE_TEXT_INSERT
 
- Match against uuid string with hyphens.
+ Store the text of a page.
 
-SELECT * FROM Documents
-    WHERE uuid =
-    REPLACE('7ec63f30-5882-46ac-855d-bdcaf8f29700', '-', ''); */
+INSERT OR REPLACE INTO pdf_page_text (metadata_uuid, page, text) VALUES (%s, %s, %s); */
 
 
-/* QUERY_BACKREFS_FROM_TEXT_FILES
+/* THUMBNAIL_COLOR_FROM_TEXT_METADATA
 
- Find backreferences from plain text files.
+ Copy thumbnail colours stored as thumbnail-color text metadata of
+ documents into thumbnail_color.
 
-SELECT DISTINCT REPLACE(tok.token, '-', '') AS target,
-    texts.uuid AS referrer FROM uuidtok AS tok,
-    (SELECT uuid, data,
-    json_extract(name, '$.content_type') AS _type
-    FROM BinaryMetadata
-    WHERE json_valid(name) AND _type LIKE "%text/%")
-    AS texts
-    WHERE tok.input=texts.data AND LENGTH(tok.token) = 36
-    AND EXISTS (SELECT * FROM Documents WHERE uuid = REPLACE(tok.token, '-', '')); */
+INSERT OR IGNORE INTO thumbnail_color (metadata_uuid, color)
+SELECT
+    bhas.metadata_uuid, tm.data
+FROM
+    DocumentHasTextMetadata AS thas
+    JOIN TextMetadata AS tm ON thas.metadata_uuid = tm.uuid
+    JOIN DocumentHasBinaryMetadata AS bhas ON bhas.document_uuid = thas.document_uuid
+WHERE
+    tm.name = 'thumbnail-color'
+    AND bhas.name = 'thumbnail'; */
 
 
-/* QUERY_BACKREF_CANDIDATES
+/* JOBS_ADD_HEARTBEAT
 
+ Add the heartbeat column to job tables created before it existed.
+ https://sqlite.org/lang_altertable.html sqlite3 reference for for
+ altering tables
 
-SELECT DISTINCT token FROM uuidtok
-    WHERE input =
-    (SELECT data FROM BinaryMetadata
-    WHERE uuid = '17ee75452e574e03b0b8e4ef2bc9be25')
-    AND LENGTH(token) = 36; */
+ALTER TABLE "jobs" ADD COLUMN "heartbeat" DATETIME NULL; */
 
 
-/* QUERY_TEXT_FILES
+/* JOBS_ADD_OWNER
 
- Select text files.
+ Add the owner column to job tables created before it existed.
+ https://sqlite.org/lang_altertable.html sqlite3 reference for for
+ altering tables
 
-SELECT uuid, name, json_extract(name, '$.content_type') AS _type
-    FROM BinaryMetadata
-    WHERE json_valid(name)
-    AND _type LIKE "%text/%"; */
+ALTER TABLE "jobs" ADD COLUMN "owner" TEXT NULL; */
 
 
-/* QUERY_VALID_JSON_NAMES
+/* JOBS_DONE
 
- Search for valid JSON names.
+ Mark a claimed job as done.
+
+UPDATE jobs SET
+        state = 'done',
+        last_error = NULL,
+        finished = datetime ('now')
+    WHERE id = %s; */
+
+
+/* JOBS_ENQUEUE
+
+ Queue a job, or queue it again if it has finished. Jobs that are
+ already queued or running are left alone.
+ https://sqlite.org/lang_upsert.html sqlite3 reference for for upserts
+
+INSERT INTO jobs (kind, document_uuid) VALUES (%s, %s)
+    ON CONFLICT (kind, document_uuid) DO UPDATE SET
+        state = 'queued',
+        attempts = 0,
+        last_error = NULL,
+        not_before = datetime ('now'),
+        started = NULL,
+        finished = NULL
+    WHERE state IN ('done', 'failed'); */
+
+
+/* JOBS_FAIL
+
+ Record the error of a claimed job and queue it again after a backoff
+ in seconds, unless it has used up its attempts.
+
+UPDATE jobs SET
+        state = CASE WHEN attempts < %s THEN 'queued' ELSE 'failed' END,
+        last_error = %s,
+        not_before = datetime ('now', '+' || %s || ' seconds'),
+        finished = datetime ('now')
+    WHERE id = %s; */
+
+
+/* JOBS_HEARTBEAT
+
+ Record that an owner is still working on its running jobs.
+
+UPDATE jobs SET heartbeat = datetime ('now')
+    WHERE state = 'running' AND owner = %s; */
+
+
+/* JOBS_REQUEUE_RUNNING
+
+ Put the running jobs of an owner that were interrupted (e.g. by a
+ stop), and running jobs whose owner hasn't sent a heartbeat for a
+ number of seconds (e.g. after a restart or a crash), back in the
+ queue, without counting the interrupted attempt. Jobs of other
+ processes that are still alive are left alone.
+
+UPDATE jobs SET
+        state = 'queued',
+        attempts = max(attempts - 1, 0),
+        started = NULL,
+        owner = NULL,
+        heartbeat = NULL
+    WHERE state = 'running' AND (
+        owner = %s
+        OR heartbeat IS NULL
+        OR heartbeat < datetime ('now', '-' || %s || ' seconds')); */
+
+
+/* TRIGRAM_REBUILD_ROWS
+
+ Add the missing metadata_trigram_rows. Use this, and then
+ TRIGRAM_REBUILD, after creating the index in an existing database.
+
+INSERT OR IGNORE INTO metadata_trigram_rows (uuid)
+    SELECT uuid FROM Documents UNION ALL SELECT uuid FROM TextMetadata
+    UNION ALL SELECT uuid FROM BinaryMetadata; */
+
+
+/* DOCUMENT_SUMMARY_REBUILD
+
+ Recompute every row of document_summary. Use this after creating the
+ table in an existing database.
+
+REPLACE INTO document_summary SELECT * FROM document_summary_view; */
+
+
+/* JOBS_CLAIM
+
+ Atomically claim the next queued job of a kind for an owner. Since it
+ is a single statement, two workers can never claim the same job.
+ https://sqlite.org/lang_returning.html sqlite3 reference for for the
+ RETURNING clause
+
+UPDATE jobs SET
+        state = 'running',
+        attempts = attempts + 1,
+        started = datetime ('now'),
+        owner = %s,
+        heartbeat = datetime ('now')
+    WHERE id = (SELECT id FROM jobs
+        WHERE state = 'queued' AND kind = %s
+        AND not_before <= datetime ('now')
+        ORDER BY not_before, id LIMIT 1)
+    RETURNING id, document_uuid, attempts; */
+
+
+/* TRIGRAM_REBUILD
+
+ Rebuild the metadata_trigram_fts index from its content.
+ https://sqlite.org/fts5.html#the_rebuild_command sqlite3 reference
 
-SELECT uuid, name FROM BinaryMetadata WHERE json_valid(name); */
\ No newline at end of file
+INSERT INTO metadata_trigram_fts(metadata_trigram_fts) VALUES('rebuild'); */
\ No newline at end of file
@@ -1,16 +1,32 @@
 /* Contents
 
-id                                  | summary
-------------------------------------+-------------------------------------------------------------------------
-CREATE_DOCUMENTS                    | CREATE TABLE IF NOT EXISTS "Documents" ( "uuid" CHARACTER(32) NOT...
-CREATE_TEXTMETADATA                 | CREATE TABLE IF NOT EXISTS "TextMetadata" ( "uuid" CHARACTER(32) NOT...
-CREATE_BINARYMETADATA               | CREATE TABLE IF NOT EXISTS "BinaryMetadata" ( "uuid" CHARACTER(32)...
-CREATE_DOCUMENTHASTEXTMETADATA      | CREATE TABLE IF NOT EXISTS "DocumentHasTextMetadata" ( "id" INTEGER...
-CREATE_DOCUMENTHASBINARYMETADATA    | CREATE TABLE IF NOT EXISTS "DocumentHasBinaryMetadata" ( "id" INTEGER...
-CREATE_VIEW_DOCUMENTS_TITLE_AUTHORS | Auxiliary view for use in document_title_authors_text_view_fts index....
-FTS_CREATE_TABLE                    | Create a full-text search index using the fts5 module....
-FTS_CREATE_INSERT_TRIGGER           | Trigger to insert full text data when a DocumentHasBinaryMetadata row...
-FTS_CREATE_DELETE_TRIGGER           | Trigger to remove a document's full text from the full text search...
+id                                        | summary
+------------------------------------------+-------------------------------------------------------------------------
+CREATE_DOCUMENTS                          | CREATE TABLE IF NOT EXISTS "Documents" ( "uuid" CHARACTER(32) NOT...
+CREATE_TEXTMETADATA                       | CREATE TABLE IF NOT EXISTS "TextMetadata" ( "uuid" CHARACTER(32) NOT...
+CREATE_BINARYMETADATA                     | CREATE TABLE IF NOT EXISTS "BinaryMetadata" ( "uuid" CHARACTER(32)...
+CREATE_DOCUMENTHASTEXTMETADATA            | CREATE TABLE IF NOT EXISTS "DocumentHasTextMetadata" ( "id" INTEGER...
+CREATE_DOCUMENTHASBINARYMETADATA          | CREATE TABLE IF NOT EXISTS "DocumentHasBinaryMetadata" ( "id" INTEGER...
+CREATE_VIEW_DOCUMENTS_TITLE_AUTHORS       | Auxiliary view for use in document_title_authors_text_view_fts index....
+CREATE_INDEX_HAS_TEXT_DOCUMENT            | Index the metadata of each document. The uniqueness constraint of...
+CREATE_INDEX_HAS_TEXT_METADATA            | Index the documents of each text metadata....
+CREATE_INDEX_HAS_BINARY_DOCUMENT          | Index the binary metadata of each document....
+CREATE_INDEX_HAS_BINARY_METADATA          | Index the documents of each binary metadata....
+CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT   | Content of the document_title_authors_text_view_fts index: one row...
+FTS_CREATE_TABLE                          | Create a full-text search index using the fts5 module. It is an...
+FTS_CREATE_INSERT_TRIGGER                 | Trigger to index full text data when a DocumentHasBinaryMetadata row...
+FTS_CREATE_DELETE_TRIGGER                 | Trigger to remove a document's full text from the full text search...
+FTS_CREATE_DOCUMENT_DELETE_TRIGGER        | Trigger to remove a document's full text from the full text search...
+FTS_CREATE_METADATA_DELETE_TRIGGER        | Trigger to remove full text from the full text search index before...
+FTS_CREATE_UPDATE_BEFORE_TRIGGER          | Trigger to remove the old full text from the full text search index...
+FTS_CREATE_UPDATE_AFTER_TRIGGER           | Trigger to index the new full text after it is changed....
+FTS_CREATE_TITLE_UPDATE_TRIGGER           | Trigger to reindex a document's full text after its title is changed....
+FTS_CREATE_AUTHOR_INSERT_TRIGGER          | Trigger to reindex a document's full text after an author is added to...
+FTS_CREATE_AUTHOR_DELETE_TRIGGER          | Trigger to reindex a document's full text before an author is removed...
+FTS_CREATE_AUTHOR_UPDATE_BEFORE_TRIGGER   | Trigger to remove the full text of the documents of an author link...
+FTS_CREATE_AUTHOR_UPDATE_AFTER_TRIGGER    | Trigger to index the full text of the documents of an author link...
+FTS_CREATE_AUTHOR_METADATA_UPDATE_TRIGGER | Trigger to reindex the full text of the documents of an author after...
+FTS_CREATE_AUTHOR_METADATA_DELETE_TRIGGER | Trigger to reindex the full text of the documents of an author before...
  */
 
 /* CREATE_DOCUMENTS */
@@ -39,6 +55,7 @@ CREATE TABLE IF NOT EXISTS "BinaryMetadata" (
         "name" TEXT NULL,
         "data" BLOB NOT NULL,
         "compressed" BOOLEAN NOT NULL DEFAULT (0),
+        "sha256" CHARACTER(64) NULL,
         "created" DATETIME NOT NULL DEFAULT (strftime ('%Y-%m-%d %H:%M:%f', 'now')),
         "last_modified" DATETIME NOT NULL DEFAULT (strftime ('%Y-%m-%d %H:%M:%f', 'now')),
         CONSTRAINT uniqueness UNIQUE ("name", "data")
@@ -76,7 +93,7 @@ CREATE TABLE IF NOT EXISTS "DocumentHasBinaryMetadata" (
  authors or NULL for all documents.
  https://sqlite.org/lang_createview.html sqlite3 reference for for
  creating views */
-CREATE VIEW document_title_authors (rowid, title, authors) AS
+CREATE VIEW IF NOT EXISTS document_title_authors (rowid, title, authors) AS
 SELECT uuid, title, authors
 FROM
     Documents AS d
@@ -91,51 +108,418 @@ FROM
         GROUP BY
             document_uuid) AS authors ON d.uuid = authors.document_uuid;
 
+/* CREATE_INDEX_HAS_TEXT_DOCUMENT
+ Index the metadata of each document. The uniqueness constraint of
+ DocumentHasTextMetadata starts with name, so it can't be used to look
+ up a document's metadata. https://sqlite.org/lang_createindex.html
+ sqlite3 reference for for creating indexes */
+CREATE INDEX IF NOT EXISTS has_text_document_uuid_idx
+    ON DocumentHasTextMetadata(document_uuid);
+
+/* CREATE_INDEX_HAS_TEXT_METADATA
+ Index the documents of each text metadata.
+ https://sqlite.org/lang_createindex.html sqlite3 reference for for
+ creating indexes */
+CREATE INDEX IF NOT EXISTS has_text_metadata_uuid_idx
+    ON DocumentHasTextMetadata(metadata_uuid);
+
+/* CREATE_INDEX_HAS_BINARY_DOCUMENT
+ Index the binary metadata of each document.
+ https://sqlite.org/lang_createindex.html sqlite3 reference for for
+ creating indexes */
+CREATE INDEX IF NOT EXISTS has_binary_document_uuid_idx
+    ON DocumentHasBinaryMetadata(document_uuid);
+
+/* CREATE_INDEX_HAS_BINARY_METADATA
+ Index the documents of each binary metadata.
+ https://sqlite.org/lang_createindex.html sqlite3 reference for for
+ creating indexes */
+CREATE INDEX IF NOT EXISTS has_binary_metadata_uuid_idx
+    ON DocumentHasBinaryMetadata(metadata_uuid);
+
+/* CREATE_VIEW_DOCUMENT_TITLE_AUTHORS_TEXT
+ Content of the document_title_authors_text_view_fts index: one row per
+ full-text DocumentHasBinaryMetadata row, keyed by its id, with the
+ document's title, a NULL byte separated string with all its authors
+ and the full text. The index reads the text through this view instead
+ of storing a copy. Full text is never stored compressed; rows
+ compressed by older versions can't be read by SQL and are left out
+ until the index is built again, which decompresses them.
+ https://sqlite.org/lang_createview.html sqlite3 reference for for
+ creating views */
+CREATE VIEW IF NOT EXISTS document_title_authors_text_view (id, uuid, title, authors, full_text) AS
+SELECT
+    has.id, has.document_uuid, d.title,
+    (SELECT
+            GROUP_CONCAT (tm.data, '\0')
+        FROM
+            DocumentHasTextMetadata AS dhtm
+            JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+        WHERE
+            dhtm.document_uuid = has.document_uuid
+            AND tm.name = 'author'),
+    bm.data
+FROM
+    DocumentHasBinaryMetadata AS has
+    JOIN Documents AS d ON d.uuid = has.document_uuid
+    JOIN BinaryMetadata AS bm ON bm.uuid = has.metadata_uuid
+WHERE
+    has.name = 'full-text'
+    AND bm.name = 'full-text'
+    AND NOT bm.compressed;
+
 /* FTS_CREATE_TABLE
- Create a full-text search index using the fts5 module.
- https://sqlite.org/fts5.html sqlite3 reference */
+ Create a full-text search index using the fts5 module. It is an
+ external content table: the indexed values are read from
+ document_title_authors_text_view when needed and are not stored twice,
+ so the triggers on the underlying tables must keep it up to date. The
+ prefix indexes make queries on the first two or three characters of a
+ word, such as "bibl" * while a query is typed, index lookups.
+ https://sqlite.org/fts5.html#external_content_tables sqlite3 reference */
 CREATE VIRTUAL TABLE IF NOT EXISTS document_title_authors_text_view_fts
-    USING fts5(title, authors, full_text, uuid UNINDEXED);
+    USING fts5(title, authors, full_text, uuid UNINDEXED,
+        content='document_title_authors_text_view', content_rowid='id',
+        prefix='2 3');
 
 /* FTS_CREATE_INSERT_TRIGGER
- Trigger to insert full text data when a DocumentHasBinaryMetadata row
+ Trigger to index full text data when a DocumentHasBinaryMetadata row
  for a full-text BinaryMetadata is created.
  https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
  creating triggers */
-CREATE TRIGGER insert_full_text_trigger
+CREATE TRIGGER IF NOT EXISTS insert_full_text_trigger
     AFTER INSERT ON DocumentHasBinaryMetadata
-WHEN EXISTS (
-        SELECT
-            *
-        FROM
-            BinaryMetadata AS bm
-        WHERE
-            NEW.metadata_uuid = bm.uuid
-            AND bm.name = 'full-text')
+    WHEN NEW.name = 'full-text'
 BEGIN
     INSERT INTO document_title_authors_text_view_fts (
-        uuid, title, authors, full_text)
-SELECT
-    d.rowid AS rowid, d.title AS title,
-    d.authors AS authors, bm.data AS full_text
-FROM
-    document_title_authors AS d,
-    BinaryMetadata AS bm
-WHERE
-    d.rowid = NEW.document_uuid
-    AND bm.name = 'full-text'
-    AND bm.uuid = NEW.metadata_uuid;
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        id = NEW.id;
 END;
 
 /* FTS_CREATE_DELETE_TRIGGER
  Trigger to remove a document's full text from the full text search
- table when the full-text binary metadata is deleted.
+ index before the full-text binary metadata link is deleted, while the
+ indexed values can still be read.
+ https://sqlite.org/fts5.html#the_delete_command sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS delete_full_text_trigger
+    BEFORE DELETE ON DocumentHasBinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        id = OLD.id;
+END;
+
+/* FTS_CREATE_DOCUMENT_DELETE_TRIGGER
+ Trigger to remove a document's full text from the full text search
+ index before the document is deleted. Its links are deleted by a
+ foreign key action after the document is gone, when the indexed values
+ can no longer be read. https://sqlite.org/fts5.html#the_delete_command
+ sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS delete_document_full_text_trigger
+    BEFORE DELETE ON Documents
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = OLD.uuid;
+END;
+
+/* FTS_CREATE_METADATA_DELETE_TRIGGER
+ Trigger to remove full text from the full text search index before its
+ binary metadata is deleted, for the same reason as
+ delete_document_full_text_trigger.
+ https://sqlite.org/fts5.html#the_delete_command sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS delete_metadata_full_text_trigger
+    BEFORE DELETE ON BinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = OLD.uuid;
+END;
+
+/* FTS_CREATE_UPDATE_BEFORE_TRIGGER
+ Trigger to remove the old full text from the full text search index
+ before it is changed. https://sqlite.org/fts5.html#the_delete_command
+ sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS update_full_text_before_trigger
+    BEFORE UPDATE OF name, data, compressed ON BinaryMetadata
+    WHEN OLD.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = OLD.uuid;
+END;
+
+/* FTS_CREATE_UPDATE_AFTER_TRIGGER
+ Trigger to index the new full text after it is changed.
  https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
  creating triggers */
-CREATE TRIGGER IF NOT EXISTS delete_full_text_trigger
-       AFTER DELETE ON DocumentHasBinaryMetadata
-        WHEN OLD.name = 'full-text'
-       BEGIN
-       DELETE FROM document_title_authors_text_view_fts
-       WHERE uuid = OLD.document_uuid;
+CREATE TRIGGER IF NOT EXISTS update_full_text_after_trigger
+    AFTER UPDATE OF name, data, compressed ON BinaryMetadata
+    WHEN NEW.name = 'full-text'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title, v.authors, v.full_text
+    FROM
+        document_title_authors_text_view AS v
+        JOIN DocumentHasBinaryMetadata AS has ON has.id = v.id
+    WHERE
+        has.metadata_uuid = NEW.uuid;
+END;
+
+/* FTS_CREATE_TITLE_UPDATE_TRIGGER
+ Trigger to reindex a document's full text after its title is changed.
+ The entries are removed with the old title, so only this document's
+ entries are touched. https://sqlite.org/fts5.html#the_delete_command
+ sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS update_title_full_text_trigger
+    AFTER UPDATE OF title ON Documents
+    WHEN NEW.title IS NOT OLD.title
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, OLD.title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.uuid;
+END;
+
+/* FTS_CREATE_AUTHOR_INSERT_TRIGGER
+ Trigger to reindex a document's full text after an author is added to
+ it. The entries are removed with the authors they had without the new
+ link. It is an AFTER trigger so that an INSERT OR IGNORE of an
+ existing link changes nothing.
+ https://sqlite.org/fts5.html#the_delete_command sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS insert_author_full_text_trigger
+    AFTER INSERT ON DocumentHasTextMetadata
+    WHEN (SELECT name FROM TextMetadata WHERE uuid = NEW.metadata_uuid) = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND dhtm.id <> NEW.id),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid = NEW.document_uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = NEW.document_uuid;
+END;
+
+/* FTS_CREATE_AUTHOR_DELETE_TRIGGER
+ Trigger to reindex a document's full text before an author is removed
+ from it, with the authors it will have without the link.
+ https://sqlite.org/fts5.html#the_delete_command sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS delete_author_full_text_trigger
+    BEFORE DELETE ON DocumentHasTextMetadata
+    WHEN (SELECT name FROM TextMetadata WHERE uuid = OLD.metadata_uuid) = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid = OLD.document_uuid;
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND dhtm.id <> OLD.id),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid = OLD.document_uuid;
+END;
+
+/* FTS_CREATE_AUTHOR_UPDATE_BEFORE_TRIGGER
+ Trigger to remove the full text of the documents of an author link
+ from the full text search index before the link is moved to another
+ document or metadata. https://sqlite.org/fts5.html#the_delete_command
+ sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS update_author_full_text_before_trigger
+    BEFORE UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+    WHEN (NEW.document_uuid IS NOT OLD.document_uuid
+            OR NEW.metadata_uuid IS NOT OLD.metadata_uuid)
+        AND 'author' IN (SELECT name FROM TextMetadata
+            WHERE uuid IN (OLD.metadata_uuid, NEW.metadata_uuid))
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (OLD.document_uuid, NEW.document_uuid);
+END;
+
+/* FTS_CREATE_AUTHOR_UPDATE_AFTER_TRIGGER
+ Trigger to index the full text of the documents of an author link
+ again after the link is moved.
+ https://sqlite.org/lang_createtrigger.html sqlite3 reference for for
+ creating triggers */
+CREATE TRIGGER IF NOT EXISTS update_author_full_text_after_trigger
+    AFTER UPDATE OF document_uuid, metadata_uuid ON DocumentHasTextMetadata
+    WHEN (NEW.document_uuid IS NOT OLD.document_uuid
+            OR NEW.metadata_uuid IS NOT OLD.metadata_uuid)
+        AND 'author' IN (SELECT name FROM TextMetadata
+            WHERE uuid IN (OLD.metadata_uuid, NEW.metadata_uuid))
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (OLD.document_uuid, NEW.document_uuid);
+END;
+
+/* FTS_CREATE_AUTHOR_METADATA_UPDATE_TRIGGER
+ Trigger to reindex the full text of the documents of an author after
+ the author's name is edited, or after text metadata becomes or stops
+ being an author. The entries are removed with the old value in place
+ of the new one. https://sqlite.org/fts5.html#the_delete_command
+ sqlite3 reference */
+CREATE TRIGGER IF NOT EXISTS update_author_metadata_full_text_trigger
+    AFTER UPDATE OF name, data ON TextMetadata
+    WHEN (NEW.name IS NOT OLD.name OR NEW.data IS NOT OLD.data)
+        AND 'author' IN (OLD.name, NEW.name)
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (
+                    CASE WHEN tm.uuid = OLD.uuid THEN OLD.data ELSE tm.data END,
+                    '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND CASE WHEN tm.uuid = OLD.uuid THEN OLD.name ELSE tm.name END = 'author'),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = NEW.uuid);
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = NEW.uuid);
+END;
+
+/* FTS_CREATE_AUTHOR_METADATA_DELETE_TRIGGER
+ Trigger to reindex the full text of the documents of an author before
+ the author is deleted, with the authors they will have without it. Its
+ links are deleted by a foreign key action after the author is gone,
+ when delete_author_full_text_trigger can no longer tell they are
+ author links. https://sqlite.org/fts5.html#the_delete_command sqlite3
+ reference */
+CREATE TRIGGER IF NOT EXISTS delete_author_metadata_full_text_trigger
+    BEFORE DELETE ON TextMetadata
+    WHEN OLD.name = 'author'
+BEGIN
+    INSERT INTO document_title_authors_text_view_fts (
+        document_title_authors_text_view_fts, rowid, uuid, title, authors, full_text)
+    SELECT
+        'delete', id, uuid, title, authors, full_text
+    FROM
+        document_title_authors_text_view
+    WHERE
+        uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = OLD.uuid);
+    INSERT INTO document_title_authors_text_view_fts (
+        rowid, uuid, title, authors, full_text)
+    SELECT
+        v.id, v.uuid, v.title,
+        (SELECT
+                GROUP_CONCAT (tm.data, '\0')
+            FROM
+                DocumentHasTextMetadata AS dhtm
+                JOIN TextMetadata AS tm ON dhtm.metadata_uuid = tm.uuid
+            WHERE
+                dhtm.document_uuid = v.uuid
+                AND tm.name = 'author'
+                AND tm.uuid <> OLD.uuid),
+        v.full_text
+    FROM
+        document_title_authors_text_view AS v
+    WHERE
+        v.uuid IN (SELECT document_uuid FROM DocumentHasTextMetadata
+            WHERE metadata_uuid = OLD.uuid);
 END;
\ No newline at end of file